@@ -1,9 +1,15 @@
 import bisect
-import random
+import os.path
+from typing import Literal
 
 import numpy as np
 
 from pycode.data_class import Order
+from pycode.demand_buckets import DemandBuckets
+from pycode.episode_metrics import EpisodeMetrics
+from pycode.history_recorder import log_folder
+from pycode.order_stream import OrderArrivalEngine, generate_order_stream, get_legacy_order_stream_spec
+from pycode.utils import now_time
 
 
 def get_runtime_order_obj_list(init_order_list) -> list:
@@ -14,7 +20,25 @@ def get_runtime_order_obj_list(init_order_list) -> list:
     return sorted(rst)
 
 
+def get_due_time(order_obj: Order):
+    return order_obj.due_time
+
+
+def divide_or_nan(a, b):
+    return np.divide(a, b, out=np.full(len(a), np.nan), where=b > 0)
+
+
 class OrderSellResult:
+    __slots__ = (
+        "name",
+        "price_sell",
+        "need_to_sell_quantity",
+        "sold_quantity",
+        "sold_money",
+        "penalty_money",
+        "result_money",
+    )
+
     def __init__(
             self,
             name,
@@ -46,41 +70,302 @@ class OrderSellResult:
         )
 
 
+class OrderSellResultTable:
+    """
+    订单结算结果的列式存储，只追加。每列一个 numpy 数组，容量不够时翻倍。
+    列: product_idx, due_time(绝对时间), price_sell, need_to_sell_quantity, sold_quantity, sold_money, penalty_money
+    """
+
+    column_dtype_dict = {
+        "product_idx": np.int32,
+        "due_time": np.int64,
+        "price_sell": np.float64,
+        "need_to_sell_quantity": np.float64,
+        "sold_quantity": np.float64,
+        "sold_money": np.float64,
+        "penalty_money": np.float64,
+    }
+
+    def __init__(self, product_names, init_capacity=64):
+        self.product_names = list(product_names)
+        self.product_name_and_idx_dict = {name: i for i, name in enumerate(self.product_names)}
+        self.size = 0
+        self.capacity = init_capacity
+        self.columns = {
+            name: np.zeros(init_capacity, dtype=dtype)
+            for name, dtype in self.column_dtype_dict.items()
+        }
+
+    def __len__(self):
+        return self.size
+
+    def append(
+            self,
+            name,
+            due_time,
+            price_sell,
+            need_to_sell_quantity,
+            sold_quantity,
+            sold_money,
+            penalty_money,
+    ):
+        if self.size == self.capacity:
+            self.capacity *= 2
+            for col_name, col in self.columns.items():
+                new_col = np.zeros(self.capacity, dtype=col.dtype)
+                new_col[:self.size] = col
+                self.columns[col_name] = new_col
+
+        i = self.size
+        c = self.columns
+        c["product_idx"][i] = self.product_name_and_idx_dict[name]
+        c["due_time"][i] = due_time
+        c["price_sell"][i] = price_sell
+        c["need_to_sell_quantity"][i] = need_to_sell_quantity
+        c["sold_quantity"][i] = sold_quantity
+        c["sold_money"][i] = sold_money
+        c["penalty_money"][i] = penalty_money
+        self.size += 1
+
+    def get_column(self, name):
+        return self.columns[name][:self.size]
+
+    def get_result_money(self):
+        return self.get_column("sold_money") - self.get_column("penalty_money")
+
+    def get_fill_rate_by_product(self):
+        """每个产品 已售数量 / 订单需求数量，没有订单的产品为 nan"""
+        n = len(self.product_names)
+        product_idx = self.get_column("product_idx")
+        sold = np.bincount(product_idx, weights=self.get_column("sold_quantity"), minlength=n)
+        need = np.bincount(product_idx, weights=self.get_column("need_to_sell_quantity"), minlength=n)
+        return dict(zip(self.product_names, divide_or_nan(sold, need)))
+
+    def get_fill_rate_by_time_window(self, window):
+        """按到期时间分桶，第 i 个值对应 [i * window, (i + 1) * window)"""
+        bucket = self.get_column("due_time") // window
+        if not len(bucket):
+            return np.zeros(0)
+        sold = np.bincount(bucket, weights=self.get_column("sold_quantity"))
+        need = np.bincount(bucket, weights=self.get_column("need_to_sell_quantity"))
+        return divide_or_nan(sold, need)
+
+    def get_result_obj(self, i) -> OrderSellResult:
+        c = self.columns
+        sold_money = c["sold_money"][i]
+        penalty_money = c["penalty_money"][i]
+        return OrderSellResult(
+            name=self.product_names[c["product_idx"][i]],
+            price_sell=c["price_sell"][i],
+            need_to_sell_quantity=c["need_to_sell_quantity"][i],
+            sold_quantity=c["sold_quantity"][i],
+            sold_money=sold_money,
+            penalty_money=penalty_money,
+            result_money=sold_money - penalty_money,
+        )
+
+    def save_to_npz(self):
+        f_name = os.path.join(log_folder, f"{now_time()}-order_result.npz")
+        np.savez(
+            f_name,
+            product_names=np.array(self.product_names),
+            **{name: self.get_column(name) for name in self.columns},
+        )
+        return f_name
+
+
 class OrderSellResultManagerRuntime:
+    """
+    订单结算结果。逐订单明细存进列式的 OrderSellResultTable，同时按产品累计到 EpisodeMetrics。
+    单步金额在 append 时累加，calcu_step_money 为 O(1)。
+    """
+
     def __init__(
             self,
+            product_names,
     ):
-        self.step_result = []
-        self.total_result = []
+        self.result_table = OrderSellResultTable(product_names)
+        self.episode_metrics = EpisodeMetrics(product_names)
+        self.step_money = 0.0
 
     def calcu_step_money(self):
-        rst = 0
-        for stock_sell_result in self.step_result:
-            rst += stock_sell_result.result_money
-        return rst
+        return self.step_money
 
     def finish_step(self):
-        self.total_result.extend(self.step_result)
-        self.step_result.clear()
+        self.step_money = 0.0
+
+    def append(
+            self,
+            name,
+            due_time,
+            price_sell,
+            need_to_sell_quantity,
+            sold_quantity,
+            sold_money,
+            penalty_money,
+    ):
+        self.result_table.append(
+            name=name,
+            due_time=due_time,
+            price_sell=price_sell,
+            need_to_sell_quantity=need_to_sell_quantity,
+            sold_quantity=sold_quantity,
+            sold_money=sold_money,
+            penalty_money=penalty_money,
+        )
+        self.episode_metrics.update(
+            name=name,
+            need_to_sell_quantity=need_to_sell_quantity,
+            sold_quantity=sold_quantity,
+            sold_money=sold_money,
+            penalty_money=penalty_money,
+        )
+        self.step_money += sold_money - penalty_money
+
+    def get_recent_results(self, n) -> list[OrderSellResult]:
+        """按需把最近 n 条结果还原成 OrderSellResult 对象，便于打印查看"""
+        size = len(self.result_table)
+        return [self.result_table.get_result_obj(i) for i in range(max(0, size - n), size)]
+
 
-    def append(self, stock_sell_result: OrderSellResult):
-        self.step_result.append(stock_sell_result)
+class VisibleOrderIndex:
+    """
+    按某个排序键维护全部未结订单的有序索引，前K个就是可见窗口。
+    订单到达、结算时增量维护，取窗口只需 O(K)。
+    """
+
+    def __init__(self, sort_key_fn):
+        self.sort_key_fn = sort_key_fn
+        # [(key, seq, order), ...]，seq 保证元组比较不会落到 order 上
+        self.sorted_entries = []
+        # id(order) -> sorted_entries 里的同一个元组，不另建 key 元组
+        self.order_id_and_entry_dict = {}
+        self.seq = 0
+
+    def add(self, order_obj: Order):
+        entry = (self.sort_key_fn(order_obj), self.seq, order_obj)
+        self.seq += 1
+        bisect.insort(self.sorted_entries, entry)
+        self.order_id_and_entry_dict[id(order_obj)] = entry
+
+    def remove(self, order_obj: Order):
+        entry = self.order_id_and_entry_dict.pop(id(order_obj))
+        idx = bisect.bisect_left(self.sorted_entries, entry[:2])
+        del self.sorted_entries[idx]
+
+    def get_top_k(self, k) -> list[Order]:
+        return [entry[-1] for entry in self.sorted_entries[:k]]
 
 
 class OrderManagerRuntime:
-    def __init__(self, init_order_list: list, manual_simulation_steps):
-        self.runtime_order_obj_list = get_runtime_order_obj_list(init_order_list)
-        # TODO
-        self.tst_random_add_order(manual_simulation_steps=manual_simulation_steps)
+    """
+    订单内部存绝对到期时间（Order.due_time），每步只推进 self.elapsed，剩余时间 = due_time - elapsed。
+    订单来源：init_order_list 在 0 时刻入队；随机订单由 order_stream.generate_order_stream 整批生成，
+    推进时钟时经 OrderArrivalEngine 按到达时刻放进订单簿。
+    order_stream_spec: 订单流配置，见 order_stream.py；None 表示原先的 random_order_num 个订单全部在 0 时刻到达
+    random_order_num / order_seed: 随机订单的数量与随机种子，None 表示不固定种子
+    可见窗口排序:
+    · "earliest_due": 直接取按到期时间排序的订单列表前K个
+    · "highest_value": 按 quantity * price_sell 从高到低，单独维护一个 VisibleOrderIndex
+    demand_bucket_horizons: 不为 None 时，另外按产品、按剩余时间分桶累计需求量（DemandBuckets），
+    只统计 demand_product_names 里的产品，给定长观测用
+    订单簿每次有订单进出 book_version 加 1；可见窗口的观测数组按 book_version 缓存，
+    订单簿没变的步只用 到期时间 - elapsed 重算剩余时间
+    """
+
+    def __init__(
+            self,
+            init_order_list: list,
+            manual_simulation_steps,
+            visible_order_sort: Literal["earliest_due", "highest_value"] = "earliest_due",
+            price_sell_dict: dict | None = None,
+            random_order_num=50,
+            order_seed=None,
+            order_stream_spec: dict | None = None,
+            demand_product_names: list | None = None,
+            demand_bucket_horizons: list | None = None,
+    ):
+        self.elapsed = 0
+        self.visible_order_sort = visible_order_sort
+        if visible_order_sort == "highest_value":
+            assert price_sell_dict is not None
+            self.visible_order_index = VisibleOrderIndex(
+                sort_key_fn=lambda o: -o.quantity * price_sell_dict[o.name]
+            )
+        else:
+            self.visible_order_index = None
+        if demand_bucket_horizons is not None:
+            assert demand_product_names is not None
+            self.demand_buckets = DemandBuckets(demand_product_names, demand_bucket_horizons)
+        else:
+            self.demand_buckets = None
+
+        self.book_version = 0
+        # (book_version, k) -> 可见窗口的 (产品编号, 数量, 绝对到期时间, 订单数)
+        self.visible_window_obs_key = None
+        self.visible_window_obs = None
+
+        self.runtime_order_obj_list = []
+        for o in get_runtime_order_obj_list(init_order_list):
+            self.add_order_obj(o)
+        if order_stream_spec is None:
+            order_stream_spec = get_legacy_order_stream_spec(manual_simulation_steps, random_order_num)
+        self.arrival_engine = OrderArrivalEngine(
+            generate_order_stream(order_stream_spec, horizon=manual_simulation_steps, seed=order_seed)
+        )
+        self.release_arrived_orders()
 
     def add_order_obj(self, order_obj: Order):
+        """传入订单的 due_time 是相对当前时刻的剩余时间，入队时转为绝对时间"""
+        order_obj.due_time += self.elapsed
         bisect.insort(self.runtime_order_obj_list, order_obj)
+        self.book_version += 1
+        if self.visible_order_index is not None:
+            self.visible_order_index.add(order_obj)
+        if self.demand_buckets is not None:
+            self.demand_buckets.add(order_obj.name, order_obj.quantity, order_obj.due_time)
+
+    def add_arrived_order_objs(self, order_obj_list: list[Order]):
+        """一批 due_time 已是绝对时间的订单入队。批量时追加后稳定排序，与逐个 insort 的结果相同"""
+        lst = self.runtime_order_obj_list
+        if len(order_obj_list) < 16:
+            for o in order_obj_list:
+                bisect.insort(lst, o)
+        else:
+            lst.extend(order_obj_list)
+            lst.sort(key=get_due_time)
+        self.book_version += 1
+        if self.visible_order_index is not None:
+            for o in order_obj_list:
+                self.visible_order_index.add(o)
+        if self.demand_buckets is not None:
+            for o in order_obj_list:
+                self.demand_buckets.add(o.name, o.quantity, o.due_time)
+
+    def release_arrived_orders(self):
+        """把到达时刻 <= elapsed 的订单放进订单簿"""
+        rows = self.arrival_engine.release_until(self.elapsed)
+        if not rows:
+            return
+        names = self.arrival_engine.stream.product_names
+        self.add_arrived_order_objs([
+            Order(name=names[i], quantity=q, due_time=d) for i, q, d in rows
+        ])
+
+    def get_remaining_arrival_time(self):
+        """距下一个订单到达的步数，没有待到达订单时为 None"""
+        t = self.arrival_engine.get_next_arrival_time()
+        return None if t is None else t - self.elapsed
+
+    def get_remaining_due_time(self, order_obj: Order):
+        return order_obj.due_time - self.elapsed
 
     def __getitem__(self, idx):
         return self.runtime_order_obj_list[idx]
 
     def __setitem__(self, idx, order_obj):
         self.runtime_order_obj_list[idx] = order_obj
+        self.book_version += 1
 
     def __len__(self):
         return len(self.runtime_order_obj_list)
@@ -88,58 +373,88 @@ class OrderManagerRuntime:
     def get_raw_list(self):
         return self.runtime_order_obj_list
 
-    def tick_due_time(self):
+    def tick_due_time(self, n=1):
         # TODO self.dt 时间步大于1的支持, 后期实现，应该用不到
-        for o in self.get_raw_list():
-            o: Order
-            o.due_time -= 1
+        self.elapsed += n
+        if self.demand_buckets is not None:
+            self.demand_buckets.advance_to(self.elapsed)
+        self.release_arrived_orders()
 
     def pop_due_orders(self) -> list[Order]:
         """在tick_due_time之后，检查哪些订单到期要交付了，把它们从订单等待队列里弹出"""
-        due_orders = []
-        while self.get_raw_list():
-            o: Order = self[0]
-            if o.due_time <= 0:
-                due_orders.append(
-                    self.get_raw_list().pop(0)
-                )
-            else:
-                break
+        lst = self.get_raw_list()
+        if not lst or lst[0].due_time > self.elapsed:
+            return []
+        n_due = bisect.bisect_right(lst, self.elapsed, key=get_due_time)
+        due_orders = lst[:n_due]
+        del lst[:n_due]
+        self.book_version += 1
+        if self.visible_order_index is not None:
+            for o in due_orders:
+                self.visible_order_index.remove(o)
+        if self.demand_buckets is not None:
+            for o in due_orders:
+                self.demand_buckets.remove_due(o.name, o.quantity)
         return due_orders
 
-    def tst_random_add_order(self, manual_simulation_steps):
-        rng = np.random.default_rng()
-
-        quantity = rng.random(50)
-        due_time = rng.random(50)
-
-        quantity *= 10
-        quantity += 1
-        quantity = quantity.astype(int)
+    def get_env_status(self):
+        rst = {
+            "order_name": [],
+            "order_quantity": [],
+            "order_due_time": [],
+        }
 
-        due_time *= manual_simulation_steps
-        due_time = due_time.astype(int)
+        for o in self.get_raw_list():
+            o: Order
+            rst["order_name"].append(o.name)
+            rst["order_quantity"].append(o.quantity)
+            rst["order_due_time"].append(self.get_remaining_due_time(o))
+        return rst
 
-        names = ["Motor", "Frame"]
-        for q, d in zip(quantity, due_time):
-            n = random.choice(names)
-            o = Order(name=n, quantity=q, due_time=d)
-            self.add_order_obj(o)
+    def get_visible_orders(self, k) -> list[Order]:
+        if self.visible_order_index is not None:
+            return self.visible_order_index.get_top_k(k)
+        return self.get_raw_list()[:k]
 
-    def get_env_status(self):
+    def get_visible_window_env_status(self, k):
+        """同 get_env_status，但只取可见窗口内的前 k 个订单，代价 O(k)，与总订单数无关"""
         rst = {
             "order_name": [],
             "order_quantity": [],
             "order_due_time": [],
         }
 
-        for o in self.get_raw_list():
+        for o in self.get_visible_orders(k):
             o: Order
             rst["order_name"].append(o.name)
             rst["order_quantity"].append(o.quantity)
-            rst["order_due_time"].append(o.due_time)
+            rst["order_due_time"].append(self.get_remaining_due_time(o))
         return rst
 
+    def get_visible_window_obs(self, k, name_and_idx_dict):
+        """
+        可见窗口的观测数组 (order_name int64, order_quantity float32, order_due_time float32)，长度补齐到 k：
+        产品按 name_and_idx_dict 编号，空位为 name_and_idx_dict[None]、数量 0、剩余时间 -1。
+        订单簿没变时不重新取窗口
+        """
+        key = (self.book_version, k)
+        if self.visible_window_obs_key != key:
+            order_list = self.get_visible_orders(k)
+            n = len(order_list)
+            name_idx = np.full(k, name_and_idx_dict[None], dtype=np.int64)
+            quantity = np.zeros(k, dtype=np.float32)
+            due_time = np.zeros(n, dtype=np.float64)
+            for i, o in enumerate(order_list):
+                name_idx[i] = name_and_idx_dict[o.name]
+                quantity[i] = o.quantity
+                due_time[i] = o.due_time
+            self.visible_window_obs = (name_idx, quantity, due_time, n)
+            self.visible_window_obs_key = key
+        name_idx, quantity, due_time, n = self.visible_window_obs
+        remaining_due_time = np.full(k, -1, dtype=np.float32)
+        remaining_due_time[:n] = due_time - self.elapsed
+        return name_idx.copy(), quantity.copy(), remaining_due_time
+
 
 if __name__ == '__main__':
     pass
@@ -1,6 +1,8 @@
 from black.trans import defaultdict
 
-from pycode.OrderManagerRuntime import OrderManagerRuntime, OrderSellResult, OrderSellResultManagerRuntime
+import numpy as np
+
+from pycode.OrderManagerRuntime import OrderManagerRuntime, OrderSellResultManagerRuntime
 from pycode.StockManagerRuntime import StockManagerRuntime
 from pycode.data_class import Price, Order
 
@@ -11,7 +13,13 @@ class PriceManagerRuntime:
             name: Price(**price_dict)
             for name, price_dict in init_price_name_and_spec_dict.items()
         }
-        self.order_sell_result_mng = OrderSellResultManagerRuntime()
+        self.order_sell_result_mng = OrderSellResultManagerRuntime(
+            product_names=self.runtime_price_name_and_obj_dict.keys(),
+        )
+        # 价格一个 episode 内通常不变：改价时版本号加 1，观测数组只在版本号变了之后重建
+        self.version = 0
+        self.price_obs_version = None
+        self.price_obs = None
 
     def get_obj_by_name(self, name):
         return self.runtime_price_name_and_obj_dict[name]
@@ -27,9 +35,15 @@ class PriceManagerRuntime:
 
     def set_price_sell(self, name, price_sell):
         self.get_obj_by_name(name).price_sell = price_sell
+        self.version += 1
 
     def set_price_buy(self, name, price_buy):
         self.get_obj_by_name(name).price_buy = price_buy
+        self.version += 1
+
+    def mark_dirty(self):
+        """绕过 set_price_* 直接改了价格（如读档）之后调用"""
+        self.version += 1
 
     def get_storage_cost_per_time_unit(self, name):
         return self.get_obj_by_name(name).storage_cost_per_time_unit
@@ -66,7 +80,8 @@ class PriceManagerRuntime:
                 name,
                 need_to_sell_quantity,
             )
-            sold_money = self.get_price_sell(name) * sold_quantity
+            price_sell = self.get_price_sell(name)
+            sold_money = price_sell * sold_quantity
 
             penalty_money = 0
             if sold_quantity < need_to_sell_quantity:
@@ -75,18 +90,15 @@ class PriceManagerRuntime:
                     name=name,
                     quantity_diff=quantity_diff
                 )
-            total_money = sold_money - penalty_money
 
             self.order_sell_result_mng.append(
-                OrderSellResult(
-                    name=name,
-                    price_sell=sold_quantity,
-                    need_to_sell_quantity=need_to_sell_quantity,
-                    sold_quantity=sold_quantity,
-                    sold_money=sold_money,
-                    penalty_money=penalty_money,
-                    result_money=total_money,
-                )
+                name=name,
+                due_time=o.due_time,
+                price_sell=price_sell,
+                need_to_sell_quantity=need_to_sell_quantity,
+                sold_quantity=sold_quantity,
+                sold_money=sold_money,
+                penalty_money=penalty_money,
             )
         money = self.order_sell_result_mng.calcu_step_money()
         self.order_sell_result_mng.finish_step()
@@ -109,6 +121,17 @@ class PriceManagerRuntime:
 
         return rst
 
+    def get_price_obs(self):
+        """(price_sell, price_storage_cost_per_time_unit)，float32，价格没变时不重建，返回副本"""
+        if self.price_obs_version != self.version:
+            objs = self.get_objs()
+            self.price_obs = (
+                np.array([o.price_sell for o in objs], dtype=np.float32),
+                np.array([o.storage_cost_per_time_unit for o in objs], dtype=np.float32),
+            )
+            self.price_obs_version = self.version
+        return tuple(arr.copy() for arr in self.price_obs)
+
 
 def calcu_sell_penalty_money(name, quantity_diff):
     """违约惩罚算法"""
@@ -21,6 +21,9 @@ class Scheduler:
             dev_category_and_rcp_name_dict=dev_category_and_rcp_name_dict
         )
 
+        # 上次取走之后被换了绑定配方的设备，供模拟器重新检查缺料挂起的设备
+        self.rebound_dev_id_list = []
+
         self.tst_cnt = 0
 
     def get_schedule_choice_list_by_category(self, cat):
@@ -59,11 +62,17 @@ class Scheduler:
 
             # 切到新plan，但不修改设备运行状态，由之后的tick()做
             # 因为是否能实际运行该配方，还取决于需求的材料是否有足够库存，这一点将由tick()检查
-            dev_rt.bind_recipe = recipe_name_and_obj_dict[
-                dev_schedule
-            ]  # 修改dev runtime的recipe属性
+            new_recipe = recipe_name_and_obj_dict[dev_schedule]
+            if dev_rt.bind_recipe is not new_recipe:
+                dev_rt.bind_recipe = new_recipe  # 修改dev runtime的recipe属性
+                self.rebound_dev_id_list.append(dev_id)
             self.runtime_bind_of_device_id_and_rcp_name_dict[dev_id] = dev_schedule
 
+    def pop_rebound_dev_ids(self):
+        rst = self.rebound_dev_id_list
+        self.rebound_dev_id_list = []
+        return rst
+
     def change_schedule_plan(self, schedule_plan):
         self.schedule_plan = schedule_plan
 
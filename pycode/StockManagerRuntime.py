@@ -1,25 +1,66 @@
 from collections import defaultdict
 
+import numpy as np
+
 from pycode.data_class import MaterialStock
 
 
 class StockManagerRuntime:
+    """
+    库存的增减都经过 add_stock / remove_stock / try_remove_stock，顺带记下变过的材料（脏标记）和版本号，
+    观测用 get_quantity_obs() 只重算上次取观测以来变过的材料
+    """
+
     def __init__(self, init_stock_name_and_spec_dict):
         # 字典，材料名 -> 材料obj
         self.runtime_stock_name_and_obj_dict = {
             mtrl_name: MaterialStock(**mtrl_dict)
             for mtrl_name, mtrl_dict in init_stock_name_and_spec_dict.items()
         }
+        self.stock_obj_list = list(self.runtime_stock_name_and_obj_dict.values())
+        self.stock_name_and_idx_dict = {name: i for i, name in enumerate(self.runtime_stock_name_and_obj_dict)}
+
+        # 库存每变一次加 1
+        self.version = 0
+        # 上次取观测以来变过的材料编号，初始为全部
+        self.dirty_idx_set = set(range(len(self.stock_obj_list)))
+        self.quantity_obs = np.zeros(len(self.stock_obj_list), dtype=np.float32)
+        # 上次 pop_changed_idx_set() 以来变过的材料编号，给 DecisionEventWatcher 用，与观测的 dirty_idx_set 各清各的
+        self.changed_idx_set = set()
 
     def get_obj_by_name(self, name):
         return self.runtime_stock_name_and_obj_dict[name]
 
+    def mark_dirty(self, name):
+        idx = self.stock_name_and_idx_dict[name]
+        self.dirty_idx_set.add(idx)
+        self.changed_idx_set.add(idx)
+        self.version += 1
+
+    def mark_all_dirty(self):
+        """绕过上面几个方法直接改了库存（如读档）之后调用"""
+        self.dirty_idx_set.update(range(len(self.stock_obj_list)))
+        self.changed_idx_set.update(range(len(self.stock_obj_list)))
+        self.version += 1
+
+    def pop_changed_idx_set(self) -> set:
+        rst = self.changed_idx_set
+        self.changed_idx_set = set()
+        return rst
+
     def add_stock(self, name: str, qty: float):
         self.get_obj_by_name(name).quantity += qty
+        self.mark_dirty(name)
+
+    def remove_stock(self, name: str, qty: float):
+        """调用方已确认库存够"""
+        self.get_obj_by_name(name).quantity -= qty
+        self.mark_dirty(name)
 
     def try_remove_stock(self, name, qty):
         """返回实际卖了多少量"""
         stock_obj = self.get_obj_by_name(name)
+        self.mark_dirty(name)
         if stock_obj.quantity < qty:
             removed_stock_qty = stock_obj.quantity
             stock_obj.quantity = 0
@@ -44,3 +85,11 @@ class StockManagerRuntime:
             rst["stock_quantity"].append(obj.quantity)
 
         return rst
+
+    def get_quantity_obs(self):
+        """按材料顺序的库存数量，float32；只重算变过的材料，返回副本"""
+        if self.dirty_idx_set:
+            for i in self.dirty_idx_set:
+                self.quantity_obs[i] = self.stock_obj_list[i].quantity
+            self.dirty_idx_set.clear()
+        return self.quantity_obs.copy()
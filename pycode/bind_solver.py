@@ -0,0 +1,383 @@
+"""
+初始绑定求解：给定配方表、设备清单和价格，求使稳态利润率最大的 设备 -> 配方 绑定，写成绑定 yaml，
+可直接给 FactoryEnv / FactorySim / greedy_schedule 用（或 sweep_runner 的 bind_yaml）。
+
+模型（流量 LP 松弛）：
+· 库存全厂共用，设备拓扑不影响物料流，所以同类设备可互换，变量是每个配方分到的设备数 x_r（可为小数）
+· 一台设备连续做配方 r，每秒完成 1 / cycle_time 批
+· 物料平衡：每种材料 消耗速率 - 产出速率 <= 初始库存 / (horizon * dt)，即初始库存在 horizon 步内摊着用
+· 每类设备: Σ x_r <= 该类设备数
+· 目标: Σ x_r * (每秒 Σ 售价 × 净产出 - 每秒能耗电费)，租金是固定成本不影响最优解
+再取整：先向上取整，超出设备数的类别逐台拿掉损失最小的，剩余设备按 LP 比例分；
+然后在同类配方间逐台挪设备做局部搜索，直到挪哪一台都不再变好。
+整数绑定的稳态利润率 = 按取整后的台数重解 LP（每个配方 x_r <= 台数）。
+给了原绑定时，另从原绑定的台数出发做同样的局部搜索，利润打平时取这一个，原绑定已是最优就一台不改；
+分配到具体设备时，尽量保留原绑定，减少改动。
+
+用法: python -m pycode.bind_solver [--horizon 5000] [--out ../spec_yaml/init_bind_solved.yaml] [--scale 1]
+"""
+import argparse
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class FlowModel:
+    recipe_names: list
+    recipe_categories: list
+    material_names: list
+    # [配方, 材料]，一台设备每秒的净产出（产出 - 消耗）
+    net_rate: np.ndarray
+    # [配方]，一台设备每秒的利润
+    profit_rate: np.ndarray
+    # [材料]，每秒可用的外部供给（初始库存摊到 horizon 上）
+    supply_rate: np.ndarray
+    # [材料]
+    price_sell: np.ndarray
+
+
+def build_flow_model(recipe_name_and_spec_dict, init_stock_name_and_spec_dict, init_price_name_and_spec_dict,
+                     horizon, dt=1) -> FlowModel:
+    recipe_names = list(recipe_name_and_spec_dict)
+    material_names = list(init_stock_name_and_spec_dict)
+    for spec in recipe_name_and_spec_dict.values():
+        for m in [*spec["inputs"], *spec["outputs"]]:
+            if m not in material_names:
+                material_names.append(m)
+    material_idx_dict = {m: i for i, m in enumerate(material_names)}
+
+    price_sell = np.array([
+        (init_price_name_and_spec_dict.get(m, {}).get("price_sell") or 0) for m in material_names
+    ], dtype=np.float64)
+    energy_price = init_price_name_and_spec_dict.get("energy", {}).get("price_buy") or 0
+
+    net_rate = np.zeros((len(recipe_names), len(material_names)))
+    energy_rate = np.zeros(len(recipe_names))
+    for r, spec in enumerate(recipe_name_and_spec_dict.values()):
+        for m, q in spec["outputs"].items():
+            net_rate[r, material_idx_dict[m]] += q / spec["cycle_time"]
+        for m, q in spec["inputs"].items():
+            net_rate[r, material_idx_dict[m]] -= q / spec["cycle_time"]
+        energy_rate[r] = spec["power_kw"] / 3600
+
+    supply_rate = np.array([
+        init_stock_name_and_spec_dict[m]["quantity"] / (horizon * dt) if m in init_stock_name_and_spec_dict else 0.0
+        for m in material_names
+    ])
+    return FlowModel(
+        recipe_names=recipe_names,
+        recipe_categories=[spec["device_category"] for spec in recipe_name_and_spec_dict.values()],
+        material_names=material_names,
+        net_rate=net_rate,
+        profit_rate=net_rate @ price_sell - energy_rate * energy_price,
+        supply_rate=supply_rate,
+        price_sell=price_sell,
+    )
+
+
+def solve_lp_max(c, A, b, eps=1e-9, max_iter=100_000, return_dual=False):
+    """
+    稠密单纯形，max c·x  s.t. A x <= b, x >= 0，要求 b >= 0（原点可行，不需要第一阶段）。
+    用 Bland 规则选主元，不会循环。返回 (x, 目标值)；return_dual 时另返回每行约束的对偶价（影子价格）
+    """
+    m, n = A.shape
+    assert (b >= 0).all()
+    tableau = np.zeros((m + 1, n + m + 1))
+    tableau[:m, :n] = A
+    tableau[:m, n:n + m] = np.eye(m)
+    tableau[:m, -1] = b
+    tableau[m, :n] = -c
+    basis = np.arange(n, n + m)
+    for _ in range(max_iter):
+        entering_list = np.flatnonzero(tableau[m, :-1] < -eps)
+        if not len(entering_list):
+            break
+        col = entering_list[0]
+        column = tableau[:m, col]
+        positive = column > eps
+        if not positive.any():
+            raise ValueError("LP 无界")
+        ratio = np.full(m, np.inf)
+        ratio[positive] = tableau[:m, -1][positive] / column[positive]
+        min_ratio = ratio.min()
+        # 比值相同的行里取基变量编号最小的（Bland）
+        tie = np.flatnonzero(ratio <= min_ratio + eps)
+        row = tie[np.argmin(basis[tie])]
+        pivot_row = tableau[row] / tableau[row, col]
+        tableau -= np.outer(tableau[:, col], pivot_row)
+        tableau[row] = pivot_row
+        basis[row] = col
+    else:
+        raise RuntimeError("单纯形迭代次数超限")
+    x = np.zeros(n)
+    is_structural = basis < n
+    x[basis[is_structural]] = tableau[:m, -1][is_structural]
+    if return_dual:
+        return x, tableau[m, -1], tableau[m, n:n + m].copy()
+    return x, tableau[m, -1]
+
+
+def solve_device_rates(model: FlowModel, category_and_dev_num_dict, recipe_cap=None, return_dual=False):
+    """
+    LP 松弛：每个配方分到多少台设备（小数）。recipe_cap 给定时另加 x_r <= recipe_cap[r]。
+    返回 (x, 每秒利润)；return_dual 时另返回对偶价，前 len(material_names) 个是各材料的影子价格
+    """
+    n_recipe = len(model.recipe_names)
+    category_list = list(category_and_dev_num_dict)
+    category_rows = np.zeros((len(category_list), n_recipe))
+    for r, category in enumerate(model.recipe_categories):
+        if category in category_and_dev_num_dict:
+            category_rows[category_list.index(category), r] = 1
+    # 没有设备的类别，其配方只能为 0
+    no_dev_rows = np.eye(n_recipe)[[
+        r for r, category in enumerate(model.recipe_categories) if category not in category_and_dev_num_dict
+    ]].reshape(-1, n_recipe)
+
+    row_list = [-model.net_rate.T, category_rows, no_dev_rows]
+    b_list = [model.supply_rate, np.array([category_and_dev_num_dict[c] for c in category_list], dtype=np.float64),
+              np.zeros(len(no_dev_rows))]
+    if recipe_cap is not None:
+        row_list.append(np.eye(n_recipe))
+        b_list.append(np.asarray(recipe_cap, dtype=np.float64))
+    return solve_lp_max(model.profit_rate, np.vstack(row_list), np.concatenate(b_list), return_dual=return_dual)
+
+
+def round_device_counts(model: FlowModel, x, category_and_dev_num_dict) -> np.ndarray:
+    """把 LP 的小数台数取整，每类总台数等于该类设备数"""
+    counts = np.ceil(x - 1e-6).astype(np.int64)
+    for category, n_dev in category_and_dev_num_dict.items():
+        idx = np.array([r for r, c in enumerate(model.recipe_categories) if c == category], dtype=np.int64)
+        if not len(idx):
+            continue
+        # 向上取整后超出的，逐台拿掉使整数 LP 利润损失最小的那个配方
+        while counts[idx].sum() > n_dev:
+            best_r, best_profit = None, -np.inf
+            for r in idx:
+                if counts[r] == 0:
+                    continue
+                counts[r] -= 1
+                _, profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=counts)
+                counts[r] += 1
+                if profit > best_profit:
+                    best_r, best_profit = r, profit
+            counts[best_r] -= 1
+        # 剩余设备按 LP 台数比例分（最大余数法），多出的产能让瓶颈有余量
+        spare = n_dev - counts[idx].sum()
+        if spare > 0 and x[idx].sum() > 1e-9:
+            share = x[idx] / x[idx].sum() * spare
+            add = np.floor(share).astype(np.int64)
+            order = np.argsort(-(share - add), kind="stable")
+            add[order[:spare - add.sum()]] += 1
+            counts[idx] += add
+    return improve_device_counts(model, counts, category_and_dev_num_dict)
+
+
+def improve_device_counts(model: FlowModel, counts, category_and_dev_num_dict, max_round=200) -> np.ndarray:
+    """
+    局部搜索：同类设备从一个配方挪一台到另一个配方，取利润提升最大的一步；
+    单步都不提升时再试两步组合（如 PlateAssemble + FrameFinal 一起换成 RotorAssemble + StatorAssemble），
+    直到都没有提升
+    """
+    counts = counts.copy()
+    _, profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=counts)
+    move_list = []
+    for category in category_and_dev_num_dict:
+        idx = [r for r, c in enumerate(model.recipe_categories) if c == category]
+        move_list.extend((src, dst) for src in idx for dst in idx if src != dst)
+
+    def try_moves(moves):
+        for src, dst in moves:
+            counts[src] -= 1
+            counts[dst] += 1
+        if (counts < 0).any():
+            new_profit = -np.inf
+        else:
+            _, new_profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=counts)
+        for src, dst in moves:
+            counts[src] += 1
+            counts[dst] -= 1
+        return new_profit
+
+    for _ in range(max_round):
+        best_moves, best_profit = None, profit + 1e-9
+        for move in move_list:
+            new_profit = try_moves([move])
+            if new_profit > best_profit:
+                best_moves, best_profit = [move], new_profit
+        if best_moves is None:
+            for i, move in enumerate(move_list):
+                for move_2 in move_list[i:]:
+                    new_profit = try_moves([move, move_2])
+                    if new_profit > best_profit:
+                        best_moves, best_profit = [move, move_2], new_profit
+        if best_moves is None:
+            break
+        for src, dst in best_moves:
+            counts[src] -= 1
+            counts[dst] += 1
+        profit = best_profit
+    return counts
+
+
+def solve_device_counts(model: FlowModel, x, category_and_dev_num_dict, prev_counts=None) -> np.ndarray:
+    """
+    LP 取整加局部搜索；给了原绑定的台数 prev_counts 时，另从它出发做局部搜索，
+    只有取整的结果利润严格更高才用取整的，否则保留从原绑定出发的，减少改动
+    """
+    counts = round_device_counts(model, x, category_and_dev_num_dict)
+    if prev_counts is None:
+        return counts
+    near_counts = improve_device_counts(model, prev_counts, category_and_dev_num_dict)
+    _, profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=counts)
+    _, near_profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=near_counts)
+    return counts if profit > near_profit + 1e-9 else near_counts
+
+
+def assign_devices(device_id_and_spec_dict, model: FlowModel, counts, prev_bind_dict=None) -> dict:
+    """
+    按台数把配方分给具体设备：原绑定配方还有名额的设备保留原绑定，其余按配方顺序依次填；
+    名额分完还剩的设备（该类 LP 没用上的）保留原绑定，没有原绑定则绑该类第一个配方。
+    """
+    prev_bind_dict = prev_bind_dict or {}
+    left = dict(zip(model.recipe_names, counts.tolist()))
+    category_and_recipe_list_dict = defaultdict(list)
+    for name, category in zip(model.recipe_names, model.recipe_categories):
+        category_and_recipe_list_dict[category].append(name)
+
+    rst = {}
+    for dev_id, spec in device_id_and_spec_dict.items():
+        prev = prev_bind_dict.get(dev_id)
+        if prev is not None and left.get(prev, 0) > 0:
+            rst[dev_id] = prev
+            left[prev] -= 1
+    for dev_id, spec in device_id_and_spec_dict.items():
+        if dev_id in rst:
+            continue
+        recipe_list = category_and_recipe_list_dict[spec["category"]]
+        rcp_name = next((name for name in recipe_list if left[name] > 0), None)
+        if rcp_name is None:
+            rcp_name = prev_bind_dict.get(dev_id) or recipe_list[0]
+        else:
+            left[rcp_name] -= 1
+        rst[dev_id] = rcp_name
+    return {dev_id: rst[dev_id] for dev_id in device_id_and_spec_dict}
+
+
+def get_category_and_dev_num_dict(device_id_and_spec_dict) -> dict:
+    rst = defaultdict(int)
+    for spec in device_id_and_spec_dict.values():
+        rst[spec["category"]] += 1
+    return dict(rst)
+
+
+def get_bind_counts(model: FlowModel, bind_dict) -> np.ndarray:
+    recipe_idx_dict = {name: r for r, name in enumerate(model.recipe_names)}
+    counts = np.zeros(len(model.recipe_names), dtype=np.int64)
+    for rcp_name in bind_dict.values():
+        counts[recipe_idx_dict[rcp_name]] += 1
+    return counts
+
+
+def evaluate_bind(model: FlowModel, device_id_and_spec_dict, bind_dict, dt=1) -> dict:
+    """整数绑定的稳态 LP：每步利润、每步各产品产出"""
+    category_and_dev_num_dict = get_category_and_dev_num_dict(device_id_and_spec_dict)
+    x, profit = solve_device_rates(model, category_and_dev_num_dict, recipe_cap=get_bind_counts(model, bind_dict))
+    output = x @ model.net_rate
+    return {
+        "profit_per_step": profit * dt,
+        "output_per_step": {
+            m: output[i] * dt for i, m in enumerate(model.material_names) if model.price_sell[i] > 0
+        },
+        "busy_devices": x,
+    }
+
+
+def solve_bind(device_id_and_spec_dict, recipe_name_and_spec_dict, init_stock_name_and_spec_dict,
+               init_price_name_and_spec_dict, horizon, dt=1, prev_bind_dict=None) -> tuple[dict, dict]:
+    """返回 (设备id -> 配方名, 报告)"""
+    t0 = time.perf_counter()
+    model = build_flow_model(
+        recipe_name_and_spec_dict, init_stock_name_and_spec_dict, init_price_name_and_spec_dict, horizon, dt,
+    )
+    category_and_dev_num_dict = get_category_and_dev_num_dict(device_id_and_spec_dict)
+    x, relaxed_profit = solve_device_rates(model, category_and_dev_num_dict)
+    prev_counts = get_bind_counts(model, prev_bind_dict) if prev_bind_dict is not None else None
+    counts = solve_device_counts(model, x, category_and_dev_num_dict, prev_counts)
+    bind_dict = assign_devices(device_id_and_spec_dict, model, counts, prev_bind_dict)
+    report = {
+        "relaxed_profit_per_step": relaxed_profit * dt,
+        "solved": evaluate_bind(model, device_id_and_spec_dict, bind_dict, dt),
+        "recipe_dev_num": dict(zip(model.recipe_names, get_bind_counts(model, bind_dict).tolist())),
+        "solve_time": time.perf_counter() - t0,
+    }
+    if prev_bind_dict is not None:
+        report["prev"] = evaluate_bind(model, device_id_and_spec_dict, prev_bind_dict, dt)
+        report["changed_dev_num"] = sum(bind_dict[k] != prev_bind_dict.get(k) for k in bind_dict)
+    return bind_dict, report
+
+
+def save_bind_yaml(path, bind_dict, device_id_and_spec_dict, header_lines=()):
+    """与 init_bind_of_device_and_recipe.yaml 同样的格式，按设备类别分段"""
+    lines = [f"# {line}" for line in header_lines]
+    prev_category = None
+    for dev_id, rcp_name in bind_dict.items():
+        category = device_id_and_spec_dict[dev_id]["category"]
+        if prev_category is not None and category != prev_category:
+            lines.append("")
+        prev_category = category
+        lines.append(f'"{dev_id}": "{rcp_name}"')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def format_eval(ev):
+    output = ", ".join(f"{m} {v:.4f}" for m, v in ev["output_per_step"].items())
+    return f"利润/步 {ev['profit_per_step']:.3f}  产出/步 {output}"
+
+
+def main():
+    from pycode.CFG import (
+        DEVICE_ID_AND_SPEC_DICT,
+        INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT,
+        INIT_PRICE_NAME_AND_SPEC_DICT,
+        INIT_STOCK_NAME_AND_SPEC_DICT,
+        RECIPE_NAME_AND_SPEC_DICT,
+    )
+    from pycode.sweep_runner import apply_device_copies
+
+    parser = argparse.ArgumentParser(description="按稳态利润率求初始设备绑定")
+    parser.add_argument("--horizon", type=int, default=5000, help="初始库存摊到多少步上")
+    parser.add_argument("--out", default=None, help="绑定 yaml 输出路径，不给则只打印")
+    parser.add_argument("--scale", type=int, default=1, help="每台设备复制成几台，测大规模求解")
+    args = parser.parse_args()
+
+    device_id_and_spec_dict, prev_bind_dict = apply_device_copies(
+        device_id_and_spec_dict=DEVICE_ID_AND_SPEC_DICT,
+        bind_dict=INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT,
+        device_copies={dev_id: args.scale for dev_id in DEVICE_ID_AND_SPEC_DICT} if args.scale != 1 else {},
+    )
+    bind_dict, report = solve_bind(
+        device_id_and_spec_dict,
+        RECIPE_NAME_AND_SPEC_DICT,
+        INIT_STOCK_NAME_AND_SPEC_DICT,
+        INIT_PRICE_NAME_AND_SPEC_DICT,
+        horizon=args.horizon,
+        prev_bind_dict=prev_bind_dict,
+    )
+    print(f"设备 {len(device_id_and_spec_dict)} 台，求解 {report['solve_time']:.3f}s")
+    print(f"LP 上界     利润/步 {report['relaxed_profit_per_step']:.3f}")
+    print(f"原绑定      {format_eval(report['prev'])}")
+    print(f"求解绑定    {format_eval(report['solved'])}")
+    print(f"改动 {report['changed_dev_num']} 台，各配方台数 {report['recipe_dev_num']}")
+    if args.out is not None:
+        save_bind_yaml(args.out, bind_dict, device_id_and_spec_dict, header_lines=[
+            f"bind_solver 生成: horizon={args.horizon}, 稳态 {format_eval(report['solved'])}",
+        ])
+        print(f"写入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+"""
+FactorySim / FactoryEnv 的二进制 checkpoint，单个未压缩 .npz 文件，读取时整块读数组、不重新解析 yaml。
+· "__meta__": json 字符串，含 format_version、静态配置（设备、已绑定配方、库存/价格名）及少量非数组状态
+· 其余键为数组：库存、设备状态、订单簿、结算结果表、EpisodeMetrics、稳态检测记录、可选的历史记录
+续跑与不中断运行逐位一致。不保存的内容：
+· 缺料唤醒索引：只是跳过重复检查的加速结构，载入后所有空闲设备重新检查一次，结果不变
+· 实时指标 writer：属于进程，不属于模拟状态
+· 订单随机数：订单在构造时一次生成完毕，之后模拟过程不再抽随机数
+"""
+import dataclasses
+import json
+from collections import deque
+
+import numpy as np
+
+from pycode.data_class import Device, Recipe, Order
+from pycode.dev_runtime import DevState
+from pycode.factory_sim import FactorySim
+from pycode.history_recorder import build_history_recorder, is_number
+from pycode.material_wait_index import MaterialWaitIndex
+from pycode.order_stream import OrderArrivalEngine, OrderStream
+from pycode.steady_state import SteadyStateDetector, TickRecord
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+SIM_SCALAR_FIELD_LIST = [
+    "clock",
+    "dt",
+    "total_energy_kwh_used",
+    "step_energy_kwh_used",
+    "total_running_dev_steps",
+    "total_balance",
+    "step_balance",
+    "step_sell_money",
+    "step_storage_cost",
+    "dev_status_recorded",
+]
+
+
+def save_checkpoint(path, meta: dict, arrays: dict):
+    np.savez(path, __meta__=np.array(json.dumps({"format_version": CHECKPOINT_FORMAT_VERSION, **meta})), **arrays)
+
+
+def load_checkpoint(path) -> tuple[dict, dict]:
+    """返回 (meta, arrays)，格式版本不符直接报错"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {k: data[k] for k in data.files}
+    meta = json.loads(arrays.pop("__meta__").item())
+    if meta["format_version"] != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(
+            f"checkpoint 格式版本 {meta['format_version']} 与当前版本 {CHECKPOINT_FORMAT_VERSION} 不一致: {path}"
+        )
+    return meta, arrays
+
+
+# ---------- FactorySim ----------
+def get_sim_state(sim, include_history=False) -> tuple[dict, dict]:
+    dev_rt_list = sim.dev_rt_list
+    recipe_name_and_obj_dict = {dev_rt.bind_recipe.name: dev_rt.bind_recipe for dev_rt in dev_rt_list}
+    stock_objs = list(sim.stock_mng.get_objs())
+    price_objs = list(sim.price_mng.get_objs())
+
+    meta = {
+        "scalars": {name: to_builtin(getattr(sim, name)) for name in SIM_SCALAR_FIELD_LIST},
+        "device_spec_list": [dataclasses.asdict(dev_rt.device) for dev_rt in dev_rt_list],
+        "recipe_spec_dict": {name: dataclasses.asdict(rcp) for name, rcp in recipe_name_and_obj_dict.items()},
+        "stock_name_list": [o.name for o in stock_objs],
+        "price_spec_list": [dataclasses.asdict(o) for o in price_objs],
+        "visible_order_sort": sim.order_mng.visible_order_sort,
+        "demand_bucket_horizons": (
+            None if sim.order_mng.demand_buckets is None else sim.order_mng.demand_buckets.horizons
+        ),
+        "has_history": include_history and sim.record_history,
+        "history_config": sim.history_recorder.get_config(),
+    }
+    recipe_name_list = list(recipe_name_and_obj_dict)
+    arrays = {
+        "stock/quantity": np.array([o.quantity for o in stock_objs], dtype=np.float64),
+        "stock/is_int": np.array([isinstance(o.quantity, (int, np.integer)) for o in stock_objs]),
+        "dev/running": np.array([dev_rt.state is DevState.RUNNING for dev_rt in dev_rt_list]),
+        "dev/t_left": np.array([dev_rt.t_left for dev_rt in dev_rt_list], dtype=np.int64),
+        "dev/bind_recipe_idx": np.array(
+            [recipe_name_list.index(dev_rt.bind_recipe.name) for dev_rt in dev_rt_list], dtype=np.int32
+        ),
+        "dev/just_finished_idx": np.array(sim.just_finished_dev_idx_list, dtype=np.int64),
+    }
+    arrays.update(get_order_state(sim.order_mng, meta))
+    arrays.update(get_sell_result_state(sim.price_mng.order_sell_result_mng, meta))
+    if sim.steady_state_detector is not None:
+        arrays.update(get_steady_state_detector_state(sim.steady_state_detector, recipe_name_list, meta))
+    if meta["has_history"]:
+        arrays.update(get_history_state(sim.history_recorder, meta))
+    return meta, arrays
+
+
+def build_sim_from_state(meta: dict, arrays: dict, recipe_name_and_obj_dict=None, telemetry_writer=None):
+    """
+    只用 checkpoint 里的静态配置构造一个空模拟器，再整块写入动态状态
+    :param recipe_name_and_obj_dict: 见 set_sim_state()
+    """
+    device_id_and_obj_dict = {spec["id"]: Device(**spec) for spec in meta["device_spec_list"]}
+    if recipe_name_and_obj_dict is None:
+        recipe_name_and_obj_dict = {name: Recipe(**spec) for name, spec in meta["recipe_spec_dict"].items()}
+    recipe_name_list = list(recipe_name_and_obj_dict)
+    bind_recipe_idx = arrays["dev/bind_recipe_idx"]
+    sim = FactorySim(
+        device_id_and_obj_dict=device_id_and_obj_dict,
+        recipe_name_and_obj_dict=recipe_name_and_obj_dict,
+        init_stock_name_and_spec_dict={name: {"name": name, "quantity": 0} for name in meta["stock_name_list"]},
+        init_bind_of_device_id_and_rcp_name_dict={
+            dev_id: recipe_name_list[bind_recipe_idx[i]] for i, dev_id in enumerate(device_id_and_obj_dict)
+        },
+        init_price_name_and_spec_dict={spec["name"]: spec for spec in meta["price_spec_list"]},
+        init_order_list=[],
+        init_money=0,
+        manual_simulation_steps=0,
+        dt=meta["scalars"]["dt"],
+        enable_fast_forward="steady/base_period" in arrays,
+        visible_order_sort=meta["visible_order_sort"],
+        random_order_num=0,
+        demand_bucket_horizons=meta.get("demand_bucket_horizons"),
+        telemetry_writer=telemetry_writer,
+        history_config=meta.get("history_config"),
+    )
+    set_sim_state(sim, meta, arrays, recipe_name_and_obj_dict=recipe_name_and_obj_dict)
+    return sim
+
+
+def set_sim_state(sim, meta: dict, arrays: dict, recipe_name_and_obj_dict=None):
+    """
+    把 checkpoint 写入一个设备/库存/价格配置相同的模拟器
+    :param recipe_name_and_obj_dict: 配方对象从这里取，与调度器用的同一批对象；None 表示按 checkpoint 新建
+    """
+    for name, value in meta["scalars"].items():
+        setattr(sim, name, value)
+    sim.history_recorder = build_history_recorder(sim.history_recorder.get_config())
+    if not meta["has_history"]:
+        # 历史记录从空开始，下一步要把所有设备状态记一遍
+        sim.dev_status_recorded = False
+
+    for o, q, is_int in zip(sim.stock_mng.get_objs(), arrays["stock/quantity"].tolist(), arrays["stock/is_int"]):
+        o.quantity = int(q) if is_int else q
+    sim.stock_mng.mark_all_dirty()
+    for o, spec in zip(sim.price_mng.get_objs(), meta["price_spec_list"]):
+        o.price_buy = spec["price_buy"]
+        o.price_sell = spec["price_sell"]
+        o.storage_cost_per_time_unit = spec["storage_cost_per_time_unit"]
+    sim.price_mng.mark_dirty()
+
+    if recipe_name_and_obj_dict is None:
+        recipe_obj_list = [Recipe(**spec) for spec in meta["recipe_spec_dict"].values()]
+    else:
+        recipe_obj_list = [recipe_name_and_obj_dict[name] for name in meta["recipe_spec_dict"]]
+    running = arrays["dev/running"]
+    for i, dev_rt in enumerate(sim.dev_rt_list):
+        dev_rt.state = DevState.RUNNING if running[i] else DevState.IDLE
+        dev_rt.t_left = int(arrays["dev/t_left"][i])
+        dev_rt.bind_recipe = recipe_obj_list[arrays["dev/bind_recipe_idx"][i]]
+    sim.dirty_dev_idx_set.update(range(len(sim.dev_rt_list)))
+
+    # 活跃集合由设备状态重建，唤醒索引清空
+    sim.running_dev_idx_set = set(np.flatnonzero(running).tolist())
+    sim.idle_candidate_dev_idx_set = set(np.flatnonzero(~running).tolist())
+    sim.material_wait_index = MaterialWaitIndex()
+    sim.just_finished_dev_idx_list = arrays["dev/just_finished_idx"].tolist()
+
+    set_order_state(sim.order_mng, meta, arrays)
+    set_sell_result_state(sim.price_mng.order_sell_result_mng, meta, arrays)
+    if sim.steady_state_detector is not None:
+        set_steady_state_detector_state(sim.steady_state_detector, meta, arrays)
+    if meta["has_history"]:
+        set_history_state(sim.history_recorder, meta, arrays)
+
+
+def save_sim_checkpoint(sim, path, include_history=False):
+    meta, arrays = get_sim_state(sim, include_history=include_history)
+    save_checkpoint(path, meta, arrays)
+
+
+def get_rng_state(rng: np.random.Generator | None):
+    return rng.bit_generator.state if rng is not None else None
+
+
+def build_rng_from_state(state) -> np.random.Generator | None:
+    if state is None:
+        return None
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def load_sim_checkpoint(path, telemetry_writer=None):
+    meta, arrays = load_checkpoint(path)
+    return build_sim_from_state(meta, arrays, telemetry_writer=telemetry_writer)
+
+
+# ---------- 订单簿 ----------
+def get_order_state(order_mng, meta) -> dict:
+    order_list = order_mng.get_raw_list()
+    product_names = sorted({o.name for o in order_list})
+    meta["order_elapsed"] = to_builtin(order_mng.elapsed)
+    meta["order_product_names"] = product_names
+    arrays = {
+        "order/name_idx": np.array([product_names.index(o.name) for o in order_list], dtype=np.int32),
+        # 订单数量可以是小数，按 float64 存，另记哪些原本是整数
+        "order/quantity": np.array([o.quantity for o in order_list], dtype=np.float64),
+        "order/quantity_is_int": np.array([isinstance(o.quantity, (int, np.integer)) for o in order_list], dtype=bool),
+        "order/due_time": np.array([o.due_time for o in order_list], dtype=np.int64),
+    }
+    engine = order_mng.arrival_engine
+    meta["order_stream_product_names"] = engine.stream.product_names
+    meta["order_stream_cursor"] = engine.cursor
+    for name in ["arrival_time", "product_idx", "quantity", "due_time"]:
+        arrays[f"order_stream/{name}"] = getattr(engine.stream, name)
+
+    index = order_mng.visible_order_index
+    if index is not None:
+        entries = [index.order_id_and_entry_dict[id(o)] for o in order_list]
+        meta["visible_index_seq"] = index.seq
+        arrays["order/visible_key"] = np.array([key for key, _, _ in entries], dtype=np.float64)
+        arrays["order/visible_seq"] = np.array([seq for _, seq, _ in entries], dtype=np.int64)
+    return arrays
+
+
+def set_order_state(order_mng, meta, arrays):
+    product_names = meta["order_product_names"]
+    order_mng.elapsed = meta["order_elapsed"]
+    quantity_is_int = arrays.get("order/quantity_is_int")
+    if quantity_is_int is None:
+        # 旧 checkpoint 的订单数量按 int64 存
+        quantity_is_int = np.ones(len(arrays["order/quantity"]), dtype=bool)
+    order_mng.runtime_order_obj_list = [
+        Order(name=product_names[i], quantity=q, due_time=d)
+        for i, q, d in zip(
+            arrays["order/name_idx"].tolist(),
+            restore_quantity_tuple(arrays["order/quantity"], quantity_is_int),
+            arrays["order/due_time"].tolist(),
+        )
+    ]
+    order_mng.arrival_engine = OrderArrivalEngine(
+        OrderStream(
+            product_names=meta["order_stream_product_names"],
+            arrival_time=arrays["order_stream/arrival_time"],
+            product_idx=arrays["order_stream/product_idx"],
+            quantity=arrays["order_stream/quantity"],
+            due_time=arrays["order_stream/due_time"],
+        )
+    )
+    order_mng.arrival_engine.seek(meta["order_stream_cursor"])
+    order_mng.book_version += 1
+    if order_mng.demand_buckets is not None:
+        order_mng.demand_buckets.rebuild(order_mng.runtime_order_obj_list, order_mng.elapsed)
+
+    index = order_mng.visible_order_index
+    if index is not None:
+        entries = sorted(
+            zip(arrays["order/visible_key"].tolist(), arrays["order/visible_seq"].tolist(),
+                order_mng.runtime_order_obj_list),
+            key=lambda entry: entry[:2],
+        )
+        index.sorted_entries = entries
+        index.order_id_and_entry_dict = {id(entry[-1]): entry for entry in entries}
+        index.seq = meta["visible_index_seq"]
+
+
+# ---------- 结算结果 ----------
+def get_sell_result_state(result_mng, meta) -> dict:
+    meta["sell_result_step_money"] = to_builtin(result_mng.step_money)
+    table = result_mng.result_table
+    arrays = {f"sell_result/{name}": table.get_column(name) for name in table.columns}
+    metrics = result_mng.episode_metrics
+    for name in ["ordered", "sold", "shortfall", "revenue", "penalty", "order_cnt", "on_time_cnt"]:
+        arrays[f"episode_metrics/{name}"] = getattr(metrics, name)
+    return arrays
+
+
+def set_sell_result_state(result_mng, meta, arrays):
+    result_mng.step_money = meta["sell_result_step_money"]
+    table = result_mng.result_table
+    size = len(arrays["sell_result/product_idx"])
+    table.size = size
+    table.capacity = max(size, 1024)
+    for name, dtype in table.column_dtype_dict.items():
+        col = np.zeros(table.capacity, dtype=dtype)
+        col[:size] = arrays[f"sell_result/{name}"]
+        table.columns[name] = col
+    metrics = result_mng.episode_metrics
+    for name in ["ordered", "sold", "shortfall", "revenue", "penalty", "order_cnt", "on_time_cnt"]:
+        setattr(metrics, name, arrays[f"episode_metrics/{name}"].copy())
+
+
+# ---------- 稳态检测 ----------
+def get_steady_state_detector_state(detector: SteadyStateDetector, recipe_name_list, meta) -> dict:
+    meta["steady_state"] = {
+        "max_period_multiple": detector.max_period_multiple,
+        "ticks_since_last_check": to_builtin(detector.ticks_since_last_check),
+        "post_start_stock": (
+            np.array(detector.post_start_stock, dtype=np.float64).tolist()
+            if detector.post_start_stock is not None
+            else None
+        ),
+        "jump_cnt": detector.jump_cnt,
+        "jumped_steps": to_builtin(detector.jumped_steps),
+        "records_maxlen": detector.records.maxlen if detector.records is not None else None,
+    }
+    recs = list(detector.records) if detector.records is not None else []
+    arrays = {"steady/base_period": np.array(detector.base_period or 0, dtype=np.int64)}
+    arrays["steady/dev_running"] = np.array([[sig[0] for sig in r.dev_sig] for r in recs], dtype=bool)
+    arrays["steady/dev_t_left"] = np.array([[sig[1] for sig in r.dev_sig] for r in recs], dtype=np.int64)
+    arrays["steady/dev_recipe_idx"] = np.array(
+        [[recipe_name_list.index(sig[2]) for sig in r.dev_sig] for r in recs], dtype=np.int32
+    )
+    arrays["steady/stock"] = np.array([r.stock for r in recs], dtype=np.float64)
+    arrays["steady/post_start_stock"] = np.array([r.post_start_stock for r in recs], dtype=np.float64)
+    for name in ["step_balance", "step_energy", "total_balance", "total_energy"]:
+        arrays[f"steady/{name}"] = np.array([getattr(r, name) for r in recs], dtype=np.float64)
+    for name in ["total_running_dev_steps", "order_num"]:
+        arrays[f"steady/{name}"] = np.array([getattr(r, name) for r in recs], dtype=np.int64)
+    return arrays
+
+
+def set_steady_state_detector_state(detector: SteadyStateDetector, meta, arrays):
+    state = meta["steady_state"]
+    detector.max_period_multiple = state["max_period_multiple"]
+    detector.ticks_since_last_check = state["ticks_since_last_check"]
+    stock_is_int = arrays["stock/is_int"]
+    detector.post_start_stock = (
+        restore_quantity_tuple(np.array(state["post_start_stock"]), stock_is_int)
+        if state["post_start_stock"] is not None
+        else None
+    )
+    detector.jump_cnt = state["jump_cnt"]
+    detector.jumped_steps = state["jumped_steps"]
+
+    base_period = int(arrays["steady/base_period"])
+    if state["records_maxlen"] is None:
+        detector.base_period = None
+        detector.records = None
+        return
+    recipe_name_list = list(meta["recipe_spec_dict"])
+    detector.base_period = base_period
+    detector.records = deque(maxlen=state["records_maxlen"])
+    n_rec = len(arrays["steady/step_balance"])
+    for i in range(n_rec):
+        detector.records.append(
+            TickRecord(
+                dev_sig=tuple(
+                    (running, t_left, recipe_name_list[rcp_idx])
+                    for running, t_left, rcp_idx in zip(
+                        arrays["steady/dev_running"][i].tolist(),
+                        arrays["steady/dev_t_left"][i].tolist(),
+                        arrays["steady/dev_recipe_idx"][i].tolist(),
+                    )
+                ),
+                stock=restore_quantity_tuple(arrays["steady/stock"][i], stock_is_int),
+                post_start_stock=restore_quantity_tuple(arrays["steady/post_start_stock"][i], stock_is_int),
+                step_balance=float(arrays["steady/step_balance"][i]),
+                step_energy=float(arrays["steady/step_energy"][i]),
+                total_balance=float(arrays["steady/total_balance"][i]),
+                total_energy=float(arrays["steady/total_energy"][i]),
+                total_running_dev_steps=int(arrays["steady/total_running_dev_steps"][i]),
+                order_num=int(arrays["steady/order_num"][i]),
+            )
+        )
+
+
+def to_builtin(v):
+    """numpy 标量转成 python 数，便于写进 json meta"""
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def restore_quantity_tuple(values, is_int_array):
+    return tuple(int(v) if is_int else v for v, is_int in zip(values.tolist(), is_int_array))
+
+
+# ---------- 历史记录 ----------
+def get_history_state(hr, meta) -> dict:
+    """先展开快进登记与保持型向量，再按 save_run_log 的方式存成数组，字符串序列里的 None 存为空串"""
+    hr.materialize_repeats()
+    meta["history"] = {
+        "step_counter": to_builtin(hr.step_counter),
+        "scalar_names": list(hr.scalar_logs),
+        "vector_keys": [[group, key] for group, key_dict in hr.vector_logs.items() for key in key_dict],
+        "held_vector_last": hr.held_vector_last,
+        "held_vector_changes": {
+            group: {key: changes for key, changes in key_dict.items() if changes}
+            for group, key_dict in hr.held_vector_changes.items()
+        },
+        "trimmed_steps": hr.trimmed_steps,
+    }
+    # 多分辨率历史另存各级聚合
+    extra_meta, arrays = hr.get_extra_run_log()
+    meta["history"].update(extra_meta)
+    arrays = {f"history/{k}": v for k, v in arrays.items()}
+    for i, lst in enumerate(hr.scalar_logs.values()):
+        arrays[f"history/scalar/{i}"] = np.asarray(lst)
+    for i, (group, key) in enumerate(meta["history"]["vector_keys"]):
+        lst = hr.vector_logs[group][key]
+        if lst and not is_number(lst[0]):
+            lst = ["" if v is None else v for v in lst]
+        arrays[f"history/vector/{i}"] = np.asarray(lst)
+    return arrays
+
+
+def set_history_state(hr, meta, arrays):
+    state = meta["history"]
+    hr.step_counter = state["step_counter"]
+    hr.trimmed_steps = state.get("trimmed_steps", 0)
+    if "multires_history" in state:
+        hr.set_level_state(state["multires_history"], {k[len("history/"):]: v for k, v in arrays.items()})
+    for i, name in enumerate(state["scalar_names"]):
+        hr.scalar_logs[name] = arrays[f"history/scalar/{i}"].tolist()
+    for i, (group, key) in enumerate(state["vector_keys"]):
+        arr = arrays[f"history/vector/{i}"]
+        if arr.dtype.kind == "U":
+            hr.vector_logs[group][key] = [None if v == "" else v for v in arr.tolist()]
+        else:
+            hr.vector_logs[group][key] = arr.tolist()
+    for group, key_dict in state["held_vector_last"].items():
+        hr.held_vector_last[group].update(key_dict)
+    for group, key_dict in state["held_vector_changes"].items():
+        for key, changes in key_dict.items():
+            hr.held_vector_changes[group][key] = [tuple(c) for c in changes]
@@ -1,8 +1,14 @@
 from dataclasses import dataclass
 from typing import Dict, List
 
+"""
+全部用 slots，没有逐实例 __dict__。
+Device / Recipe 是静态配置，frozen，同一进程内配置相同的环境共用一份（见 utils.get_shared_device_and_recipe_obj_dicts），
+其中的 list / dict 字段也按只读使用。其余是各环境自己的运行时对象。
+"""
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Device:
     id: str
     category: str
@@ -12,7 +18,7 @@ class Device:
     downstream: List[str]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Recipe:
     name: str
     device_category: str  # what kind of device executes it
@@ -22,13 +28,13 @@ class Recipe:
     outputs: Dict[str, float]
 
 
-@dataclass
+@dataclass(slots=True)
 class MaterialStock:
     name: str
     quantity: float
 
 
-@dataclass
+@dataclass(slots=True)
 class Price:
     name: str
     price_buy: float | None
@@ -36,7 +42,7 @@ class Price:
     storage_cost_per_time_unit: float | None
 
 
-@dataclass
+@dataclass(slots=True)
 class Order:
     name: str
     quantity: float | None
@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+import numpy as np
+
+
+class DemandBuckets:
+    """
+    按产品、按到期时间分桶的未结订单需求：cum_quantity[p, b] = 产品 p 中剩余时间 <= horizons[b] 的订单总数量。
+    所有更新都是增量的，代价与订单簿大小无关：
+    · 订单到达：剩余时间已在 horizons[b] 以内的桶直接加；更远的桶登记在 crossing[b][due_time] 里，等它进桶
+    · 时间推进：第 b 个桶只需看 due_time == elapsed + horizons[b] 的登记，O(桶数 + 本步进桶的订单种类)
+    · 订单到期结算：剩余时间为 0，所有桶里都有它，整行减掉
+    """
+
+    def __init__(self, product_names, horizons=(10, 60, 300, 1800)):
+        assert list(horizons) == sorted(horizons) and horizons[0] > 0
+        self.product_names = list(product_names)
+        self.product_name_and_idx_dict = {name: i for i, name in enumerate(self.product_names)}
+        self.horizons = list(horizons)
+        self.elapsed = 0
+        self.cum_quantity = np.zeros((len(self.product_names), len(self.horizons)), dtype=np.float64)
+        # 每个桶一份 {due_time: {product_idx: quantity}}，只登记到达时还在该桶外的订单
+        self.crossing_list = [defaultdict(lambda: defaultdict(int)) for _ in self.horizons]
+
+    def add(self, name, quantity, due_time):
+        """订单入簿，due_time 为绝对时间；不在 product_names 里的产品不统计"""
+        p = self.product_name_and_idx_dict.get(name)
+        if p is None:
+            return
+        remaining = due_time - self.elapsed
+        for b, horizon in enumerate(self.horizons):
+            if remaining <= horizon:
+                self.cum_quantity[p, b:] += quantity
+                return
+            self.crossing_list[b][due_time][p] += quantity
+
+    def remove_due(self, name, quantity):
+        """到期订单出簿。它的剩余时间为 0，已计入所有桶"""
+        p = self.product_name_and_idx_dict.get(name)
+        if p is None:
+            return
+        self.cum_quantity[p] -= quantity
+
+    def advance_to(self, elapsed):
+        """时钟推进到 elapsed，把剩余时间跨进各桶的订单加进去"""
+        prev = self.elapsed
+        self.elapsed = elapsed
+        for b, horizon in enumerate(self.horizons):
+            crossing = self.crossing_list[b]
+            if not crossing:
+                continue
+            # 进桶条件 due_time - horizon <= elapsed，区间 (prev + horizon, elapsed + horizon]
+            if elapsed - prev <= len(crossing):
+                due_time_list = [t for t in range(prev + horizon + 1, elapsed + horizon + 1) if t in crossing]
+            else:
+                due_time_list = [t for t in crossing if t <= elapsed + horizon]
+            column = self.cum_quantity[:, b]
+            for t in due_time_list:
+                for p, quantity in crossing.pop(t).items():
+                    column[p] += quantity
+
+    def rebuild(self, order_obj_list, elapsed):
+        """按当前订单簿重建，用于读档"""
+        self.elapsed = elapsed
+        self.cum_quantity[:] = 0
+        for crossing in self.crossing_list:
+            crossing.clear()
+        for o in order_obj_list:
+            self.add(o.name, o.quantity, o.due_time)
+
+    def get_observation(self):
+        """定长观测：按产品展开的 [p0 各桶, p1 各桶, ...]，长度 len(product_names) * len(horizons)"""
+        return self.cum_quantity.ravel().astype(np.float32)
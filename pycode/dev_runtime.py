@@ -10,7 +10,7 @@ class DevState(Enum):
     RUNNING = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class DevRuntime:
     device: Device
     bind_recipe: Recipe
@@ -21,17 +21,21 @@ class DevRuntime:
         self, runtime_stock_manager: StockManagerRuntime
     ) -> bool:
         """Check if enough inputs exist to launch a batch."""
+        return self.get_lacking_material(runtime_stock_manager) is None
+
+    def get_lacking_material(self, runtime_stock_manager: StockManagerRuntime):
+        """返回第一种库存不够的材料 (材料名, 需求量)，都够则返回 None"""
         # 如果所需材料库存不够，也不能开始生产
         for material, need_quantity in self.bind_recipe.inputs.items():
             if runtime_stock_manager.get_obj_by_name(material).quantity < need_quantity:
-                return False
+                return material, need_quantity
         # 其他情况，判断可以开始生产
-        return True
+        return None
 
     def start_batch(self, runtime_stock_manager: StockManagerRuntime):
         # 标记一次生产开始，消耗库存开始生产
         for m, q in self.bind_recipe.inputs.items():
-            runtime_stock_manager.get_obj_by_name(m).quantity -= q
+            runtime_stock_manager.remove_stock(m, q)
         self.state = DevState.RUNNING
         self.t_left = self.bind_recipe.cycle_time
 
@@ -41,5 +45,5 @@ class DevRuntime:
             self.t_left -= dt
             if self.t_left <= 0:
                 for material, produce_quantity in self.bind_recipe.outputs.items():
-                    runtime_stock_manager.get_obj_by_name(material).quantity += produce_quantity
+                    runtime_stock_manager.add_stock(material, produce_quantity)
                 self.state = DevState.IDLE
@@ -0,0 +1,346 @@
+"""
+规则调度：不训练、每步直接出计划的几种 schedule_mode，FactoryEnv(schedule_mode=...) 或 sweep 的 scheduler 覆盖项可选。
+每次决策只给空闲设备选配方（运行中的设备计划为 None），按设备顺序逐台分配，
+分配时先在本地扣掉所选配方的原料、记上产出，避免多台设备抢同一批料；
+规则分数相同时选产出更缺的配方（缺料程度见 "stock_balance"），选不出可开工的配方时沿用当前绑定，同 greedy。
+每次决策 O(设备数)，另加订单簿前 ORDER_LOOKAHEAD 个订单。
+
+· "edd": 最早到期优先。按到期时间扫描订单，扣掉库存后每个产品最早还缺货的订单到期时间即该产品的紧迫度；
+  配方的紧迫度 = 它（经若干道工序）能供给的产品里最紧迫的那个，空闲设备选最紧迫的可开工配方
+· "bottleneck": 瓶颈优先。用 bind_solver 的流量 LP 求每个配方的目标设备数，
+  空闲设备选 (运行中 + 本次已分配) / 目标 最小、即产能缺口最大的可开工配方
+· "stock_balance": 库存均衡。材料的缺料程度 = 库存 / 下游单批最大用量（在售产品用 库存 - 待交订单量），
+  空闲设备选产出最缺的可开工配方
+· "myopic_profit": 短视利润。材料的重置价值取 LP 影子价格（售价 + 对偶价），再按当前库存打折：
+  库存不超过近期需要量（在售产品为待交订单量，中间品为下游单批最大用量）时按全价，超出时按 需要量 / 库存 折价，
+  没有待交订单的产品不值钱；空闲设备选每秒增值 (产出价值 - 原料价值) / cycle_time - 电费 最大的可开工配方
+
+用法（对比 greedy 与训练好的策略）:
+python -m pycode.dispatch_rules [--steps 2000] [--ppo-model xxx.zip | --ppo-timesteps 20000]
+"""
+import argparse
+import math
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from pycode.bind_solver import build_flow_model, get_category_and_dev_num_dict, solve_device_rates
+from pycode.dev_runtime import DevState
+
+DISPATCH_RULE_LIST = ["edd", "bottleneck", "stock_balance", "myopic_profit"]
+ORDER_LOOKAHEAD = 256
+
+
+class RuleDispatcher:
+    def __init__(
+            self,
+            rule,
+            device_id_and_spec_dict,
+            recipe_name_and_spec_dict,
+            recipe_name_and_obj_dict,
+            init_stock_name_and_spec_dict,
+            init_price_name_and_spec_dict,
+            horizon,
+            dt=1,
+    ):
+        assert rule in DISPATCH_RULE_LIST, f"未知规则调度 {rule}"
+        self.rule = rule
+        self.recipe_name_and_obj_dict = recipe_name_and_obj_dict
+        # 类别 -> [配方名]
+        self.category_and_recipe_list_dict = defaultdict(list)
+        for name, rcp in recipe_name_and_obj_dict.items():
+            self.category_and_recipe_list_dict[rcp.device_category].append(name)
+        # 在售产品
+        self.product_set = {
+            name for name, spec in init_price_name_and_spec_dict.items() if (spec["price_sell"] or 0) > 0
+        }
+        # 材料 -> 下游配方单批最大用量
+        self.material_and_max_need_dict = defaultdict(float)
+        for rcp in recipe_name_and_obj_dict.values():
+            for m, q in rcp.inputs.items():
+                self.material_and_max_need_dict[m] = max(self.material_and_max_need_dict[m], q)
+        # 配方 -> 它能供给的在售产品
+        self.recipe_and_product_set_dict = self.get_recipe_and_product_set_dict()
+
+        model = build_flow_model(
+            recipe_name_and_spec_dict, init_stock_name_and_spec_dict, init_price_name_and_spec_dict, horizon, dt,
+        )
+        if rule == "bottleneck":
+            x, _ = solve_device_rates(model, get_category_and_dev_num_dict(device_id_and_spec_dict))
+            self.recipe_and_target_dev_num_dict = dict(zip(model.recipe_names, x.tolist()))
+        if rule == "myopic_profit":
+            _, _, dual = solve_device_rates(
+                model, get_category_and_dev_num_dict(device_id_and_spec_dict), return_dual=True,
+            )
+            # 材料 -> 重置价值，取整消掉单纯形的舍入误差
+            material_value = np.round(model.price_sell + dual[:len(model.material_names)], 6)
+            self.material_and_value_dict = dict(zip(model.material_names, material_value.tolist()))
+            # 配方 -> 每秒电费、[(材料, 每秒净产出)]
+            energy_rate = model.net_rate @ model.price_sell - model.profit_rate
+            self.recipe_and_energy_rate_dict = dict(zip(model.recipe_names, energy_rate.tolist()))
+            self.recipe_and_net_rate_list_dict = {
+                name: [(model.material_names[i], model.net_rate[r, i]) for i in np.flatnonzero(model.net_rate[r])]
+                for r, name in enumerate(model.recipe_names)
+            }
+
+        # 统计决策耗时
+        self.decision_cnt = 0
+        self.decision_time = 0.0
+
+    def get_recipe_and_product_set_dict(self) -> dict:
+        material_and_producer_list_dict = defaultdict(list)
+        material_and_consumer_list_dict = defaultdict(list)
+        for name, rcp in self.recipe_name_and_obj_dict.items():
+            for m in rcp.outputs:
+                material_and_producer_list_dict[m].append(name)
+            for m in rcp.inputs:
+                material_and_consumer_list_dict[m].append(name)
+
+        memo = {}
+
+        def get_product_set(rcp_name, visiting):
+            if rcp_name in memo:
+                return memo[rcp_name]
+            rst = set()
+            visiting = visiting | {rcp_name}
+            for m in self.recipe_name_and_obj_dict[rcp_name].outputs:
+                if m in self.product_set:
+                    rst.add(m)
+                for consumer in material_and_consumer_list_dict[m]:
+                    if consumer not in visiting:
+                        rst |= get_product_set(consumer, visiting)
+            memo[rcp_name] = rst
+            return rst
+
+        return {name: get_product_set(name, set()) for name in self.recipe_name_and_obj_dict}
+
+    def get_schedule_plan(self, sim) -> dict:
+        t0 = time.perf_counter()
+        stock_mng = sim.stock_mng
+        # 本次决策的本地库存，首次用到某材料时从库存读入
+        available = {}
+
+        def get_available(m):
+            if m not in available:
+                available[m] = stock_mng.get_obj_by_name(m).quantity
+            return available[m]
+
+        def can_start(rcp):
+            return all(get_available(m) >= q for m, q in rcp.inputs.items())
+
+        def reserve(rcp):
+            for m, q in rcp.inputs.items():
+                available[m] -= q
+            # 产出记进本地库存，后面的设备往别处补
+            for m, q in rcp.outputs.items():
+                available[m] = get_available(m) + q
+
+        demand_dict = self.get_product_and_pending_quantity_dict(sim)
+        shortage_fn = self.get_shortage_fn(demand_dict, get_available)
+        score_fn = self.get_score_fn(sim, get_available, demand_dict, shortage_fn)
+        plan = {}
+        for dev_id, dev_rt in zip(sim.dev_id_list, sim.dev_rt_list):
+            if dev_rt.state is DevState.RUNNING:
+                plan[dev_id] = None
+                continue
+            best_name, best_score = None, (math.inf, math.inf)
+            for name in self.category_and_recipe_list_dict[dev_rt.device.category]:
+                rcp = self.recipe_name_and_obj_dict[name]
+                score = score_fn(name)
+                if score == math.inf:
+                    continue
+                # 分数相同时选产出更缺的，再相同时保留当前绑定
+                score = (score, shortage_fn(name))
+                if score < best_score or (score == best_score and rcp is dev_rt.bind_recipe):
+                    if can_start(rcp):
+                        best_name, best_score = name, score
+            if best_name is None:
+                plan[dev_id] = dev_rt.bind_recipe.name
+                continue
+            reserve(self.recipe_name_and_obj_dict[best_name])
+            if self.rule == "bottleneck":
+                self.recipe_and_dev_num_dict[best_name] += 1
+            plan[dev_id] = best_name
+
+        self.decision_cnt += 1
+        self.decision_time += time.perf_counter() - t0
+        return plan
+
+    def get_shortage_fn(self, demand_dict, get_available):
+        """
+        返回 配方名 -> 产出的缺料程度（越小越缺）：中间品为 库存 / 下游单批最大用量，在售产品为 库存 - 待交订单量，
+        多个产出取最缺的
+        """
+        def shortage(name):
+            rst = math.inf
+            for m in self.recipe_name_and_obj_dict[name].outputs:
+                if m in self.product_set:
+                    rst = min(rst, get_available(m) - demand_dict.get(m, 0))
+                elif m in self.material_and_max_need_dict:
+                    rst = min(rst, get_available(m) / self.material_and_max_need_dict[m])
+            return rst
+
+        return shortage
+
+    def get_score_fn(self, sim, get_available, demand_dict, shortage_fn):
+        """返回 配方名 -> 分数（越小越优先）；分数为 inf 的配方不选"""
+        if self.rule == "edd":
+            product_and_due_dict = self.get_product_and_earliest_short_due_dict(sim, get_available)
+            return lambda name: min(
+                (product_and_due_dict.get(p, math.inf) for p in self.recipe_and_product_set_dict[name]),
+                default=math.inf,
+            )
+
+        if self.rule == "bottleneck":
+            self.recipe_and_dev_num_dict = defaultdict(int)
+            for dev_rt in sim.dev_rt_list:
+                if dev_rt.state is DevState.RUNNING:
+                    self.recipe_and_dev_num_dict[dev_rt.bind_recipe.name] += 1
+            target_dict = self.recipe_and_target_dev_num_dict
+            return lambda name: (
+                self.recipe_and_dev_num_dict[name] / target_dict[name] if target_dict[name] > 1e-9 else math.inf
+            )
+
+        if self.rule == "stock_balance":
+            return shortage_fn
+
+        value_fn = self.get_material_value_fn(demand_dict, get_available)
+
+        def neg_margin(name):
+            margin = sum(rate * value_fn(m) for m, rate in self.recipe_and_net_rate_list_dict[name])
+            margin -= self.recipe_and_energy_rate_dict[name]
+            return -margin if margin > -1e-9 else math.inf
+
+        return neg_margin
+
+    def get_material_value_fn(self, demand_dict, get_available):
+        """返回 材料名 -> 当前单位价值：库存不超过近期需要量时为重置价值，超出时按 需要量 / 库存 折价"""
+
+        def value(m):
+            full_value = self.material_and_value_dict[m]
+            if m in self.product_set:
+                need = demand_dict.get(m, 0)
+            else:
+                need = self.material_and_max_need_dict.get(m, 0)
+            quantity = get_available(m)
+            if quantity <= need:
+                return full_value
+            return full_value * need / quantity
+
+        return value
+
+    def get_product_and_earliest_short_due_dict(self, sim, get_available) -> dict:
+        """按到期时间扫描订单，每个产品累计需求第一次超过库存的那个订单的到期时间"""
+        rst = {}
+        cum_demand = defaultdict(float)
+        for o in sim.order_mng.get_raw_list()[:ORDER_LOOKAHEAD]:
+            if o.name in rst or o.name not in self.product_set:
+                continue
+            cum_demand[o.name] += o.quantity
+            if cum_demand[o.name] > get_available(o.name):
+                rst[o.name] = o.due_time
+            if len(rst) == len(self.product_set):
+                break
+        return rst
+
+    def get_product_and_pending_quantity_dict(self, sim) -> dict:
+        rst = defaultdict(float)
+        for o in sim.order_mng.get_raw_list()[:ORDER_LOOKAHEAD]:
+            rst[o.name] += o.quantity
+        return rst
+
+    def get_decisions_per_sec(self):
+        return self.decision_cnt / self.decision_time if self.decision_time > 0 else math.nan
+
+
+class TimedCall:
+    """包一层计时，用来量 greedy_schedule 的决策速度"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.decision_cnt = 0
+        self.decision_time = 0.0
+
+    def __call__(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        rst = self.fn(*args, **kwargs)
+        self.decision_cnt += 1
+        self.decision_time += time.perf_counter() - t0
+        return rst
+
+    get_decisions_per_sec = RuleDispatcher.get_decisions_per_sec
+
+
+def run_ppo_policy(model, env, steps):
+    from sb3_contrib.common.maskable.utils import get_action_masks
+
+    obs, _ = env.reset()
+    t0 = time.perf_counter()
+    decision_time = 0.0
+    for _ in range(steps):
+        t = time.perf_counter()
+        action, _ = model.predict(obs, action_masks=get_action_masks(env), deterministic=True)
+        decision_time += time.perf_counter() - t
+        obs, _, done, _, _ = env.step(action)
+        if done:
+            break
+    return env.sim, steps / decision_time, time.perf_counter() - t0
+
+
+def bench(steps=2000, ppo_model_path=None, ppo_timesteps=20_000):
+    """各调度方式跑同一组设置（同样的随机订单），比较决策速度与期末余额"""
+    from pycode.factory_env import FactoryEnv
+    from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps}
+    rows = []
+    for mode in ["greedy", *DISPATCH_RULE_LIST]:
+        env = FactoryEnv(**build_env_kwargs({**params, "scheduler": mode}), artifact_mode="none")
+        if mode == "greedy":
+            env.greedy_schedule = timed_greedy_schedule = TimedCall(env.greedy_schedule)
+        t0 = time.perf_counter()
+        env.run_greedy(steps)
+        wall = time.perf_counter() - t0
+        dispatcher = env.rule_dispatcher if mode != "greedy" else timed_greedy_schedule
+        rows.append((mode, dispatcher.get_decisions_per_sec(), env.sim, wall))
+
+    if ppo_model_path is not None or ppo_timesteps:
+        from sb3_contrib import MaskablePPO
+
+        env_kwargs = {**build_env_kwargs({**params, "scheduler": "manual"}), "artifact_mode": "none"}
+        if ppo_model_path is not None:
+            model = MaskablePPO.load(ppo_model_path)
+            name = "ppo"
+        else:
+            from stable_baselines3.common.env_util import make_vec_env
+
+            model = MaskablePPO(
+                "MultiInputPolicy", make_vec_env(FactoryEnv, n_envs=1, env_kwargs=env_kwargs), n_steps=2048,
+                batch_size=256, gamma=0.95, verbose=0,
+            )
+            model.learn(total_timesteps=ppo_timesteps)
+            name = f"ppo({ppo_timesteps} steps)"
+        sim, decisions_per_sec, wall = run_ppo_policy(model, FactoryEnv(**env_kwargs), steps)
+        rows.append((name, decisions_per_sec, sim, wall))
+
+    print(f"{'schedule':24s} {'decisions/s':>12s} {'balance':>12s} {'fill_rate':>10s} {'util':>6s} {'wall(s)':>8s}")
+    for name, decisions_per_sec, sim, wall in rows:
+        print(
+            f"{name:24s} {decisions_per_sec:12,.0f} {sim.total_balance:12,.1f} "
+            f"{sim.get_fill_rate():10.3f} {sim.get_utilization():6.3f} {wall:8.2f}"
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则调度对比 greedy / PPO")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--ppo-model", default=None, help="训练好的 MaskablePPO zip；不给则现训 --ppo-timesteps 步")
+    parser.add_argument("--ppo-timesteps", type=int, default=20_000, help="0 表示不比较 PPO")
+    args = parser.parse_args()
+    bench(args.steps, args.ppo_model, args.ppo_timesteps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+
+class EpisodeMetrics:
+    """
+    整个episode的订单结算统计，按产品累计到定长数组里，不保留逐订单对象。
+    · ordered / sold / shortfall: 数量
+    · revenue / penalty: 金额
+    · order_cnt / on_time_cnt: 订单数，按时足量交付的订单数，两者之比为 on_time_rate
+    """
+
+    def __init__(self, product_names):
+        self.product_names = list(product_names)
+        self.product_name_and_idx_dict = {name: i for i, name in enumerate(self.product_names)}
+
+        n = len(self.product_names)
+        self.ordered = np.zeros(n, dtype=np.float64)
+        self.sold = np.zeros(n, dtype=np.float64)
+        self.shortfall = np.zeros(n, dtype=np.float64)
+        self.revenue = np.zeros(n, dtype=np.float64)
+        self.penalty = np.zeros(n, dtype=np.float64)
+        self.order_cnt = np.zeros(n, dtype=np.int64)
+        self.on_time_cnt = np.zeros(n, dtype=np.int64)
+
+    def update(self, name, need_to_sell_quantity, sold_quantity, sold_money, penalty_money):
+        i = self.product_name_and_idx_dict[name]
+        self.ordered[i] += need_to_sell_quantity
+        self.sold[i] += sold_quantity
+        self.shortfall[i] += need_to_sell_quantity - sold_quantity
+        self.revenue[i] += sold_money
+        self.penalty[i] += penalty_money
+        self.order_cnt[i] += 1
+        if sold_quantity >= need_to_sell_quantity:
+            self.on_time_cnt[i] += 1
+
+    def get_on_time_rate(self):
+        return np.divide(
+            self.on_time_cnt,
+            self.order_cnt,
+            out=np.zeros(len(self.product_names), dtype=np.float64),
+            where=self.order_cnt > 0,
+        )
+
+    def to_info_dict(self):
+        """扁平字典 {"Motor/sold": .., "total/revenue": ..}，只包含有订单的产品，用于 info 和 TensorBoard"""
+        rst = {}
+        on_time_rate = self.get_on_time_rate()
+        for i in np.flatnonzero(self.order_cnt):
+            name = self.product_names[i]
+            rst[f"{name}/ordered"] = float(self.ordered[i])
+            rst[f"{name}/sold"] = float(self.sold[i])
+            rst[f"{name}/shortfall"] = float(self.shortfall[i])
+            rst[f"{name}/revenue"] = float(self.revenue[i])
+            rst[f"{name}/penalty"] = float(self.penalty[i])
+            rst[f"{name}/on_time_rate"] = float(on_time_rate[i])
+
+        total_order_cnt = self.order_cnt.sum()
+        rst["total/order_cnt"] = int(total_order_cnt)
+        rst["total/revenue"] = float(self.revenue.sum())
+        rst["total/penalty"] = float(self.penalty.sum())
+        rst["total/on_time_rate"] = (
+            float(self.on_time_cnt.sum() / total_order_cnt) if total_order_cnt else 0.0
+        )
+        return rst
+
+    def summary(self):
+        """单行摘要，代替逐订单打印"""
+        return ", ".join(f"{k}={v:,.2f}" for k, v in self.to_info_dict().items())
+
+
+class EpisodeMetricsCallback(BaseCallback):
+    """把 info["episode_metrics"] 以 episode_metrics/... 的名字写进 SB3 logger（TensorBoard）"""
+
+    def _on_step(self) -> bool:
+        for info in self.locals["infos"]:
+            metrics = info.get("episode_metrics")
+            if metrics is None:
+                continue
+            for k, v in metrics.items():
+                self.logger.record_mean(f"episode_metrics/{k}", v)
+        return True
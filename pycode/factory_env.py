@@ -1,10 +1,14 @@
+import os
+import time
+from collections import defaultdict
 from typing import Literal
 
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 from sb3_contrib import MaskablePPO
-from sb3_contrib.common.maskable.policies import MaskableMultiInputActorCriticPolicy
+from sb3_contrib.common.maskable.policies import MaskableMultiInputActorCriticPolicy, MaskableActorCriticPolicy
+from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.env_util import make_vec_env
 
 from pycode.CFG import (
@@ -17,16 +21,33 @@ from pycode.CFG import (
     INIT_MONEY
 )
 from pycode.Scheduler import Scheduler
-from pycode.data_class import Device
+from pycode.checkpoint import (
+    get_sim_state,
+    build_sim_from_state,
+    save_checkpoint,
+    load_checkpoint,
+    get_rng_state,
+    build_rng_from_state,
+)
 from pycode.dev_runtime import DevState, DevRuntime
+from pycode.dispatch_rules import DISPATCH_RULE_LIST, RuleDispatcher
+from pycode.episode_metrics import EpisodeMetricsCallback
 from pycode.factory_sim import FactorySim
+from pycode.history_recorder import run_log_folder
 from pycode.make_my_plots import draw_dashboard, draw_gantt, draw_device_topology
+from pycode.run_registry import DEFAULT_RUN_REGISTRY_PATH, RunRegistry, get_config_hash
+from pycode.telemetry import TelemetryWriter
 from pycode.utils import (
     build_dict_of_dev_category_and_recipe_name,
-    build_dict_of_recipe_name_and_obj,
+    get_shared_device_and_recipe_obj_dicts,
+    now_time,
 )
 
 
+# 观测里 order_name 的编号，None 为空位
+ORDER_NAME_AND_IDX_DICT = {"Motor": 0, "Frame": 1, None: 2}
+
+
 class FactoryEnv(gym.Env):
     def __init__(
             self,
@@ -37,13 +58,58 @@ class FactoryEnv(gym.Env):
             init_price_name_and_spec_dict,
             init_order_list,
             init_money,
-            schedule_mode: Literal["greedy", "manual"],
+            schedule_mode: Literal["greedy", "manual", "edd", "bottleneck", "stock_balance", "myopic_profit"],
             dt,
             manual_simulation_steps,
+            fast_forward=False,
+            obs_mode: Literal["dict", "flat"] = "dict",
+            visible_order_num=50,
+            visible_order_sort: Literal["earliest_due", "highest_value"] = "earliest_due",
+            decision_interval=1,
+            decision_mode: Literal["interval", "event"] = "interval",
+            max_event_wait=600,
+            random_order_num=50,
+            order_seed=None,
+            order_stream_spec=None,
+            demand_bucket_horizons=None,
+            artifact_mode: Literal["plot", "log", "none"] = "plot",
+            run_name=None,
+            telemetry_sample_every=None,
+            run_registry_path=DEFAULT_RUN_REGISTRY_PATH,
+            history_config=None,
+            record_history=None,
             **kwargs,
     ):
         """
         :param schedule_mode: 是否以调度方式启动。无调度意味着只要原料足够就开机运转。
+            "edd"/"bottleneck"/"stock_balance"/"myopic_profit" 为规则调度，run_greedy() 每步按规则出计划，见 dispatch_rules.py
+        :param fast_forward: 稳态检测快进，只在 greedy 模式下可用，见 run_greedy()
+        :param obs_mode: "dict" 为 13 个字段的 spaces.Dict；"flat" 为一维 float32 向量，类别字段预先 one-hot，
+            可直接用 MlpPolicy，布局见 get_flat_obs_layout()
+        :param visible_order_num: 观测里可见的订单数 K
+        :param visible_order_sort: 可见订单按什么排序取前 K 个，"earliest_due" 或 "highest_value"
+        :param decision_interval: 每次 step() 应用一次动作后连续推进的模拟步数，奖励为这些步的累计
+        :param decision_mode: "interval" 按 decision_interval 推进；"event" 一直推进到下一个决策点，
+            即有机器空闲下来且无法续做、空闲且无计划的机器所绑配方的原料变得够用、或有订单到达/到期，
+            观测里多一个 elapsed_time 字段
+        :param max_event_wait: "event" 模式下一次 step() 最多推进的模拟步数
+        :param random_order_num: 每个 episode 随机生成的订单数
+        :param order_seed: 随机订单的种子，None 表示不固定
+        :param order_stream_spec: 订单流配置，见 order_stream.py；None 表示 random_order_num 个订单全部在 0 时刻到达
+        :param demand_bucket_horizons: 不为 None 时观测里多一个定长的 demand_buckets 字段：每个在售产品
+            剩余时间 <= 各上界（如 [10, 60, 300, 1800]）的未结订单累计数量，不受 visible_order_num 截断，
+            长度为 在售产品数 * 桶数，每步代价与订单簿大小无关
+        :param artifact_mode: 每次 reset() 时如何保存上一个 episode：
+            "plot" 当场画 dashboard/甘特图并存 xlsx；"log" 只存 run log，之后用 plot_runs.py 离线画；"none" 什么都不存
+        :param run_name: run id 前缀，每个 episode 的 run id 为 <run_name>-ep<序号>，默认 <时间>-<pid>
+        :param telemetry_sample_every: 每多少个模拟步把实时指标写进共享内存环形缓冲区一次，
+            用 python -m pycode.telemetry 查看；None 表示不上报
+        :param run_registry_path: 保存 episode 产物（artifact_mode 为 "plot"/"log"）时把 run 登记到这个 SQLite 登记表，
+            用 python -m pycode.run_registry 查询；None 表示不登记
+        :param history_config: None 时 HistoryRecorder 逐步全量记录；长 run 可给 MultiResHistoryRecorder 的构造参数，
+            如 {"levels": [10, 60, 600], "recent_window": 3600}，只留最近一段原始值和逐级降采样的聚合
+        :param record_history: 是否逐步写历史记录；None 表示 artifact_mode 不为 "none" 时才记，
+            训练、sweep 等不存产物的 env 省掉每步的记录开销。要读 sim.history_recorder 或存带历史的 checkpoint 时给 True
         """
         super().__init__(**kwargs)
 
@@ -59,17 +125,30 @@ class FactoryEnv(gym.Env):
         self.schedule_mode = schedule_mode
         self.dt = dt
         self.simulation_steps = manual_simulation_steps
+        assert not fast_forward or schedule_mode == "greedy", "快进只支持 greedy 模式"
+        self.fast_forward = fast_forward
+        self.obs_mode = obs_mode
+        self.visible_order_sort = visible_order_sort
+        self.decision_interval = decision_interval
+        self.decision_mode = decision_mode
+        self.max_event_wait = max_event_wait
+        self.random_order_num = random_order_num
+        self.order_seed = order_seed
+        self.order_stream_spec = order_stream_spec
+        self.demand_bucket_horizons = demand_bucket_horizons
+        self.artifact_mode = artifact_mode
+        self.run_name = run_name if run_name is not None else f"{now_time()}-{os.getpid()}"
+        self.run_registry_path = run_registry_path
+        self.history_config = history_config
+        self.record_history = artifact_mode != "none" if record_history is None else record_history
+        # 第一次登记时才连库，子进程里各连各的
+        self.run_registry = None
 
         """新属性"""
-        # 字典，设备id -> 设备obj
-        self.device_id_and_obj_dict = {
-            dev_id: Device(**dev_dict)
-            for dev_id, dev_dict in device_id_and_spec_dict.items()
-        }
-        # 字典，配方名 -> 配方obj
-        self.recipe_name_and_obj_dict = build_dict_of_recipe_name_and_obj(
+        # 字典，设备id -> 设备obj；字典，配方名 -> 配方obj。都是静态配置，同一进程内配置相同的环境共用
+        self.device_id_and_obj_dict, self.recipe_name_and_obj_dict = get_shared_device_and_recipe_obj_dicts(
+            device_id_and_spec_dict=device_id_and_spec_dict,
             recipe_name_and_spec_dict=recipe_name_and_spec_dict,
-            whether_convert_to_one_second_of_cycle_time=False,
         )
         # 字典，设备类别名 -> 能做哪些配方名的list，这里不包括None。有None的版本由Scheduler负责生成。
         dev_category_and_rcp_name_dict = build_dict_of_dev_category_and_recipe_name(
@@ -82,6 +161,17 @@ class FactoryEnv(gym.Env):
             bind_of_device_id_and_rcp_name_dict=init_bind_of_device_id_and_rcp_name_dict,
             dev_category_and_rcp_name_dict=dev_category_and_rcp_name_dict,
         )
+        # 规则调度器，非规则模式为 None
+        self.rule_dispatcher = RuleDispatcher(
+            rule=schedule_mode,
+            device_id_and_spec_dict=device_id_and_spec_dict,
+            recipe_name_and_spec_dict=recipe_name_and_spec_dict,
+            recipe_name_and_obj_dict=self.recipe_name_and_obj_dict,
+            init_stock_name_and_spec_dict=init_stock_name_and_spec_dict,
+            init_price_name_and_spec_dict=init_price_name_and_spec_dict,
+            horizon=manual_simulation_steps,
+            dt=dt,
+        ) if schedule_mode in DISPATCH_RULE_LIST else None
 
         """观测空间"""
         # 任意类的机器，最多的schedule选择数
@@ -94,11 +184,29 @@ class FactoryEnv(gym.Env):
         self.mat_num = len(init_stock_name_and_spec_dict)
         self.dev_num = len(self.device_id_and_spec_dict)
         self.price_num = len(init_price_name_and_spec_dict)
-        self.visible_order_num = 50
-
+        self.visible_order_num = visible_order_num
+        # 在售产品（price_sell > 0），需求分桶与实时指标按它统计
+        self.sell_product_names = [
+            name for name, spec in init_price_name_and_spec_dict.items()
+            if spec["price_sell"] > 0
+        ]
+
+        self.dict_observation_space = self.get_dict_observation_space()
+        # 字段名 -> (slice, one-hot类别数或None)
+        self.flat_obs_layout = self.get_flat_obs_layout()
+        self.flat_obs_dim = sum(slc.stop - slc.start for slc, _ in self.flat_obs_layout.values())
         self.observation_space = self.get_observation_space()
         self.action_space = self.get_action_space()
 
+        """实时指标，跨 episode 共用一块共享内存"""
+        self.telemetry_writer = None
+        if telemetry_sample_every is not None:
+            self.telemetry_writer = TelemetryWriter(
+                product_names=self.sell_product_names,
+                sample_every=telemetry_sample_every,
+                tag=self.run_name,
+            )
+
         """factory_sim封装"""
         self.sim = self.get_init_factory_sim()
 
@@ -106,6 +214,55 @@ class FactoryEnv(gym.Env):
         self.reset_cnt = 0
 
     def get_observation_space(self):
+        if self.obs_mode == "flat":
+            return spaces.Box(
+                np.finfo(np.float32).min,
+                np.finfo(np.float32).max,
+                (self.flat_obs_dim,),
+                np.float32,
+            )
+        return self.dict_observation_space
+
+    def get_flat_obs_layout(self):
+        """
+        flat 观测布局，按 dict 观测空间的字段顺序依次排列：
+        · Box 字段原样占 shape[0] 位
+        · MultiDiscrete 字段（order_name, dev_state, dev_bind_recipe）one-hot 展开，
+          第 i 个元素占 [i * n_cls, (i + 1) * n_cls) 位
+        例如默认配置: order_name 50*3 | order_quantity 50 | order_due_time 50 | price_sell 18 |
+        price_storage_cost_per_time_unit 18 | stock_quantity 16 | total_energy 1 | step_energy 1 |
+        dev_state 25*2 | total_balance 1 | step_balance 1 | clock 1 | dev_bind_recipe 25*12
+        """
+        rst = {}
+        start = 0
+        for name, space in self.dict_observation_space.spaces.items():
+            if isinstance(space, spaces.MultiDiscrete):
+                n_cls = int(space.nvec[0])
+                size = len(space.nvec) * n_cls
+            else:
+                n_cls = None
+                size = space.shape[0]
+            rst[name] = (slice(start, start + size), n_cls)
+            start += size
+        return rst
+
+    def get_flat_observation(self, obs_dict):
+        """把 get_observation_1() 的 dict 按 flat_obs_layout 写进一个 float32 向量"""
+        rst = np.zeros(self.flat_obs_dim, dtype=np.float32)
+        for name, (slc, n_cls) in self.flat_obs_layout.items():
+            v = obs_dict[name]
+            if n_cls is None:
+                rst[slc] = v
+            else:
+                rst[slc.start + np.arange(len(v)) * n_cls + v] = 1.0
+        return rst
+
+    def get_observation_by_mode(self, obs_dict):
+        if self.obs_mode == "flat":
+            return self.get_flat_observation(obs_dict)
+        return obs_dict
+
+    def get_dict_observation_space(self):
         min_np_float32 = np.finfo(np.float32).min
         max_np_float32 = np.finfo(np.float32).max
         """
@@ -196,19 +353,30 @@ class FactoryEnv(gym.Env):
                 ),
                 "dev_bind_recipe": spaces.MultiDiscrete(
                     [len(self.recipe_name_and_spec_dict)] * self.dev_num,
-                )
+                ),
+                # 只在 demand_bucket_horizons 不为 None 时存在：[产品0 各桶, 产品1 各桶, ...]
+                **({
+                    "demand_buckets": spaces.Box(
+                        0.0,
+                        max_np_float32,
+                        (len(self.sell_product_names) * len(self.demand_bucket_horizons),),
+                        np.float32,
+                    )
+                } if self.demand_bucket_horizons is not None else {}),
+                # 只在 decision_mode="event" 时存在：本次 step() 推进的模拟时长
+                **({
+                    "elapsed_time": spaces.Box(
+                        0.0,
+                        max_np_float32,
+                        (1,),
+                        np.float32,
+                    )
+                } if self.decision_mode == "event" else {}),
             }
         )
 
     def get_observation_1(self):
         """
-        传入
-        "order_name", "order_quantity", "order_due_time",
-        "price_name", "price_buy", "price_sell" ,"price_storage_cost_per_time_unit"
-        "stock_name", "stock_quantity"
-        "total_energy", "step_energy", "total_balance", "step_balance", "clock"
-        "dev_id", "dev_state", "dev_bind_recipe"
-
         返回
         order_name: ndarray int
         order_quantity: ndarray float
@@ -224,75 +392,33 @@ class FactoryEnv(gym.Env):
         dev_state: 1d array float
         dev_bind_recipe: 1d array int
 
+        增量构造：各管理器按脏标记 / 版本号缓存观测数组，只重算上次取观测以来变过的部分：
+        价格只在改价后重建；库存只更新增减过的材料；设备只更新开工、完工、换绑定的；
+        可见订单窗口只在订单簿有进出时重取，否则只重算剩余时间。返回的数组都是副本。
+        全量重建的版本见 get_obs_0()
         """
-        d = self.get_obs_0()
-
-        # 去掉无用字段
-        """
-        "order_name", "order_quantity", "order_due_time",
-        "price_buy", "price_sell" ,"price_storage_cost_per_time_unit"
-        "stock_quantity"
-        "total_energy", "step_energy", "total_balance", "step_balance", "clock"
-        "dev_state", "dev_bind_recipe"
-        """
-        d = {
-            k: v for k, v in d.items()
-            if k not in ["price_name", "stock_name", "dev_id", "price_buy"]  # TODO
-        }
-
-        # order 截取前20个
-        cut_off = self.visible_order_num
-        o_n = d["order_name"]
-        o_q = d["order_quantity"]
-        o_dt = d["order_due_time"]
-        if len(o_n) > cut_off:
-            d["order_name"] = o_n[:cut_off]
-            d["order_quantity"] = o_q[:cut_off]
-            d["order_due_time"] = o_dt[:cut_off]
-        elif len(o_q) < cut_off:
-            diffr = cut_off - len(o_n)
-            d["order_name"] += [None] * diffr
-            d["order_quantity"] += [0] * diffr
-            d["order_due_time"] += [-1] * diffr
-
-        temp = {"Motor": 0, "Frame": 1, None: 2}
-        d["order_name"] = np.array([temp[i] for i in d["order_name"]], dtype=np.int64)
-
-        # 所有能转为array的，price，order_q, order_due_time 和 stock_quantity
-        array_list = ["order_quantity", "order_due_time", "price_buy", "price_sell",
-                      "price_storage_cost_per_time_unit", "stock_quantity"]
-        # 都是标量，转为一维numpy数组，"total_energy", "step_energy", "total_balance", "step_balance", "clock"
-        scalar_float_list = ["total_energy", "step_energy", "total_balance", "step_balance"]
-        scalar_int_list = ["clock"]
-        for k, v in d.items():
-            if k in array_list:
-                d[k] = np.array(v, dtype=np.float32)
-            if k in scalar_float_list:
-                d[k] = np.array([v], dtype=np.float32)
-            if k in scalar_int_list:
-                d[k] = np.array([v], dtype=np.int32)
-
-        # 转换dev_state
-        d["dev_state"] = np.array(
-            [
-                0 if i is DevState.IDLE else 1
-                for i in d["dev_state"]
-            ],
-            dtype=np.int32
-        )
-
-        temp_2 = {}
-        for i, k in enumerate(self.recipe_name_and_obj_dict):
-            temp_2[k] = i
-        d["dev_bind_recipe"] = np.array(
-            [temp_2[i] for i in d["dev_bind_recipe"]],
-            dtype=np.int32
+        sim = self.sim
+        d = {}
+        d["order_name"], d["order_quantity"], d["order_due_time"] = sim.order_mng.get_visible_window_obs(
+            self.visible_order_num, ORDER_NAME_AND_IDX_DICT,
         )
+        d["price_sell"], d["price_storage_cost_per_time_unit"] = sim.price_mng.get_price_obs()
+        d["stock_quantity"] = sim.stock_mng.get_quantity_obs()
+        d["total_energy"] = np.array([sim.total_energy_kwh_used], dtype=np.float32)
+        d["step_energy"] = np.array([sim.step_energy_kwh_used], dtype=np.float32)
+        d["total_balance"] = np.array([sim.total_balance], dtype=np.float32)
+        d["step_balance"] = np.array([sim.step_balance], dtype=np.float32)
+        d["clock"] = np.array([sim.clock], dtype=np.int32)
+        d["dev_state"], d["dev_bind_recipe"] = sim.get_dev_obs()
+
+        if self.demand_bucket_horizons is not None:
+            d["demand_buckets"] = sim.order_mng.demand_buckets.get_observation()
 
         return d
 
     def get_obs_0(self):
         """
+        各管理器全量重建的环境状态列表，不在每步的观测路径上，调试和核对 get_observation_1() 用
         "order_name", "order_quantity", "order_due_time",
         "price_name", "price_buy", "price_sell" ,"price_storage_cost_per_time_unit"
         "stock_name", "stock_quantity"
@@ -300,7 +426,7 @@ class FactoryEnv(gym.Env):
         "dev_id", "dev_state", "dev_bind_recipe"
         :return:
         """
-        order_env = self.sim.order_mng.get_env_status()
+        order_env = self.sim.order_mng.get_visible_window_env_status(self.visible_order_num)
         price_env = self.sim.price_mng.get_env_status()
         stock_env = self.sim.stock_mng.get_env_status()
         dev_and_other_env = self.sim.get_env_status()
@@ -324,11 +450,22 @@ class FactoryEnv(gym.Env):
             init_money=self.init_money,
             manual_simulation_steps=self.simulation_steps,
             dt=self.dt,
+            enable_fast_forward=self.fast_forward,
+            visible_order_sort=self.visible_order_sort,
+            random_order_num=self.random_order_num,
+            order_seed=self.order_seed,
+            order_stream_spec=self.order_stream_spec,
+            demand_bucket_horizons=self.demand_bucket_horizons,
+            telemetry_writer=self.telemetry_writer,
+            history_config=self.history_config,
+            record_history=self.record_history,
         )
 
     def step(self, action):
         """
         :param action: ndarray, [1, 3, 4, 0, ...], 一维数组表示每个机器的调度选择
+        动作应用一次后连续推进 decision_interval 步，中间不构造观测、不算掩码。
+        后续步里，决策时正在运行（只能选 None）的机器在空闲后继续做当前绑定配方；其余机器沿用本次动作。
         """
         # 应用动作
         action_dict = self.get_action_dict_from_ndarray(action_array=action)
@@ -337,35 +474,183 @@ class FactoryEnv(gym.Env):
             dev_id_and_dev_runtime_dict=self.sim.dev_id_and_dev_runtime_dict,
             recipe_name_and_obj_dict=self.recipe_name_and_obj_dict,
         )
-
-        # 运行一步
-        self.sim.high_level_step(self.scheduler)
-        # 观测、奖励、终止标志、额外信息
-        obs = self.get_observation_1()
-
-        reward = obs["step_balance"].item()
-        done = obs["clock"].item() >= self.simulation_steps  # 如果要模拟有限时任务，可以在这里判断
+        repeat_plan = self.get_repeat_schedule_plan(action_dict)
+        if self.decision_mode == "event":
+            event_watcher = DecisionEventWatcher(self.sim, repeat_plan)
+            max_steps = self.max_event_wait
+        else:
+            event_watcher = None
+            max_steps = self.decision_interval
+
+        # 运行到下一个决策点，奖励累计
+        reward = 0.0
+        elapsed_steps = 0
+        while elapsed_steps < max_steps:
+            if elapsed_steps == 1:
+                self.scheduler.change_schedule_plan(schedule_plan=repeat_plan)
+            self.sim.high_level_step(self.scheduler)
+            reward += self.sim.step_balance
+            elapsed_steps += 1
+            if self.sim.clock >= self.simulation_steps:
+                break
+            if event_watcher is not None and event_watcher.check_after_step(self.sim):
+                break
+
+        # 观测、终止标志、额外信息
+        obs_dict = self.get_observation_1()
+        if self.decision_mode == "event":
+            obs_dict["elapsed_time"] = np.array([elapsed_steps * self.dt], dtype=np.float32)
+
+        done = obs_dict["clock"].item() >= self.simulation_steps  # 如果要模拟有限时任务，可以在这里判断
         truncated = False
-        info = obs
-        return obs, reward, done, truncated, info
+        info = obs_dict
+        if done:
+            info = {
+                **obs_dict,
+                "episode_metrics": self.sim.price_mng.order_sell_result_mng.episode_metrics.to_info_dict(),
+            }
+        return self.get_observation_by_mode(obs_dict), reward, done, truncated, info
+
+    def get_repeat_schedule_plan(self, action_dict):
+        rst = {}
+        for dev_id, dev_schedule in action_dict.items():
+            dev_rt = self.sim.dev_id_and_dev_runtime_dict[dev_id]
+            if dev_schedule is None and dev_rt.state is DevState.RUNNING:
+                rst[dev_id] = dev_rt.bind_recipe.name
+            else:
+                rst[dev_id] = dev_schedule
+        return rst
 
     def reset(self, **kwargs):
         if self.reset_cnt > 0:
-            draw_dashboard(self.sim.history_recorder)
-            draw_gantt(
-                self.sim.history_recorder,
-                recipe_obj_list=self.recipe_name_and_obj_dict.values(),
-            )
-            for i in self.sim.price_mng.order_sell_result_mng.total_result:
-                i.print_info()
-            self.sim.history_recorder.save_to_excel()
-            print("-------------------------------------\n")
+            self.save_episode_artifacts()
         self.reset_cnt += 1
 
         super().reset()
         # 重新实例化模拟器，库存／时钟归零
         self.sim = self.get_init_factory_sim()
-        return self.get_observation_1(), {}
+        obs_dict = self.get_observation_1()
+        if self.decision_mode == "event":
+            obs_dict["elapsed_time"] = np.zeros(1, dtype=np.float32)
+        return self.get_observation_by_mode(obs_dict), {}
+
+    def close(self):
+        if self.telemetry_writer is not None:
+            self.telemetry_writer.close()
+        super().close()
+
+    def save_checkpoint(self, path, include_history=False):
+        """
+        存当前 episode 的完整状态：模拟器、调度计划、reset 次数、gym 的随机数流，
+        用同样参数构造的 FactoryEnv 调 load_checkpoint() 后续跑，与不中断运行逐位一致。
+        :param include_history: 是否连同 HistoryRecorder 一起存；record_history 为 False 的 env 没有历史可存
+        """
+        meta, arrays = get_sim_state(self.sim, include_history=include_history)
+        meta["env"] = {
+            "reset_cnt": self.reset_cnt,
+            "schedule_plan": self.scheduler.schedule_plan,
+            "runtime_bind": self.scheduler.runtime_bind_of_device_id_and_rcp_name_dict,
+            "rebound_dev_id_list": self.scheduler.rebound_dev_id_list,
+            "np_random_state": get_rng_state(self._np_random),
+            "action_space_np_random_state": get_rng_state(self.action_space._np_random),
+        }
+        save_checkpoint(path, meta, arrays)
+
+    def load_checkpoint(self, path):
+        meta, arrays = load_checkpoint(path)
+        assert ("steady/base_period" in arrays) == self.fast_forward, "checkpoint 与本环境的 fast_forward 设置不一致"
+        self.sim = build_sim_from_state(
+            meta,
+            arrays,
+            recipe_name_and_obj_dict=self.recipe_name_and_obj_dict,
+            telemetry_writer=self.telemetry_writer,
+        )
+        env_state = meta["env"]
+        self.reset_cnt = env_state["reset_cnt"]
+        self.scheduler.change_schedule_plan(schedule_plan=env_state["schedule_plan"])
+        self.scheduler.runtime_bind_of_device_id_and_rcp_name_dict = env_state["runtime_bind"]
+        self.scheduler.rebound_dev_id_list = env_state["rebound_dev_id_list"]
+        self._np_random = build_rng_from_state(env_state["np_random_state"])
+        self.action_space._np_random = build_rng_from_state(env_state["action_space_np_random_state"])
+
+    def get_run_id(self):
+        return f"{self.run_name}-ep{self.reset_cnt:05d}"
+
+    def get_run_log_meta(self):
+        return {
+            "run_id": self.get_run_id(),
+            "device_spec_dict": self.device_id_and_spec_dict,
+            "recipe_spec_dict": self.recipe_name_and_spec_dict,
+            "schedule_mode": self.schedule_mode,
+            "simulation_steps": self.simulation_steps,
+        }
+
+    def get_run_params(self):
+        """登记表里记录的 episode 参数；除 order_seed 外都参与 config_hash"""
+        return {
+            "schedule_mode": self.schedule_mode,
+            "simulation_steps": self.simulation_steps,
+            "order_seed": self.order_seed,
+            "random_order_num": self.random_order_num,
+            "order_stream_spec": self.order_stream_spec,
+            "demand_bucket_horizons": self.demand_bucket_horizons,
+            "fast_forward": self.fast_forward,
+            "obs_mode": self.obs_mode,
+            "visible_order_num": self.visible_order_num,
+            "visible_order_sort": self.visible_order_sort,
+            "decision_interval": self.decision_interval,
+            "decision_mode": self.decision_mode,
+        }
+
+    def register_run(self, artifact_path_dict):
+        if self.run_registry_path is None:
+            return
+        if self.run_registry is None:
+            self.run_registry = RunRegistry(self.run_registry_path)
+        params = self.get_run_params()
+        config = {
+            "device_spec_dict": self.device_id_and_spec_dict,
+            "recipe_spec_dict": self.recipe_name_and_spec_dict,
+            "init_stock_spec_dict": self.init_stock_name_and_spec_dict,
+            "init_bind_dict": self.init_bind_of_device_id_and_rcp_name_dict,
+            "init_price_spec_dict": self.init_price_name_and_spec_dict,
+            "init_money": self.init_money,
+            "dt": self.dt,
+            **{k: v for k, v in params.items() if k != "order_seed"},
+        }
+        metrics = self.sim.get_result()
+        metrics["on_time_rate"] = self.sim.price_mng.order_sell_result_mng.episode_metrics.to_info_dict()[
+            "total/on_time_rate"]
+        self.run_registry.register_run(
+            self.get_run_id(), params, metrics, artifact_path_dict, config_hash=get_config_hash(config),
+        )
+
+    def save_episode_artifacts(self):
+        if self.artifact_mode == "none":
+            return
+        run_id = self.get_run_id()
+        hr = self.sim.history_recorder
+        if self.artifact_mode == "log":
+            run_dir = os.path.join(run_log_folder, run_id)
+            hr.save_run_log(run_dir, meta=self.get_run_log_meta())
+            self.register_run({"run_log": run_dir})
+            return
+
+        artifact_path_dict = {
+            "status_dashboard": f"../pics/{run_id}-status_dashboard.png",
+            "gantt": f"../pics/{run_id}-gantt.png",
+        }
+        draw_dashboard(hr, save_path=artifact_path_dict["status_dashboard"])
+        draw_gantt(
+            hr,
+            recipe_obj_list=self.recipe_name_and_obj_dict.values(),
+            save_path=artifact_path_dict["gantt"],
+        )
+        print(f"episode metrics: {self.sim.price_mng.order_sell_result_mng.episode_metrics.summary()}")
+        artifact_path_dict["stock_xlsx"], artifact_path_dict["scalar_xlsx"] = hr.save_to_excel()
+        artifact_path_dict["order_result"] = self.sim.price_mng.order_sell_result_mng.result_table.save_to_npz()
+        self.register_run(artifact_path_dict)
+        print("-------------------------------------\n")
 
     def greedy_schedule(self):
         schedule_plan = {}
@@ -381,6 +666,30 @@ class FactoryEnv(gym.Env):
             recipe_name_and_obj_dict=self.recipe_name_and_obj_dict,
         )
 
+    def rule_schedule(self):
+        self.scheduler.change_schedule_plan(schedule_plan=self.rule_dispatcher.get_schedule_plan(self.sim))
+        self.scheduler.apply_plan_to_runtime(
+            dev_id_and_dev_runtime_dict=self.sim.dev_id_and_dev_runtime_dict,
+            recipe_name_and_obj_dict=self.recipe_name_and_obj_dict,
+        )
+
+    def run_greedy(self, simulation_steps):
+        """
+        greedy 方式跑 simulation_steps 步；启用快进时，进入稳态后按整周期跳过。
+        规则调度模式下每步改用规则出计划（不支持快进）
+        """
+        end_clock = self.sim.clock + simulation_steps * self.dt
+        while self.sim.clock < end_clock:
+            if self.rule_dispatcher is not None:
+                self.rule_schedule()
+            else:
+                self.greedy_schedule()
+            self.sim.high_level_step(self.scheduler)
+            if self.fast_forward:
+                self.sim.try_fast_forward(
+                    max_steps=(end_clock - self.sim.clock) // self.dt
+                )
+
     def get_action_space(self):
         return gym.spaces.MultiDiscrete(
             [self.max_schedule_num] * self.dev_num  # 例子，[5, 3] 表示首个机器能选0~4总共5种状态，第二个能选3种
@@ -404,6 +713,14 @@ class FactoryEnv(gym.Env):
             rst[dev_id] = schedule_choice
         return rst
 
+    def get_action_ndarray_from_dict(self, action_dict):
+        """get_action_dict_from_ndarray 的逆，把 greedy / 规则调度的计划记成动作"""
+        rst = np.zeros(self.dev_num, dtype=np.int64)
+        for i, dev_id in enumerate(self.device_id_and_spec_dict):
+            dev_cat = self.device_id_and_obj_dict[dev_id].category
+            rst[i] = self.scheduler.get_schedule_choice_list_by_category(dev_cat).index(action_dict[dev_id])
+        return rst
+
     def get_my_action_mask(self):
         mask = np.zeros(
             shape=(
@@ -432,8 +749,56 @@ class FactoryEnv(gym.Env):
         return self.get_my_action_mask()["action_mask"].flatten()
 
 
-def get_fac_env():
-    """制造一个RL用的factory_env"""
+class DecisionEventWatcher:
+    """
+    "event" 模式下判断是否到了下一个决策点。step() 应用动作后创建，每个模拟步之后调用 check_after_step()。
+    每台机器是否"需要决策"：
+    · RUNNING: 不需要
+    · IDLE 且计划为配方: 原料不够、卡住时需要（完成一批后原料够就直接续做，不算决策点）
+    · IDLE 且计划为 None: 绑定配方的原料够用时需要
+    任一机器从不需要变为需要，或订单簿有进出（到达或到期结算，按 book_version 判断，同一步有进有出也算），即为决策点。
+    """
+
+    def __init__(self, sim: FactorySim, schedule_plan):
+        self.schedule_plan = schedule_plan
+        # 绑定只在 apply_plan_to_runtime() 里变，watcher 存续期间不变，材料 -> 以它为原料的设备可以预先建好
+        stock_name_and_idx_dict = sim.stock_mng.stock_name_and_idx_dict
+        self.material_idx_and_dev_idx_list_dict = defaultdict(list)
+        for idx, dev_rt in enumerate(sim.dev_rt_list):
+            for material in dev_rt.bind_recipe.inputs:
+                self.material_idx_and_dev_idx_list_dict[stock_name_and_idx_dict[material]].append(idx)
+        sim.stock_mng.pop_changed_idx_set()
+        self.need_decision_list = [self.check_if_need_decision(sim, idx) for idx in range(len(sim.dev_rt_list))]
+        self.book_version = sim.order_mng.book_version
+
+    def check_if_need_decision(self, sim: FactorySim, dev_idx) -> bool:
+        dev_rt = sim.dev_rt_list[dev_idx]
+        if dev_rt.state is DevState.RUNNING:
+            return False
+        startable = dev_rt.check_if_material_enough_to_start_bind_recipe(sim.stock_mng)
+        if self.schedule_plan[sim.dev_id_list[dev_idx]] is None:
+            return startable
+        return not startable
+
+    def check_after_step(self, sim: FactorySim) -> bool:
+        """只重算本步开工、完工的设备，和原料库存变过的设备，其余设备的状态和原料都没变"""
+        if sim.order_mng.book_version != self.book_version:
+            return True
+        dev_idx_set = set(sim.just_finished_dev_idx_list)
+        dev_idx_set.update(sim.just_started_dev_idx_list)
+        for material_idx in sim.stock_mng.pop_changed_idx_set():
+            dev_idx_set.update(self.material_idx_and_dev_idx_list_dict.get(material_idx, ()))
+        rst = False
+        for idx in dev_idx_set:
+            need_decision = self.check_if_need_decision(sim, idx)
+            if need_decision and not self.need_decision_list[idx]:
+                rst = True
+            self.need_decision_list[idx] = need_decision
+        return rst
+
+
+def get_fac_env(obs_mode="dict", decision_interval=1, decision_mode="interval", **kwargs):
+    """制造一个RL用的factory_env，kwargs 原样传给 FactoryEnv（如 artifact_mode、random_order_num）"""
     return FactoryEnv(
         device_id_and_spec_dict=DEVICE_ID_AND_SPEC_DICT,
         recipe_name_and_spec_dict=RECIPE_NAME_AND_SPEC_DICT,
@@ -444,15 +809,25 @@ def get_fac_env():
         init_money=INIT_MONEY,
         schedule_mode="manual",
         dt=1,
-        manual_simulation_steps=500
+        manual_simulation_steps=500,
+        obs_mode=obs_mode,
+        decision_interval=decision_interval,
+        decision_mode=decision_mode,
+        **kwargs,
     )
 
 
-def tst2():
+def get_policy_cls_by_obs_mode(obs_mode):
+    if obs_mode == "flat":
+        return MaskableActorCriticPolicy
+    return MaskableMultiInputActorCriticPolicy
+
+
+def tst2(obs_mode="dict"):
     """RL方式跑"""
-    vec_env = make_vec_env(get_fac_env, n_envs=3)  # DummyVecEnv or SubprocVecEnv
+    vec_env = make_vec_env(get_fac_env, n_envs=3, env_kwargs={"obs_mode": obs_mode})  # DummyVecEnv or SubprocVecEnv
     model = MaskablePPO(
-        MaskableMultiInputActorCriticPolicy,
+        get_policy_cls_by_obs_mode(obs_mode),
         vec_env,
         learning_rate=3e-3,
         n_steps=2048,
@@ -460,7 +835,105 @@ def tst2():
         gamma=0.95,
         verbose=1,
     )
-    model.learn(total_timesteps=2_000_000, tb_log_name="runs/factory")
+    model.learn(
+        total_timesteps=2_000_000,
+        tb_log_name="runs/factory",
+        callback=EpisodeMetricsCallback(),
+    )
+
+
+def tst_obs_mode_throughput(total_timesteps=12_288, n_envs=3):
+    """对比 dict / flat 两种观测模式的训练吞吐：纯环境步速，以及包含 PPO 更新的整体步速"""
+    for obs_mode in ["dict", "flat"]:
+        env = get_fac_env(obs_mode=obs_mode)
+        env.reset()
+        n_env_steps = 2000
+        t0 = time.perf_counter()
+        for _ in range(n_env_steps):
+            # 每台机器选最后一个合法动作
+            mask = env.get_my_action_mask()["action_mask"]
+            env.step((mask * np.arange(env.max_schedule_num)).argmax(axis=1))
+            if env.sim.clock >= env.simulation_steps:
+                env.sim = env.get_init_factory_sim()
+        env_fps = n_env_steps / (time.perf_counter() - t0)
+
+        vec_env = make_vec_env(get_fac_env, n_envs=n_envs, env_kwargs={"obs_mode": obs_mode})
+        model = MaskablePPO(
+            get_policy_cls_by_obs_mode(obs_mode),
+            vec_env,
+            n_steps=2048,
+            batch_size=256,
+            verbose=0,
+        )
+        t0 = time.perf_counter()
+        model.learn(total_timesteps=total_timesteps)
+        learn_time = time.perf_counter() - t0
+        print(
+            f"obs_mode={obs_mode}: env steps/sec = {env_fps:,.0f}, "
+            f"learn {total_timesteps} steps in {learn_time:.1f}s "
+            f"({total_timesteps / learn_time:,.0f} steps/sec incl. update)"
+        )
+
+
+class StopOnEpisodeReturnCallback(BaseCallback):
+    """最近若干个episode的平均回报达到 target_return 时停止训练，并记下用时"""
+
+    def __init__(self, target_return):
+        super().__init__()
+        self.target_return = target_return
+        self.t_start = None
+        self.reach_time = None
+
+    def _on_training_start(self):
+        self.t_start = time.perf_counter()
+
+    def _on_step(self) -> bool:
+        ep_info_buffer = self.model.ep_info_buffer
+        if ep_info_buffer and np.mean([i["r"] for i in ep_info_buffer]) >= self.target_return:
+            self.reach_time = time.perf_counter() - self.t_start
+            return False
+        return True
+
+
+def tst_decision_interval(target_return, max_timesteps=200_000, decision_interval_list=(1, 5, 20)):
+    """对比不同 decision_interval 下训练到目标 episode 回报的墙钟时间"""
+    for k in decision_interval_list:
+        vec_env = make_vec_env(get_fac_env, n_envs=3, env_kwargs={"decision_interval": k})
+        model = MaskablePPO(
+            MaskableMultiInputActorCriticPolicy,
+            vec_env,
+            learning_rate=3e-3,
+            n_steps=2048,
+            batch_size=256,
+            gamma=0.95,
+            verbose=0,
+        )
+        callback = StopOnEpisodeReturnCallback(target_return=target_return)
+        t0 = time.perf_counter()
+        model.learn(total_timesteps=max_timesteps, callback=callback)
+        if callback.reach_time is None:
+            print(f"K={k}: target {target_return} not reached in {time.perf_counter() - t0:.1f}s")
+        else:
+            print(f"K={k}: reached {target_return} in {callback.reach_time:.1f}s")
+
+
+def tst_event_decision_count(n_episode=3):
+    """对比 "interval"(K=1) 与 "event" 模式下每个 episode 的决策次数（即策略前向次数），随机合法动作"""
+    rng = np.random.default_rng(0)
+    for decision_mode in ["interval", "event"]:
+        env = get_fac_env(decision_mode=decision_mode)
+        decision_cnt_list = []
+        for _ in range(n_episode):
+            env.sim = env.get_init_factory_sim()
+            decision_cnt = 0
+            done = False
+            while not done:
+                mask = env.get_my_action_mask()["action_mask"]
+                action = np.array([rng.choice(np.flatnonzero(row)) for row in mask])
+                _, _, done, _, _ = env.step(action)
+                decision_cnt += 1
+            decision_cnt_list.append(decision_cnt)
+        print(f"decision_mode={decision_mode}: decisions per episode = {np.mean(decision_cnt_list):.1f}")
 
 
 # def tst3():
@@ -483,9 +956,7 @@ def tst1():
         dt=1,
         manual_simulation_steps=manual_simulation_steps,
     )
-    for _ in range(manual_simulation_steps):
-        fe.greedy_schedule()
-        fe.sim.high_level_step(fe.scheduler)
+    fe.run_greedy(manual_simulation_steps)
 
     draw_device_topology(fe.device_id_and_obj_dict)
     draw_dashboard(fe.sim.history_recorder)
@@ -2,12 +2,16 @@ from __future__ import annotations
 
 from black.trans import defaultdict
 
+import numpy as np
+
 from pycode.OrderManagerRuntime import OrderManagerRuntime
 from pycode.PriceManagerRuntime import PriceManagerRuntime
 from pycode.Scheduler import Scheduler
 from pycode.StockManagerRuntime import StockManagerRuntime
 from pycode.dev_runtime import DevState, DevRuntime
-from pycode.history_recorder import HistoryRecorder
+from pycode.history_recorder import build_history_recorder
+from pycode.material_wait_index import MaterialWaitIndex
+from pycode.steady_state import SteadyStateDetector
 from pycode.utils import (
     build_dict_of_dev_id_and_dev_runtime_obj,
 )
@@ -25,7 +29,29 @@ class FactorySim:
             init_money,
             manual_simulation_steps,
             dt=1,
+            enable_fast_forward=False,
+            visible_order_sort="earliest_due",
+            random_order_num=50,
+            order_seed=None,
+            order_stream_spec=None,
+            demand_bucket_horizons=None,
+            telemetry_writer=None,
+            history_config=None,
+            record_history=True,
     ):
+        """
+        :param enable_fast_forward: 是否启用稳态检测快进，只适用于 greedy 模式，见 try_fast_forward()
+        :param visible_order_sort: 可见订单窗口的排序，"earliest_due" 或 "highest_value"
+        :param random_order_num: 随机生成的订单数
+        :param order_seed: 随机订单的种子，None 表示不固定
+        :param order_stream_spec: 订单流配置（泊松到达、产品比例、数量与提前期分布），见 order_stream.py；
+            None 表示 random_order_num 个订单全部在 0 时刻到达
+        :param demand_bucket_horizons: 需求分桶的剩余时间上界，如 [10, 60, 300]，按 price_sell > 0 的产品统计；
+            None 表示不统计
+        :param telemetry_writer: TelemetryWriter，按采样间隔把实时指标写进共享内存，None 表示不上报
+        :param history_config: None 表示逐步全量记录历史；否则为 MultiResHistoryRecorder 的构造参数
+        :param record_history: False 时不写历史记录（每步的标量、库存、设备状态都不记），history_recorder 保持为空
+        """
         """复制传入参数为属性"""
         self.dt = dt
 
@@ -42,13 +68,31 @@ class FactorySim:
         # 运行时Price管理器
         self.price_mng = PriceManagerRuntime(init_price_name_and_spec_dict)
         # 运行时Order管理器
-        self.order_mng = OrderManagerRuntime(init_order_list, manual_simulation_steps)
+        self.order_mng = OrderManagerRuntime(
+            init_order_list,
+            manual_simulation_steps,
+            visible_order_sort=visible_order_sort,
+            price_sell_dict={
+                name: price_obj.price_sell
+                for name, price_obj in self.price_mng.runtime_price_name_and_obj_dict.items()
+            },
+            random_order_num=random_order_num,
+            order_seed=order_seed,
+            order_stream_spec=order_stream_spec,
+            demand_product_names=[
+                name for name, price_obj in self.price_mng.runtime_price_name_and_obj_dict.items()
+                if price_obj.price_sell > 0
+            ],
+            demand_bucket_horizons=demand_bucket_horizons,
+        )
 
         self.clock = 0
 
         # 能耗
         self.total_energy_kwh_used = 0.0  # 累计
         self.step_energy_kwh_used = 0.0  # 单步
+        # 累计 "运行中设备数 × 步数"，用于算设备利用率
+        self.total_running_dev_steps = 0
         # 余额
         self.total_balance = init_money
         self.step_balance = 0.0
@@ -56,8 +100,41 @@ class FactorySim:
         self.step_sell_money = 0.0
         self.step_storage_cost = 0.0
 
+        """设备活跃集合"""
+        # 设备按字典顺序编号，集合里存编号，按编号排序遍历即保持原先的设备顺序
+        self.dev_id_list = list(self.dev_id_and_dev_runtime_dict.keys())
+        self.dev_rt_list = list(self.dev_id_and_dev_runtime_dict.values())
+        self.dev_id_and_idx_dict = {dev_id: i for i, dev_id in enumerate(self.dev_id_list)}
+        # 运行中的设备
+        self.running_dev_idx_set = {
+            i for i, dev_rt in enumerate(self.dev_rt_list) if dev_rt.state is DevState.RUNNING
+        }
+        # 空闲且没有挂在唤醒索引上的设备，每步只对它们做开工检查
+        self.idle_candidate_dev_idx_set = set(range(len(self.dev_rt_list))) - self.running_dev_idx_set
+        # 缺料设备的唤醒索引，缺料期间不重复检查
+        self.material_wait_index = MaterialWaitIndex()
+        # 上一步生产完成的设备，本步记录它们的状态变化
+        self.just_finished_dev_idx_list = []
+        # 本步开工的设备，给 DecisionEventWatcher 用
+        self.just_started_dev_idx_list = []
+        self.dev_status_recorded = False
+
+        """设备观测"""
+        # 上次取观测以来状态或绑定可能变了的设备（开工、完工、换绑定），初始为全部
+        self.dirty_dev_idx_set = set(range(len(self.dev_rt_list)))
+        self.recipe_name_and_idx_dict = {name: i for i, name in enumerate(recipe_name_and_obj_dict)}
+        self.dev_state_obs = np.zeros(len(self.dev_rt_list), dtype=np.int32)
+        self.dev_bind_recipe_obs = np.zeros(len(self.dev_rt_list), dtype=np.int32)
+
         """历史记录管理器"""
-        self.history_recorder = HistoryRecorder()
+        self.history_recorder = build_history_recorder(history_config)
+        self.record_history = record_history
+
+        """稳态检测器"""
+        self.steady_state_detector = SteadyStateDetector() if enable_fast_forward else None
+
+        """实时指标上报"""
+        self.telemetry_writer = telemetry_writer
 
     def get_env_status(self):
         env_without_dev = {
@@ -71,18 +148,35 @@ class FactorySim:
         dev_env = defaultdict(list)
         for dev_rt in self.dev_id_and_dev_runtime_dict.values():
             dev_rt: DevRuntime
-            dev_env["dev_id"].append(dev_rt.device)
+            dev_env["dev_id"].append(dev_rt.device.id)
             dev_env["dev_state"].append(dev_rt.state)
             dev_env["dev_bind_recipe"].append(dev_rt.bind_recipe.name)
 
         return {**env_without_dev, **dev_env}
 
-    def record_dev_status(self):
+    def get_dev_obs(self):
+        """(dev_state, dev_bind_recipe)，int32，IDLE 为 0、RUNNING 为 1；只重算变过的设备，返回副本"""
+        if self.dirty_dev_idx_set:
+            for idx in self.dirty_dev_idx_set:
+                dev_rt = self.dev_rt_list[idx]
+                self.dev_state_obs[idx] = 0 if dev_rt.state is DevState.IDLE else 1
+                self.dev_bind_recipe_obs[idx] = self.recipe_name_and_idx_dict[dev_rt.bind_recipe.name]
+            self.dirty_dev_idx_set.clear()
+        return self.dev_state_obs.copy(), self.dev_bind_recipe_obs.copy()
+
+    def record_dev_status(self, dev_idx_list=None):
+        """
+        设备运行状态与甘特，按变化记录：只记录状态可能变化的设备，其余设备沿用上一步的值。
+        :param dev_idx_list: 本步状态可能变化的设备编号，None 表示全部设备
+        """
         h = self.history_recorder
-        # 设备运行状态与甘特
-        for dev_id, dev_rt in self.dev_id_and_dev_runtime_dict.items():
-            h.log_vector("dev_state", dev_id, dev_rt.state.name)
-            h.log_vector(
+        if dev_idx_list is None:
+            dev_idx_list = range(len(self.dev_rt_list))
+        for idx in dev_idx_list:
+            dev_id = self.dev_id_list[idx]
+            dev_rt = self.dev_rt_list[idx]
+            h.log_vector_change("dev_state", dev_id, dev_rt.state.name)
+            h.log_vector_change(
                 "gantt",
                 dev_id,
                 dev_rt.bind_recipe.name
@@ -137,31 +231,71 @@ class FactorySim:
         if self.clock == 59:
             pass
 
-        for dev_id, dev_rt in self.dev_id_and_dev_runtime_dict.items():
-            # 如果调度指示是配方，不是None，且现在状态是IDLE；则检查能否启动
-            schedule_plan = scheduler.schedule_plan[dev_id]
-            if (schedule_plan is not None
-                    and dev_rt.state is DevState.IDLE):
-                if dev_rt.check_if_material_enough_to_start_bind_recipe(self.stock_mng):
-                    dev_rt.start_batch(self.stock_mng)
+        wait_index = self.material_wait_index
+        candidate_set = self.idle_candidate_dev_idx_set
+        running_set = self.running_dev_idx_set
 
-            # TODO 为了测试，暂时注释掉这一段检查
-            # elif schedule_plan is not None and dev_rt.state is DevState.RUNNING:
-            #     raise ValueError("调度计划出错，正在运行的机器不能指定配方，只能调度None")
+        # 换了绑定配方的设备：挂起的重新检查，运行中的甘特要更新
+        rebound_dev_idx_list = [self.dev_id_and_idx_dict[dev_id] for dev_id in scheduler.pop_rebound_dev_ids()]
+        if rebound_dev_idx_list and self.steady_state_detector is not None:
+            self.steady_state_detector.on_rebind()
+        for idx in rebound_dev_idx_list:
+            if idx in wait_index:
+                wait_index.unpark(idx)
+                candidate_set.add(idx)
+        # 缺的材料涨够了的设备重新检查
+        if wait_index:
+            candidate_set.update(wait_index.wake_up(self.stock_mng))
 
-        # 记录本轮机器状态
-        self.record_dev_status()
+        # 开工检查：只看空闲候选，按设备顺序；如果调度指示是配方，不是None，则检查能否启动
+        started_dev_idx_list = []
+        for idx in sorted(candidate_set):
+            if scheduler.schedule_plan[self.dev_id_list[idx]] is None:
+                continue
+            dev_rt = self.dev_rt_list[idx]
+            lacking = dev_rt.get_lacking_material(self.stock_mng)
+            if lacking is None:
+                dev_rt.start_batch(self.stock_mng)
+                started_dev_idx_list.append(idx)
+                running_set.add(idx)
+            else:
+                wait_index.park(idx, *lacking)
+            candidate_set.discard(idx)
 
-        # 计算本步耗电量
-        self.step_energy_kwh_used = 0.0
-        for dev_rt in self.dev_id_and_dev_runtime_dict.values():
-            if dev_rt.state is DevState.RUNNING:
-                # 本步消耗 = 功率(kW)×(dt秒 ÷ 3600秒/时)
-                self.step_energy_kwh_used += dev_rt.bind_recipe.power_kw * (self.dt / 3600)
+        # TODO 为了测试，暂时注释掉这一段检查
+        # elif schedule_plan is not None and dev_rt.state is DevState.RUNNING:
+        #     raise ValueError("调度计划出错，正在运行的机器不能指定配方，只能调度None")
 
-        # tick all devices，用 dt 推进
-        for dev_rt in self.dev_id_and_dev_runtime_dict.values():
+        if self.steady_state_detector is not None:
+            self.steady_state_detector.on_after_start(self)
+
+        # 记录本轮机器状态，只记录可能变化的机器
+        if self.record_history:
+            if self.dev_status_recorded:
+                self.record_dev_status(self.just_finished_dev_idx_list + started_dev_idx_list + rebound_dev_idx_list)
+            else:
+                self.record_dev_status()
+                self.dev_status_recorded = True
+
+        # 运行中的机器一遍完成：本步耗电量 + 用 dt 推进 + 生产完成的产出
+        self.step_energy_kwh_used = 0.0
+        finished_dev_idx_list = []
+        for idx in sorted(running_set):
+            dev_rt = self.dev_rt_list[idx]
+            # 本步消耗 = 功率(kW)×(dt秒 ÷ 3600秒/时)
+            self.step_energy_kwh_used += dev_rt.bind_recipe.power_kw * (self.dt / 3600)
             dev_rt.tick(self.stock_mng, self.dt)
+            if dev_rt.state is DevState.IDLE:
+                finished_dev_idx_list.append(idx)
+        self.total_running_dev_steps += len(running_set)
+
+        running_set.difference_update(finished_dev_idx_list)
+        candidate_set.update(finished_dev_idx_list)
+        self.just_finished_dev_idx_list = finished_dev_idx_list
+        self.just_started_dev_idx_list = started_dev_idx_list
+        self.dirty_dev_idx_set.update(rebound_dev_idx_list)
+        self.dirty_dev_idx_set.update(started_dev_idx_list)
+        self.dirty_dev_idx_set.update(finished_dev_idx_list)
 
         # 总能耗累加
         self.total_energy_kwh_used += self.step_energy_kwh_used
@@ -200,7 +334,42 @@ class FactorySim:
         # )
         self.run_one_step_after_schedule(scheduler)
         self.check_out_money()
-        self.record_step_status_without_dev()
+        if self.record_history:
+            self.record_step_status_without_dev()
         # 全局时钟推进
         self.clock += self.dt
-        pass
+
+        if self.steady_state_detector is not None:
+            self.steady_state_detector.record(self)
+
+        if self.telemetry_writer is not None:
+            self.telemetry_writer.maybe_publish(self)
+
+    def get_utilization(self):
+        """设备利用率：运行中设备·步 / 全部设备·步"""
+        total_dev_steps = len(self.dev_id_and_dev_runtime_dict) * self.clock / self.dt
+        return self.total_running_dev_steps / total_dev_steps if total_dev_steps else 0.0
+
+    def get_fill_rate(self):
+        """订单满足率：已售数量 / 到期订单需求数量"""
+        table = self.price_mng.order_sell_result_mng.result_table
+        need = table.get_column("need_to_sell_quantity").sum()
+        return table.get_column("sold_quantity").sum() / need if need else 1.0
+
+    def get_result(self) -> dict:
+        """一个 episode 结束时的评估指标"""
+        return dict(
+            final_balance=self.total_balance,
+            total_energy=self.total_energy_kwh_used,
+            fill_rate=self.get_fill_rate(),
+            utilization=self.get_utilization(),
+        )
+
+    def try_fast_forward(self, max_steps):
+        """
+        若已进入周期稳态，直接跳过整数个周期，返回跳过的步数。
+        调用方需保证调度是 greedy（绑定固定，计划只由设备状态决定），否则跳过的区间不成立。
+        """
+        if self.steady_state_detector is None:
+            return 0
+        return self.steady_state_detector.try_fast_forward(self, max_steps)
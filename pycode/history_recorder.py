@@ -1,13 +1,18 @@
 import datetime
+import json
+import numbers
 import os.path
 from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from pycode.utils import now_time
 
 log_folder = "../logs"
+# 每个 episode 一个子目录: history.npz + meta.json，供离线画图
+run_log_folder = "../logs/runs"
 
 
 class HistoryRecorder:
@@ -15,6 +20,8 @@ class HistoryRecorder:
     统一收集所有随时间变动的标量 / 向量数据。
     · 标量: 余额、累计能耗等 —— 存到 self.scalar_logs[name] -> list
     · 向量: 库存、设备状态等 —— 存到 self.vector_logs[group][key] -> list
+    · 保持型向量: 设备状态等很少变化的量，只在值变化时 log_vector_change()，读取时按前值补齐到每一步
+    · 稳态快进跳过的区间不立即展开，只登记 (插入位置, 周期, 重复次数)，读取时再按周期补齐
     """
 
     def __init__(self):
@@ -23,6 +30,22 @@ class HistoryRecorder:
         self.scalar_logs = defaultdict(list)
         # {group: {key: [v0,v1]}}
         self.vector_logs = defaultdict(lambda: defaultdict(list))
+        # [(raw_list中的插入位置, period, n_period), ...]
+        self.pending_repeats = []
+        self.pending_repeat_steps = 0
+        # 保持型向量 {group: {key: [(raw_list中的位置, value), ...]}}，以及每个key最近一次的值
+        self.held_vector_changes = defaultdict(lambda: defaultdict(list))
+        self.held_vector_last = defaultdict(dict)
+        # 原始列表开头已经丢掉的步数，只有 MultiResHistoryRecorder 会丢
+        self.trimmed_steps = 0
+
+    def get_config(self):
+        """构造参数，checkpoint 靠它建回同类的记录器；None 表示逐步全量记录"""
+        return None
+
+    def get_raw_len(self):
+        """原始列表现有的步数：扣掉登记了但尚未展开的快进区间，以及开头已丢掉的步数"""
+        return self.step_counter - self.pending_repeat_steps - self.trimmed_steps
 
     # ---------- 写入接口 ----------
     def log_scalar(self, name, value):
@@ -31,29 +54,405 @@ class HistoryRecorder:
     def log_vector(self, group, key, value):
         self.vector_logs[group][key].append(value)
 
+    def log_vector_change(self, group, key, value):
+        """保持型向量：本步起取值为 value，直到下一次变化；与上次相同则忽略"""
+        last_dict = self.held_vector_last[group]
+        if key in last_dict and last_dict[key] == value:
+            return
+        last_dict[key] = value
+        self.held_vector_changes[group][key].append((self.get_raw_len(), value))
+
     def next_step(self):
         self.step_counter += 1
 
+    def repeat_last_period(self, period, n_period):
+        """登记：把最近 period 步再重复 n_period 次。数值序列按最近一个周期的增量线性外推，其余原样重复。"""
+        # 插入位置以原始列表为准，扣掉之前登记但尚未展开的部分
+        raw_pos = self.get_raw_len()
+        self.pending_repeats.append((raw_pos, period, n_period))
+        self.pending_repeat_steps += period * n_period
+        self.step_counter += period * n_period
+
+    def materialize_held_vectors(self):
+        """保持型向量按变化点补齐到当前原始步数（本步尚未 next_step 的变化留到下次）"""
+        raw_len = self.get_raw_len()
+        for group, key_and_last_dict in self.held_vector_last.items():
+            for key in key_and_last_dict:
+                changes = self.held_vector_changes[group][key]
+                lst = self.vector_logs[group][key]
+                i = 0
+                while i < len(changes) and changes[i][0] < raw_len:
+                    pos, value = changes[i]
+                    if lst:
+                        lst.extend([lst[-1]] * (pos - len(lst)))
+                    lst.append(value)
+                    i += 1
+                del changes[:i]
+                if lst:
+                    lst.extend([lst[-1]] * (raw_len - len(lst)))
+
+    def materialize_repeats(self):
+        self.materialize_held_vectors()
+        if not self.pending_repeats:
+            return
+        for name, lst in self.scalar_logs.items():
+            self.scalar_logs[name] = expand_repeats(lst, self.pending_repeats)
+        for group in self.vector_logs.values():
+            for key, lst in group.items():
+                group[key] = expand_repeats(lst, self.pending_repeats)
+        self.pending_repeats.clear()
+        self.pending_repeat_steps = 0
+
     # ---------- 读取接口 ----------
     def get_scalar(self, name):
+        self.materialize_repeats()
         return self.scalar_logs[name]
 
     def get_vector(self, group, key):
+        self.materialize_repeats()
         return self.vector_logs[group][key]
 
+    def get_vector_group(self, group):
+        self.materialize_repeats()
+        return self.vector_logs[group]
+
     def scalar_to_dataframe(self):
         """把全量标量指标拼成 DataFrame，便于外部分析"""
+        self.materialize_repeats()
         return pd.DataFrame(self.scalar_logs)
 
     def vector_to_dataframe(self, vector):
+        self.materialize_repeats()
         return pd.DataFrame(self.vector_logs[vector])
 
     def save_to_excel(self):
+        """返回 (stock.xlsx 路径, scalar.xlsx 路径)"""
         df = self.vector_to_dataframe("stock")
-        f_name = os.path.join(log_folder, f"{now_time()}-stock.xlsx")
-        df.to_excel(f_name, index=False)
+        stock_f_name = os.path.join(log_folder, f"{now_time()}-stock.xlsx")
+        df.to_excel(stock_f_name, index=False)
 
         df = self.scalar_to_dataframe()
-        f_name = os.path.join(log_folder, f"{now_time()}-scalar.xlsx")
-        df.to_excel(f_name, index=False)
+        scalar_f_name = os.path.join(log_folder, f"{now_time()}-scalar.xlsx")
+        df.to_excel(scalar_f_name, index=False)
+        return stock_f_name, scalar_f_name
+
+    def get_extra_run_log(self) -> tuple[dict, dict]:
+        """子类额外要存进 run log 的 (meta, 数组)"""
+        return {}, {}
+
+    def save_run_log(self, run_dir, meta: dict):
+        """
+        全量历史存成 run_dir/history.npz，键为 scalar/<name> 与 vector/<group>/<key>；
+        字符串序列里的 None 存为空串。meta 存成 run_dir/meta.json。子类额外的数组和元信息见 get_extra_run_log()。
+        """
+        self.materialize_repeats()
+        os.makedirs(run_dir, exist_ok=True)
+        extra_meta, arrays = self.get_extra_run_log()
+        meta = {**meta, **extra_meta}
+        for name, lst in self.scalar_logs.items():
+            arrays[f"scalar/{name}"] = np.asarray(lst)
+        for group, key_and_list_dict in self.vector_logs.items():
+            for key, lst in key_and_list_dict.items():
+                if lst and not is_number(lst[0]):
+                    lst = ["" if v is None else v for v in lst]
+                arrays[f"vector/{group}/{key}"] = np.asarray(lst)
+        np.savez_compressed(os.path.join(run_dir, "history.npz"), **arrays)
+        with open(os.path.join(run_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+
+# 多分辨率聚合的四个量在最后一维的位置
+AGG_MIN, AGG_MAX, AGG_MEAN, AGG_LAST = range(4)
+# 保持型向量聚合的是"非空闲"占比：取值为这些时算空闲（设备状态 IDLE，甘特里没在做的 None）
+HELD_IDLE_VALUE_SET = {None, "IDLE"}
+DEFAULT_HISTORY_LEVELS = (10, 60, 600)
+# 攒够这么多步再一起聚合成最细一级的桶，均摊每次聚合的固定开销
+ROLL_BATCH_STEPS = 200
+
+
+class MultiResHistoryRecorder(HistoryRecorder):
+    """
+    多分辨率历史：最近 recent_window 步保留逐步原始值（读写接口同 HistoryRecorder，get_scalar 等只返回这一段），
+    更早的只留逐级降采样的聚合，供长 run 的 dashboard 和分析用。
+    · 聚合对象: 数值标量、数值向量（库存）每桶存 min / max / mean / last；保持型向量（设备状态、甘特）存"非空闲"占比的同样四个量。
+      序列名同 save_run_log 的键: scalar/<name>、vector/<group>/<key>
+    · 写入时增量聚合: 每 ROLL_BATCH_STEPS 步把凑满的最细一级桶用原始列表的尾部一次算出；粗一级的桶由细一级的 ratio 个桶合并
+    · 除最粗一级外每级只留最近 level_capacity 个桶；最粗一级超过 level_capacity 时再加一级 level_factor 倍粗的，
+      内存约为 recent_window 步原始值 + 级数 × level_capacity 个桶，级数随总步数对数增长
+    · 快进登记的重复区间立即展开再聚合（代价与跳过的步数成正比，但展开的部分不再常驻），快进周期须小于 recent_window 的一半
+    """
+
+    def __init__(self, levels=DEFAULT_HISTORY_LEVELS, recent_window=3600, level_capacity=2000, level_factor=10):
+        super().__init__()
+        levels = list(levels)
+        assert all(b % a == 0 for a, b in zip(levels, levels[1:])), f"每级桶长须是上一级的整数倍: {levels}"
+        assert level_capacity >= max([b // a for a, b in zip(levels, levels[1:])] + [level_factor]), \
+            "level_capacity 须不小于相邻两级的倍数，否则合并时细一级的桶已被丢掉"
+        self.config = {
+            "levels": list(levels), "recent_window": recent_window,
+            "level_capacity": level_capacity, "level_factor": level_factor,
+        }
+        self.recent_window = recent_window
+        self.level_capacity = level_capacity
+        self.level_factor = level_factor
+
+        # 每级的桶长（步）、桶列表（每个桶是 float64[序列数, 4]）、已丢掉的桶数、累计产出的桶数
+        self.level_steps = levels
+        self.level_rows = [[] for _ in levels]
+        self.level_start = [0] * len(levels)
+        self.level_total = [0] * len(levels)
+        # 已经聚合进最细一级的步数，每攒够 roll_every 步聚合一次
+        self.rolled_steps = 0
+        self.roll_every = levels[0] * max(1, ROLL_BATCH_STEPS // levels[0])
+        # 聚合的序列名，第一次聚合时按当时的序列定下，之后不能再加
+        self.series_name_list = None
+
+    def get_config(self):
+        return self.config
+
+    # ---------- 写入 ----------
+    def next_step(self):
+        self.step_counter += 1
+        if self.step_counter - self.rolled_steps >= self.roll_every:
+            self.roll_up()
+
+    def repeat_last_period(self, period, n_period):
+        assert 2 * period <= self.recent_window, f"快进周期 {period} 超过原始窗口的一半，无法外推"
+        super().repeat_last_period(period, n_period)
+        self.materialize_repeats()
+        self.roll_up()
+
+    def roll_up(self):
+        """把凑满的最细一级桶聚合掉，逐级合并，再丢掉原始窗口以外的原始值；读取前也先调一次，把攒着的桶聚合掉"""
+        b = self.level_steps[0]
+        n_bucket = (self.step_counter - self.rolled_steps) // b
+        if n_bucket == 0:
+            return
+        self.materialize_held_vectors()
+        lo = self.rolled_steps - self.trimmed_steps
+        rows = self.aggregate_raw(lo, lo + n_bucket * b, n_bucket)
+        self.rolled_steps += n_bucket * b
+        for row in rows:
+            self.push_bucket(0, row)
+        while len(self.level_rows[-1]) > self.level_capacity:
+            self.add_coarser_level()
+        self.trim_raw()
+
+    def get_raw_series_dict(self) -> dict:
+        """{序列名: 原始列表}，数值向量与保持型向量都在 vector_logs 里（后者已展开）"""
+        rst = {f"scalar/{name}": lst for name, lst in self.scalar_logs.items()}
+        for group, key_and_list_dict in self.vector_logs.items():
+            for key, lst in key_and_list_dict.items():
+                if group in self.held_vector_last or (lst and is_number(lst[0])):
+                    rst[f"vector/{group}/{key}"] = lst
+        return rst
+
+    def aggregate_raw(self, lo, hi, n_bucket):
+        """原始列表 [lo, hi) 均分成 n_bucket 个桶，返回 float64[n_bucket, 序列数, 4]"""
+        raw_series_dict = self.get_raw_series_dict()
+        if self.series_name_list is None:
+            self.series_name_list = list(raw_series_dict)
+        assert list(raw_series_dict) == self.series_name_list, "多分辨率历史不支持中途新增序列"
+        value_list = []
+        for name, lst in raw_series_dict.items():
+            seg = lst[lo:hi]
+            if name.startswith("vector/") and name.split("/")[1] in self.held_vector_last:
+                seg = [v not in HELD_IDLE_VALUE_SET for v in seg]
+            value_list.append(seg)
+        arr = np.asarray(value_list, dtype=np.float64).reshape(len(value_list), n_bucket, -1)
+        rst = np.empty((n_bucket, len(value_list), 4))
+        rst[:, :, AGG_MIN] = arr.min(axis=2).T
+        rst[:, :, AGG_MAX] = arr.max(axis=2).T
+        rst[:, :, AGG_MEAN] = arr.mean(axis=2).T
+        rst[:, :, AGG_LAST] = arr[:, :, -1].T
+        return rst
+
+    def push_bucket(self, i, row):
+        rows = self.level_rows[i]
+        rows.append(row)
+        self.level_total[i] += 1
+        if i + 1 < len(self.level_steps):
+            ratio = self.level_steps[i + 1] // self.level_steps[i]
+            if self.level_total[i] % ratio == 0:
+                self.push_bucket(i + 1, merge_buckets(np.stack(rows[-ratio:])))
+            # 非最粗一级：攒够 1/4 容量再成批丢，均摊 O(1)
+            n_drop = len(rows) - self.level_capacity
+            if n_drop > self.level_capacity // 4:
+                del rows[:n_drop]
+                self.level_start[i] += n_drop
+
+    def add_coarser_level(self):
+        """最粗一级从 0 步起的桶都在，按 level_factor 个一组合并出更粗的一级"""
+        rows = self.level_rows[-1]
+        n = len(rows) // self.level_factor
+        stacked = np.stack(rows[:n * self.level_factor]).reshape(n, self.level_factor, *rows[0].shape)
+        self.level_steps.append(self.level_steps[-1] * self.level_factor)
+        self.level_rows.append([merge_buckets(group) for group in stacked])
+        self.level_start.append(0)
+        self.level_total.append(n)
+
+    def trim_raw(self):
+        """原始值超出 recent_window 1/4 以上时，把已聚合的部分丢到只剩 recent_window 步"""
+        raw_len = self.get_raw_len()
+        if raw_len <= self.recent_window * 5 // 4:
+            return
+        n_drop = min(raw_len - self.recent_window, self.rolled_steps - self.trimmed_steps)
+        for lst in self.scalar_logs.values():
+            del lst[:n_drop]
+        for key_and_list_dict in self.vector_logs.values():
+            for lst in key_and_list_dict.values():
+                del lst[:n_drop]
+        # 还没展开的变化点（本步记下、尚未 next_step）跟着平移
+        for key_and_changes_dict in self.held_vector_changes.values():
+            for changes in key_and_changes_dict.values():
+                changes[:] = [(pos - n_drop, value) for pos, value in changes]
+        self.trimmed_steps += n_drop
+
+    # ---------- 读取 ----------
+    def get_tail_bucket(self, i):
+        """第 i 级还没凑满的最后一个桶: (float64[序列数, 4], 步数)，没有则 (None, 0)"""
+        if i == 0:
+            lo = self.rolled_steps - self.trimmed_steps
+            hi = self.get_raw_len()
+            if hi <= lo or self.series_name_list is None:
+                return None, 0
+            self.materialize_held_vectors()
+            return self.aggregate_raw(lo, hi, 1)[0], hi - lo
+        ratio = self.level_steps[i] // self.level_steps[i - 1]
+        n_full = self.level_total[i - 1] - self.level_total[i] * ratio
+        part_list = [(row, self.level_steps[i - 1]) for row in self.level_rows[i - 1][len(self.level_rows[i - 1]) - n_full:]]
+        tail_row, tail_steps = self.get_tail_bucket(i - 1)
+        if tail_row is not None:
+            part_list.append((tail_row, tail_steps))
+        if not part_list:
+            return None, 0
+        return merge_buckets(np.stack([r for r, _ in part_list]), [n for _, n in part_list]), sum(n for _, n in part_list)
+
+    def get_level_view(self, i) -> dict:
+        """
+        第 i 级的全部桶（含最后一个没凑满的），{序列名: float64[桶数, 4]}，最后一维按 AGG_MIN / AGG_MAX / AGG_MEAN / AGG_LAST
+        """
+        self.materialize_repeats()
+        self.roll_up()
+        row_list = list(self.level_rows[i])
+        tail_row, _ = self.get_tail_bucket(i)
+        if tail_row is not None:
+            row_list.append(tail_row)
+        if not row_list:
+            return {}
+        data = np.stack(row_list)
+        return {name: data[:, j, :] for j, name in enumerate(self.series_name_list)}
+
+    def pick_level(self, max_points):
+        """
+        画全程用哪一级：原始值还没丢过时返回 None（直接用原始值）；否则取从 0 步起完整、
+        桶数不超过 max_points 的最细一级，都超过则取最粗一级
+        """
+        self.roll_up()
+        if self.trimmed_steps == 0:
+            return None
+        complete_level_list = [i for i, start in enumerate(self.level_start) if start == 0]
+        for i in complete_level_list:
+            if self.level_total[i] + 1 <= max_points:
+                return i
+        return complete_level_list[-1]
+
+    # ---------- 存取 ----------
+    def get_extra_run_log(self):
+        level_meta, level_arrays = self.get_level_state()
+        return {"multires_history": level_meta}, level_arrays
+
+    def get_level_state(self) -> tuple[dict, dict]:
+        """(json 可存的元信息, {"level/<i>": float64[桶数, 序列数, 4]})"""
+        self.roll_up()
+        n_series = len(self.series_name_list or [])
+        meta = {
+            "config": self.config,
+            "level_steps": self.level_steps,
+            "level_start": self.level_start,
+            "level_total": self.level_total,
+            "rolled_steps": self.rolled_steps,
+            "trimmed_steps": self.trimmed_steps,
+            "series_name_list": self.series_name_list,
+        }
+        arrays = {
+            f"level/{i}": np.stack(rows) if rows else np.zeros((0, n_series, 4))
+            for i, rows in enumerate(self.level_rows)
+        }
+        return meta, arrays
+
+    def set_level_state(self, meta, arrays):
+        self.level_steps = list(meta["level_steps"])
+        self.level_start = list(meta["level_start"])
+        self.level_total = list(meta["level_total"])
+        self.rolled_steps = meta["rolled_steps"]
+        self.trimmed_steps = meta["trimmed_steps"]
+        self.series_name_list = meta["series_name_list"]
+        self.level_rows = [list(arrays[f"level/{i}"]) for i in range(len(self.level_steps))]
+
+
+def build_history_recorder(config=None) -> HistoryRecorder:
+    """config 为 None 时逐步全量记录，否则为 MultiResHistoryRecorder 的构造参数"""
+    return HistoryRecorder() if config is None else MultiResHistoryRecorder(**config)
+
+
+def merge_buckets(rows, steps_list=None):
+    """rows: float64[k, 序列数, 4] 时间上相邻的 k 个桶合并成一个；steps_list 为各桶步数，None 表示等长"""
+    rst = np.empty(rows.shape[1:])
+    rst[:, AGG_MIN] = rows[:, :, AGG_MIN].min(axis=0)
+    rst[:, AGG_MAX] = rows[:, :, AGG_MAX].max(axis=0)
+    rst[:, AGG_MEAN] = np.average(rows[:, :, AGG_MEAN], axis=0, weights=steps_list)
+    rst[:, AGG_LAST] = rows[-1, :, AGG_LAST]
+    return rst
+
+
+def load_run_log(run_dir):
+    """save_run_log 的逆操作，返回 (HistoryRecorder, meta)；多分辨率的 run log 还原成 MultiResHistoryRecorder"""
+    with open(os.path.join(run_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    level_meta = meta.get("multires_history")
+    hr = HistoryRecorder() if level_meta is None else MultiResHistoryRecorder(**level_meta["config"])
+    with np.load(os.path.join(run_dir, "history.npz")) as data:
+        if level_meta is not None:
+            hr.set_level_state(level_meta, data)
+        for k in data.files:
+            kind, rest = k.split("/", 1)
+            if kind == "level":
+                continue
+            arr = data[k]
+            if arr.dtype.kind == "U":
+                lst = [None if v == "" else str(v) for v in arr]
+            else:
+                lst = arr.tolist()
+            if kind == "scalar":
+                hr.scalar_logs[rest] = lst
+            else:
+                group, key = rest.split("/", 1)
+                hr.vector_logs[group][key] = lst
+                if level_meta is not None and lst and not is_number(lst[0]):
+                    # 多分辨率聚合要区分保持型向量（按非空闲占比聚合），run log 里只有字符串序列是保持型的
+                    hr.held_vector_last[group][key] = lst[-1]
+    hr.step_counter = len(hr.scalar_logs["time"]) + hr.trimmed_steps
+    return hr, meta
+
+
+def expand_repeats(lst, pending_repeats):
+    rst = []
+    prev_pos = 0
+    for pos, period, n_period in pending_repeats:
+        rst.extend(lst[prev_pos:pos])
+        prev_pos = pos
+        base = rst[-period:]
+        before_base = rst[-2 * period:-period]
+        for j in range(1, n_period + 1):
+            for v, v_before in zip(base, before_base):
+                if is_number(v) and is_number(v_before):
+                    rst.append(v + (v - v_before) * j)
+                else:
+                    rst.append(v)
+    rst.extend(lst[prev_pos:])
+    return rst
+
 
+def is_number(v):
+    return isinstance(v, numbers.Number) and not isinstance(v, bool)
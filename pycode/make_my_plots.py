@@ -5,16 +5,28 @@ import matplotlib.pyplot as plt
 import networkx as nx
 
 from pycode.data_class import Device
-from pycode.history_recorder import HistoryRecorder
+from pycode.history_recorder import AGG_MAX, AGG_MEAN, AGG_MIN, HistoryRecorder, MultiResHistoryRecorder
 from pycode.utils import now_time
 
+# 多分辨率历史画全程时最多画多少个点，约为图宽的像素数
+DASHBOARD_MAX_POINTS = 2000
+
+
+def draw_dashboard(hr: HistoryRecorder, save_path=None, max_points=DASHBOARD_MAX_POINTS):
+    """
+    MultiResHistoryRecorder 的原始值已经丢掉一部分时，自动改用 pick_level(max_points) 选出的那一级聚合画全程：
+    曲线为每桶均值，min~max 画成同色阴影带，设备状态画成每桶的运行占比
+    """
+    level_idx = hr.pick_level(max_points) if isinstance(hr, MultiResHistoryRecorder) else None
+    if level_idx is not None:
+        draw_dashboard_from_level(hr, level_idx, save_path)
+        return
 
-def draw_dashboard(hr: HistoryRecorder):
     time_list = hr.get_scalar("time")
     fig, axs = plt.subplots(5, 1, figsize=(11, 16), sharex=True)
 
     # ① 库存
-    for stock_name, list_of_quantity_by_time in hr.vector_logs["stock"].items():
+    for stock_name, list_of_quantity_by_time in hr.get_vector_group("stock").items():
         if any(list_of_quantity_by_time):
             axs[0].plot(time_list, list_of_quantity_by_time, label=stock_name)
     axs[0].set_ylabel("Inventory")
@@ -23,7 +35,7 @@ def draw_dashboard(hr: HistoryRecorder):
     # ② 设备状态
     state_code = {"IDLE": 0, "RUNNING": 1}
     offset = 0
-    for dev_id, seq in hr.vector_logs["dev_state"].items():
+    for dev_id, seq in hr.get_vector_group("dev_state").items():
         axs[1].step(
             time_list,
             [state_code[s] + offset for s in seq],
@@ -47,10 +59,56 @@ def draw_dashboard(hr: HistoryRecorder):
     axs[4].set_ylabel("ΔCash")
     axs[4].set_xlabel("Time")
 
+    save_dashboard(fig, save_path)
+
+
+def plot_with_band(ax, time_arr, agg, label=None):
+    """agg: float64[桶数, 4]，画均值线和 min~max 阴影带"""
+    line, = ax.plot(time_arr, agg[:, AGG_MEAN], label=label)
+    ax.fill_between(time_arr, agg[:, AGG_MIN], agg[:, AGG_MAX], color=line.get_color(), alpha=0.25, linewidth=0)
+
+
+def draw_dashboard_from_level(hr: MultiResHistoryRecorder, level_idx, save_path=None):
+    """布局同 draw_dashboard，数据取第 level_idx 级聚合"""
+    view = hr.get_level_view(level_idx)
+    time_arr = view["scalar/time"][:, AGG_MEAN]
+    fig, axs = plt.subplots(5, 1, figsize=(11, 16), sharex=True)
+    axs[0].set_title(f"{hr.level_steps[level_idx]}-step buckets: mean, min-max band")
+
+    # ① 库存
+    for name, agg in view.items():
+        if name.startswith("vector/stock/") and agg[:, [AGG_MIN, AGG_MAX]].any():
+            plot_with_band(axs[0], time_arr, agg, label=name.split("/", 2)[2])
+    axs[0].set_ylabel("Inventory")
+    axs[0].legend()
+
+    # ② 设备运行占比
+    offset = 0
+    for name, agg in view.items():
+        if name.startswith("vector/dev_state/"):
+            axs[1].step(time_arr, agg[:, AGG_MEAN] + offset, where="post", label=name.split("/", 2)[2])
+            offset += 3
+    axs[1].set_ylabel("Dev running share")
+
+    # ③ 能耗 ④ 余额 ⑤ 单步现金流
+    for ax, name, ylabel in zip(
+            axs[2:],
+            ["scalar/total_energy", "scalar/total_balance", "scalar/step_balance"],
+            ["kWh", "Balance", "ΔCash"],
+    ):
+        plot_with_band(ax, time_arr, view[name])
+        ax.set_ylabel(ylabel)
+    axs[4].set_xlabel("Time")
+
+    save_dashboard(fig, save_path)
+
+
+def save_dashboard(fig, save_path=None):
     plt.tight_layout()
     # plt.show()
 
-    save_path = f"../pics/{now_time()}-status_dashboard.png"
+    if save_path is None:
+        save_path = f"../pics/{now_time()}-status_dashboard.png"
     fig.savefig(save_path, dpi=150)
     print(f"status_dashboard image saved to {save_path}")
 
@@ -59,6 +117,7 @@ def draw_dashboard(hr: HistoryRecorder):
 
 def draw_device_topology(
         devices: dict[str, Device],
+        save_path=None,
 ) -> None:
     """
     按 category 分列绘图：
@@ -111,12 +170,13 @@ def draw_device_topology(
     fig.show()
     plt.close(fig)
 
-    save_path = "../pics/device_topology.png"
+    if save_path is None:
+        save_path = "../pics/device_topology.png"
     fig.savefig(save_path, dpi=150)
     print(f"Topology image saved to {save_path}")
 
 
-def draw_gantt(hr: HistoryRecorder, recipe_obj_list) -> None:
+def draw_gantt(hr: HistoryRecorder, recipe_obj_list, save_path=None) -> None:
     """Draw a coloured-bar Gantt chart: each machine-row shows when it ran which recipe."""
     # ---------- colour dictionary ----------
     recipe_set = {r.name for r in recipe_obj_list}
@@ -127,10 +187,12 @@ def draw_gantt(hr: HistoryRecorder, recipe_obj_list) -> None:
     # ---------- time base ----------
     t_series = hr.get_scalar("time")
     dt = t_series[1] - t_series[0] if len(t_series) > 1 else 1
+    # 多分辨率历史只有最近一段原始值，不从 0 开始
+    t_start = t_series[0] if t_series else 0
 
     # ---------- 只保留真正执行过作业的机器 ----------
     active_rows = [
-        (dev_id, seq) for dev_id, seq in hr.vector_logs["gantt"].items()
+        (dev_id, seq) for dev_id, seq in hr.get_vector_group("gantt").items()
         if any(r is not None for r in seq)
     ]
     n_rows = len(active_rows)
@@ -147,20 +209,20 @@ def draw_gantt(hr: HistoryRecorder, recipe_obj_list) -> None:
             if hr != current:
                 if current is not None:  # 结束上一段
                     ax.broken_barh(
-                        [(start * dt, (idx - start) * dt)],
+                        [(t_start + start * dt, (idx - start) * dt)],
                         (y - 0.4, 0.8),
                         facecolors=color_of[current],
                     )
                 current, start = hr, idx
         if current is not None:  # 收尾
             ax.broken_barh(
-                [(start * dt, (len(rec_seq) - start) * dt)],
+                [(t_start + start * dt, (len(rec_seq) - start) * dt)],
                 (y - 0.4, 0.8),
                 facecolors=color_of[current],
             )
         # 行标签
         ax.text(
-            -20,
+            t_start - 20,
             y,
             dev_id,
             va="center",
@@ -181,7 +243,8 @@ def draw_gantt(hr: HistoryRecorder, recipe_obj_list) -> None:
     plt.tight_layout()
     # plt.show()
 
-    save_path = f"../pics/{now_time()}-gantt.png"
+    if save_path is None:
+        save_path = f"../pics/{now_time()}-gantt.png"
     fig.savefig(save_path, dpi=150)
     print(f"Gantt image saved to {save_path}")
 
@@ -0,0 +1,47 @@
+class MaterialWaitIndex:
+    """
+    缺料设备的唤醒索引：材料 -> 需求量 -> 等待中的设备。
+    设备开工检查失败时，挂在它缺的第一种材料上；之后只有该材料库存涨到需求量以上才会被唤醒、重新做完整检查。
+    · 绑定配方被换掉的设备由调用方 unpark，照常检查。
+    · 唤醒直接比较当前库存，不依赖库存变化的来源（产出、快进外推等）。
+    · 开工检查期间库存只减不增，所以本tick开始时没被唤醒的设备，本tick内一定仍然缺料。
+    """
+
+    def __init__(self):
+        # 设备 -> (材料名, 需求量)
+        self.parked_dev_dict = {}
+        # 材料名 -> {需求量: {设备, ...}}
+        self.material_and_need_and_dev_set_dict = {}
+
+    def __len__(self):
+        return len(self.parked_dev_dict)
+
+    def __contains__(self, dev):
+        return dev in self.parked_dev_dict
+
+    def park(self, dev, material, need_quantity):
+        self.parked_dev_dict[dev] = (material, need_quantity)
+        need_dict = self.material_and_need_and_dev_set_dict.setdefault(material, {})
+        need_dict.setdefault(need_quantity, set()).add(dev)
+
+    def unpark(self, dev):
+        material, need_quantity = self.parked_dev_dict.pop(dev)
+        need_dict = self.material_and_need_and_dev_set_dict[material]
+        dev_set = need_dict[need_quantity]
+        dev_set.discard(dev)
+        if not dev_set:
+            del need_dict[need_quantity]
+            if not need_dict:
+                del self.material_and_need_and_dev_set_dict[material]
+
+    def wake_up(self, stock_mng) -> list:
+        """把库存已够需求量的设备移出索引并返回，代价只和 (材料, 需求量) 的种类数有关"""
+        woken_dev_list = []
+        for material, need_dict in self.material_and_need_and_dev_set_dict.items():
+            quantity = stock_mng.get_obj_by_name(material).quantity
+            for need_quantity, dev_set in need_dict.items():
+                if quantity >= need_quantity:
+                    woken_dev_list.extend(dev_set)
+        for dev in woken_dev_list:
+            self.unpark(dev)
+        return woken_dev_list
@@ -0,0 +1,99 @@
+"""
+内存画像：用 tracemalloc 量三个数
+· 每个 env：同一进程里再多建一个 FactoryEnv（已 reset）增加的字节数；第一个 env 另算，含进程内共用的静态配置对象
+· 每个订单：订单簿里每个未结订单的字节数（含订单流数组）
+· 每个历史步：greedy 跑一步增加的字节数（主要是 HistoryRecorder），以及读取时把保持型向量、快进区间展开后的字节数；
+  给 --history-levels 时改量多分辨率历史（MultiResHistoryRecorder），总字节数随步数近似对数增长
+用法: python -m pycode.memory_profile [--n-envs 8] [--n-orders 100000] [--history-steps 5000] [--history-levels 10 60 600]
+"""
+import argparse
+import gc
+import tracemalloc
+
+
+def measure(fn):
+    """返回 (fn 的返回值, 调用期间增加并仍存活的字节数)"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    rst = fn()
+    gc.collect()
+    return rst, tracemalloc.get_traced_memory()[0] - before
+
+
+def build_env():
+    from pycode.factory_env import get_fac_env
+
+    env = get_fac_env(artifact_mode="none")
+    env.reset()
+    return env
+
+
+def profile_env(n_envs):
+    import pycode.factory_env  # noqa: F401 模块导入不算进 env
+
+    first_env, first_bytes = measure(build_env)
+    env_list, rest_bytes = measure(lambda: [build_env() for _ in range(n_envs)])
+    return {"first_env_bytes": first_bytes, "bytes_per_env": rest_bytes / n_envs}
+
+
+def profile_order(n_orders):
+    from pycode.OrderManagerRuntime import OrderManagerRuntime
+
+    spec = {
+        "arrival": {"process": "at_start", "num": n_orders},
+        "product_mix": ["Motor", "Frame"],
+        "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+        "lead_time": {"dist": "uniform", "low": 1, "high": 1_000_000},
+    }
+    rst = {}
+    for sort in ("earliest_due", "highest_value"):
+        order_mng, n_bytes = measure(lambda: OrderManagerRuntime(
+            [], 1_000_000, visible_order_sort=sort, price_sell_dict={"Motor": 800, "Frame": 300},
+            order_stream_spec=spec, order_seed=0,
+        ))
+        assert len(order_mng) == n_orders
+        rst[f"bytes_per_order_{sort}"] = n_bytes / n_orders
+    return rst
+
+
+def profile_history(history_steps, history_levels=None):
+    from pycode.factory_env import FactoryEnv
+    from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+    env = FactoryEnv(
+        **build_env_kwargs({**DEFAULT_PARAMS, "simulation_steps": history_steps}),
+        artifact_mode="none",
+        record_history=True,
+        history_config=None if history_levels is None else {"levels": history_levels},
+    )
+
+    _, record_bytes = measure(lambda: env.run_greedy(history_steps))
+    _, materialize_bytes = measure(env.sim.history_recorder.materialize_repeats)
+    return {
+        "bytes_per_history_step": record_bytes / history_steps,
+        "bytes_per_history_step_materialized": (record_bytes + materialize_bytes) / history_steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tracemalloc 内存画像")
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--n-orders", type=int, default=100_000)
+    parser.add_argument("--history-steps", type=int, default=5000)
+    parser.add_argument("--history-levels", type=int, nargs="+", default=None, help="多分辨率历史各级的桶长（步）")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    report = {
+        **profile_env(args.n_envs),
+        **profile_order(args.n_orders),
+        **profile_history(args.history_steps, args.history_levels),
+    }
+    tracemalloc.stop()
+    for k, v in report.items():
+        print(f"{k:36s} {v:14,.1f}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
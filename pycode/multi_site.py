@@ -0,0 +1,341 @@
+"""
+多厂区模拟：每个厂区是一个独立的 FactoryEnv/FactorySim（自己的库存、设备、订单），各占一个进程；
+厂区之间用运输线（lane）互送中间品（锭、棒、管…）。
+· lane: 从 src 厂区把 material 运到 dst 厂区，每步最多运 capacity，在途 delay 步；src 只运 reserve 以上的富余库存
+· 保守时间窗同步：所有 lane 的 delay >= 窗口长 W 时，窗口内发出的货最早在下个窗口才到，
+  各厂区可以互不等待地连跑 W 步，窗口末尾同步一次；W = 1 即逐步同步。结果与 W 无关
+· 进程间只交换运输增量：一块共享内存 float64[lane 数, 2, W]，每个 lane 每步的发货量，src 写、dst 读。
+  两份缓冲按窗口奇偶交替，每个窗口只需一次 barrier：dst 读第 k 窗口的缓冲时，src 已在写另一份，
+  而 src 要再写这份得先过第 k+1 个 barrier，那时 dst 早已读完
+· mode="inproc" 在本进程里依次推进所有厂区，结果与多进程一致，用于对照和单核基线
+· 多核扩展性（1..N 个厂区跨核的加速比）尚未实测，这部分还没有完成：bench 目前只在单核机器上跑过，
+  各厂区进程轮流占同一个核，只能看出同步开销不大。bench 在厂区数超过可用核数时不报加速比
+
+厂区配置 yaml:
+sites:
+  - name: plant_a
+    params: {scheduler: greedy, order_seed: 0}   # 同 sweep_runner 的覆盖项
+    init_stock: {SteelTube: 100}                 # 可选，覆盖初始库存数量
+  - name: plant_b
+lanes:
+  - {src: plant_a, dst: plant_b, material: SteelTube, delay: 30, capacity: 2, reserve: 20}
+
+用法:
+python -m pycode.multi_site run [--spec sites.yaml] [--sites 4] [--steps 5000] [--window 30] [--mode proc]
+python -m pycode.multi_site bench [--sites 1 2 4 8] [--steps 5000] [--window 30]
+不给 --spec 时用 --sites 个默认厂区连成环，每个厂区把富余的 SteelTube 运给下一个
+"""
+import argparse
+import copy
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+from pycode.utils import attach_shared_memory, load_yaml
+
+DEFAULT_LANE = {"delay": 30, "capacity": 1, "reserve": 0}
+BARRIER_TIMEOUT = 600
+
+
+class ShardError(RuntimeError):
+    """厂区进程出错，带回该进程的 traceback"""
+
+
+def build_ring_spec(n_sites, material="SteelTube", delay=30, capacity=1, reserve=20) -> dict:
+    """n_sites 个默认厂区（订单种子各不相同）连成环，每个厂区把 material 运给下一个"""
+    site_list = [{"name": f"site{i}", "params": {"order_seed": i}} for i in range(n_sites)]
+    lane_list = [] if n_sites < 2 else [
+        {"src": f"site{i}", "dst": f"site{(i + 1) % n_sites}", "material": material,
+         "delay": delay, "capacity": capacity, "reserve": reserve}
+        for i in range(n_sites)
+    ]
+    return {"sites": site_list, "lanes": lane_list}
+
+
+def normalize_spec(spec: dict) -> tuple[list[dict], list[dict]]:
+    """补全默认值并检查：厂区名唯一，lane 两端的厂区和材料存在"""
+    site_list = [
+        {"name": site["name"], "params": {**DEFAULT_PARAMS, **site.get("params", {})},
+         "init_stock": site.get("init_stock", {})}
+        for site in spec["sites"]
+    ]
+    site_name_and_idx_dict = {site["name"]: i for i, site in enumerate(site_list)}
+    assert len(site_name_and_idx_dict) == len(site_list), "厂区名重复"
+    lane_list = []
+    for lane in spec.get("lanes") or []:
+        lane = {**DEFAULT_LANE, **lane}
+        assert lane["src"] in site_name_and_idx_dict and lane["dst"] in site_name_and_idx_dict, f"lane {lane} 的厂区不存在"
+        assert lane["src"] != lane["dst"], f"lane {lane} 的两端是同一个厂区"
+        assert lane["delay"] >= 1, "lane 的在途时间至少 1 步，否则无法按窗口同步"
+        lane_list.append({**lane, "src_idx": site_name_and_idx_dict[lane["src"]],
+                          "dst_idx": site_name_and_idx_dict[lane["dst"]]})
+    return site_list, lane_list
+
+
+def get_max_window(lane_list, simulation_steps) -> int:
+    """保守窗口的上限：最短的在途时间；没有 lane 时各厂区完全独立，一个窗口跑完"""
+    return min((lane["delay"] for lane in lane_list), default=simulation_steps)
+
+
+class SiteShard:
+    """一个厂区：FactoryEnv + 出入的 lane。出货在每步模拟之后，到货在到达那一步模拟之前"""
+
+    def __init__(self, site_idx, site, lane_list):
+        from pycode.factory_env import FactoryEnv
+
+        params = {**site["params"], "fast_forward": False}
+        env_kwargs = build_env_kwargs(params)
+        if site["init_stock"]:
+            stock_dict = copy.deepcopy(env_kwargs["init_stock_name_and_spec_dict"])
+            for name, quantity in site["init_stock"].items():
+                stock_dict[name]["quantity"] = quantity
+            env_kwargs["init_stock_name_and_spec_dict"] = stock_dict
+        self.env = FactoryEnv(**env_kwargs, artifact_mode="none", run_registry_path=None)
+        self.name = site["name"]
+        self.simulation_steps = params["simulation_steps"]
+
+        # (lane 编号, lane)
+        self.out_lane_list = [(i, lane) for i, lane in enumerate(lane_list) if lane["src_idx"] == site_idx]
+        self.in_lane_list = [(i, lane) for i, lane in enumerate(lane_list) if lane["dst_idx"] == site_idx]
+        for _, lane in self.out_lane_list + self.in_lane_list:
+            assert lane["material"] in self.env.sim.stock_mng.stock_name_and_idx_dict, \
+                f"厂区 {self.name} 没有材料 {lane['material']}"
+        # 到达时刻 -> [(材料, 数量)]
+        self.arrival_dict = defaultdict(list)
+        self.shipped_dict = defaultdict(float)
+        self.received_dict = defaultdict(float)
+
+    def run_window(self, n_steps, out_buf):
+        """
+        连跑 n_steps 步，把每步各出向 lane 的发货量写进 out_buf[lane 编号, 窗口内第几步]
+        :param out_buf: 本窗口的 lane 缓冲，float64[lane 数, W]
+        """
+        env = self.env
+        stock_mng = env.sim.stock_mng
+        for lane_idx, _ in self.out_lane_list:
+            out_buf[lane_idx, :] = 0.0
+        for j in range(n_steps):
+            for material, quantity in self.arrival_dict.pop(env.sim.clock, ()):
+                stock_mng.add_stock(material, quantity)
+                self.received_dict[material] += quantity
+            env.run_greedy(1)
+            for lane_idx, lane in self.out_lane_list:
+                quantity = min(lane["capacity"], max(stock_mng.get_obj_by_name(lane["material"]).quantity - lane["reserve"], 0))
+                if quantity <= 0:
+                    continue
+                stock_mng.remove_stock(lane["material"], quantity)
+                self.shipped_dict[lane["material"]] += quantity
+                out_buf[lane_idx, j] = quantity
+
+    def collect_inbound(self, in_buf, window_start_clock, n_steps):
+        """读本窗口各入向 lane 的发货量，按 发货时刻 + delay 排进到货表"""
+        dt = self.env.dt
+        for lane_idx, lane in self.in_lane_list:
+            for j in np.flatnonzero(in_buf[lane_idx, :n_steps]):
+                arrive_clock = window_start_clock + (int(j) + lane["delay"]) * dt
+                self.arrival_dict[arrive_clock].append((lane["material"], float(in_buf[lane_idx, j])))
+
+    def get_result(self) -> dict:
+        return {
+            "site": self.name,
+            "simulation_steps": self.env.sim.clock // self.env.dt,
+            **self.env.sim.get_result(),
+            "shipped": dict(self.shipped_dict),
+            "received": dict(self.received_dict),
+            # 已发往本厂区、模拟结束时还在路上的量
+            "inbound_in_transit": sum(q for arrival_list in self.arrival_dict.values() for _, q in arrival_list),
+        }
+
+
+def iter_window(simulation_steps, window):
+    """(窗口序号, 窗口起点的步数, 窗口步数)"""
+    for k, t0 in enumerate(range(0, simulation_steps, window)):
+        yield k, t0, min(window, simulation_steps - t0)
+
+
+def run_inproc(site_list, lane_list, simulation_steps, window) -> tuple[list[dict], float]:
+    """本进程里按窗口依次推进所有厂区，返回 (各厂区结果, 模拟耗时)"""
+    shard_list = [SiteShard(i, site, lane_list) for i, site in enumerate(site_list)]
+    lane_buf = np.zeros((len(lane_list), 2, window), dtype=np.float64)
+    t0_wall = time.perf_counter()
+    for k, t0, n in iter_window(simulation_steps, window):
+        for shard in shard_list:
+            shard.run_window(n, lane_buf[:, k % 2])
+        for shard in shard_list:
+            shard.collect_inbound(lane_buf[:, k % 2], t0 * shard.env.dt, n)
+    wall = time.perf_counter() - t0_wall
+    return [shard.get_result() for shard in shard_list], wall
+
+
+def run_shard_process(site_idx, site_list, lane_list, simulation_steps, window, shm_name,
+                      start_barrier, sync_barrier, rst_queue):
+    try:
+        shm = attach_shared_memory(shm_name)
+        lane_buf = np.ndarray((len(lane_list), 2, window), dtype=np.float64, buffer=shm.buf)
+        shard = SiteShard(site_idx, site_list[site_idx], lane_list)
+        # 各厂区都建好环境后一起开跑，计时不含进程启动和建环境
+        start_barrier.wait(BARRIER_TIMEOUT)
+        t0_wall = time.perf_counter()
+        for k, t0, n in iter_window(simulation_steps, window):
+            shard.run_window(n, lane_buf[:, k % 2])
+            sync_barrier.wait(BARRIER_TIMEOUT)
+            shard.collect_inbound(lane_buf[:, k % 2], t0 * shard.env.dt, n)
+        rst = {**shard.get_result(), "wall": time.perf_counter() - t0_wall}
+        del lane_buf
+        shm.close()
+        rst_queue.put((site_idx, rst))
+    except Exception:
+        # 让其余厂区从 barrier 上退出，不要一直等
+        start_barrier.abort()
+        sync_barrier.abort()
+        rst_queue.put((site_idx, ShardError(f"厂区 {site_list[site_idx]['name']} pid={os.getpid()}\n{traceback.format_exc()}")))
+
+
+def run_proc(site_list, lane_list, simulation_steps, window) -> tuple[list[dict], float]:
+    """每个厂区一个进程，共享内存交换运输增量，返回 (各厂区结果, 模拟耗时)"""
+    n_sites = len(site_list)
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * len(lane_list) * 2 * window, 8))
+    start_barrier = mp.Barrier(n_sites + 1)
+    sync_barrier = mp.Barrier(n_sites)
+    rst_queue = mp.Queue()
+    proc_list = [
+        mp.Process(
+            target=run_shard_process,
+            args=(i, site_list, lane_list, simulation_steps, window, shm.name, start_barrier, sync_barrier, rst_queue),
+            daemon=True,
+        )
+        for i in range(n_sites)
+    ]
+    try:
+        for proc in proc_list:
+            proc.start()
+        try:
+            start_barrier.wait(BARRIER_TIMEOUT)
+        except threading.BrokenBarrierError:
+            pass
+        t0_wall = time.perf_counter()
+        rst_list = [None] * n_sites
+        for _ in range(n_sites):
+            try:
+                site_idx, rst = rst_queue.get(timeout=BARRIER_TIMEOUT)
+            except queue.Empty:
+                raise ShardError(f"{BARRIER_TIMEOUT}s 内没有收到厂区结果，进程退出码: {[p.exitcode for p in proc_list]}")
+            if isinstance(rst, ShardError):
+                raise rst
+            rst_list[site_idx] = rst
+        wall = time.perf_counter() - t0_wall
+        for proc in proc_list:
+            proc.join()
+    finally:
+        for proc in proc_list:
+            if proc.is_alive():
+                proc.terminate()
+        shm.close()
+        shm.unlink()
+    return rst_list, wall
+
+
+def run_multi_site(spec: dict, simulation_steps=None, window=None, mode="proc") -> tuple[list[dict], float]:
+    """
+    :param simulation_steps: None 时取各厂区 params 里的 simulation_steps（须一致）
+    :param window: 同步窗口步数，None 取允许的最大值（最短 lane 在途时间）
+    :param mode: "proc" 每厂区一个进程；"inproc" 本进程依次推进
+    """
+    site_list, lane_list = normalize_spec(spec)
+    if simulation_steps is None:
+        step_set = {site["params"]["simulation_steps"] for site in site_list}
+        assert len(step_set) == 1, f"各厂区的 simulation_steps 不一致: {step_set}"
+        simulation_steps = step_set.pop()
+    for site in site_list:
+        site["params"]["simulation_steps"] = simulation_steps
+    max_window = get_max_window(lane_list, simulation_steps)
+    window = max_window if window is None else window
+    assert 1 <= window <= max_window, f"同步窗口 {window} 超过最短 lane 在途时间 {max_window}，窗口内的到货会被漏掉"
+    if mode == "inproc":
+        return run_inproc(site_list, lane_list, simulation_steps, window)
+    return run_proc(site_list, lane_list, simulation_steps, window)
+
+
+def print_result(rst_list, wall):
+    print(f"{'site':12s} {'balance':>14s} {'energy':>10s} {'fill_rate':>10s} {'util':>6s}  shipped / received")
+    for r in rst_list:
+        print(
+            f"{r['site']:12s} {r['final_balance']:14,.1f} {r['total_energy']:10,.1f} {r['fill_rate']:10.3f} "
+            f"{r['utilization']:6.3f}  {r['shipped']} / {r['received']}"
+        )
+    total_balance = sum(r["final_balance"] for r in rst_list)
+    site_steps = sum(r["simulation_steps"] for r in rst_list)
+    print(f"total balance {total_balance:,.1f}, {site_steps / wall:,.0f} site-steps/s ({wall:.2f}s)")
+
+
+def get_usable_cpu_num():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def bench(site_num_list, simulation_steps, window):
+    """
+    1..N 个厂区的扩展性：多进程与单进程的模拟耗时、site-steps/s、加速比，以及逐步同步的开销。
+    加速比 = 单进程耗时 / 多进程耗时，只在厂区数不超过可用核数时有意义，否则记 n/a
+    """
+    cpu_num = get_usable_cpu_num()
+    print(f"usable cpus={cpu_num}, steps={simulation_steps}, window={window}")
+    print(f"{'sites':>5s} {'inproc s':>9s} {'proc s':>8s} {'proc w=1 s':>10s} "
+          f"{'site-steps/s':>13s} {'speedup':>8s} {'same':>5s}")
+    for n_sites in site_num_list:
+        spec = build_ring_spec(n_sites)
+        inproc_rst_list, inproc_wall = run_multi_site(spec, simulation_steps, window, mode="inproc")
+        proc_rst_list, proc_wall = run_multi_site(spec, simulation_steps, window, mode="proc")
+        _, tick_wall = run_multi_site(spec, simulation_steps, 1, mode="proc")
+        same = all(
+            a["final_balance"] == b["final_balance"] and a["shipped"] == b["shipped"]
+            for a, b in zip(inproc_rst_list, proc_rst_list)
+        )
+        speedup = f"{inproc_wall / proc_wall:8.2f}" if 1 < n_sites <= cpu_num else f"{'n/a':>8s}"
+        print(
+            f"{n_sites:5d} {inproc_wall:9.2f} {proc_wall:8.2f} {tick_wall:10.2f} "
+            f"{n_sites * simulation_steps / proc_wall:13,.0f} {speedup} {str(same):>5s}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多厂区模拟，每个厂区一个进程")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("run")
+    p.add_argument("--spec", type=Path, default=None, help="厂区配置 yaml；不给则为 --sites 个默认厂区连成环")
+    p.add_argument("--sites", type=int, default=4)
+    p.add_argument("--steps", type=int, default=None)
+    p.add_argument("--window", type=int, default=None, help="同步窗口步数，默认取最短 lane 在途时间")
+    p.add_argument("--mode", choices=["proc", "inproc"], default="proc")
+
+    p = sub.add_parser("bench")
+    p.add_argument("--sites", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--steps", type=int, default=5000)
+    p.add_argument("--window", type=int, default=30)
+
+    args = parser.parse_args()
+    if args.cmd == "bench":
+        bench(args.sites, args.steps, args.window)
+        return
+    spec = load_yaml(args.spec) if args.spec else build_ring_spec(args.sites)
+    rst_list, wall = run_multi_site(spec, args.steps, args.window, mode=args.mode)
+    print_result(rst_list, wall)
+
+
+if __name__ == '__main__':
+    main()
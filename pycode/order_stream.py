@@ -0,0 +1,149 @@
+"""
+订单流：用 NumPy 一次性生成整个 episode 的订单（到达时刻、产品、数量、绝对到期时间），按到达时刻排好序；
+OrderArrivalEngine 用游标按时钟把已到达的订单放进订单簿，每步代价只和本步到达的订单数有关。
+
+order_stream_spec 示例::
+
+    {
+        "arrival": {"process": "poisson", "rate": 0.1},            # 每步平均到达数；或 {"process": "at_start", "num": 50}
+        "product_mix": {"Motor": 0.7, "Frame": 0.3},               # 权重；也可以是名字列表，表示等概率
+        "quantity": {"dist": "uniform_int", "low": 1, "high": 10},  # 或 {"dist": "poisson", "mean": 5}，至少为 1
+        "lead_time": {"dist": "uniform", "low": 0, "high": 500},    # 到达到到期的步数；或 {"dist": "exponential", "mean": 200}
+    }
+
+抽样顺序固定为：到达数、到达时刻、数量、提前期、产品，同一个 seed 生成的订单流完全相同。
+"""
+import bisect
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class OrderStream:
+    """按 arrival_time 升序排列的订单列，到达时刻相同的保持生成顺序"""
+    product_names: list
+    arrival_time: np.ndarray  # int64
+    product_idx: np.ndarray  # int32
+    quantity: np.ndarray  # int64
+    due_time: np.ndarray  # int64，绝对时间
+
+    def __len__(self):
+        return len(self.arrival_time)
+
+
+def get_legacy_order_stream_spec(manual_simulation_steps, random_order_num):
+    """
+    与原先的随机订单同分布：random_order_num 个订单全部在 0 时刻到达，到期时间在整个 episode 内均匀分布，
+    两种产品等概率。不是同一串订单：原先产品名用的是没设种子的 random.choice，本来就复现不了
+    """
+    return {
+        "arrival": {"process": "at_start", "num": random_order_num},
+        "product_mix": ["Motor", "Frame"],
+        "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+        "lead_time": {"dist": "uniform", "low": 0, "high": manual_simulation_steps},
+    }
+
+
+def generate_order_stream(spec: dict, horizon, seed=None) -> OrderStream:
+    """
+    :param horizon: 到达时刻的范围 [0, horizon)，通常为 episode 步数
+    """
+    rng = np.random.default_rng(seed)
+
+    arrival = spec["arrival"]
+    if arrival["process"] == "at_start":
+        n = arrival["num"]
+        arrival_time = np.zeros(n, dtype=np.int64)
+    elif arrival["process"] == "poisson":
+        # 泊松过程：总数服从泊松分布，给定总数后到达时刻独立均匀
+        n = int(rng.poisson(arrival["rate"] * horizon))
+        arrival_time = np.sort((rng.random(n) * horizon).astype(np.int64))
+    else:
+        raise ValueError(f"未知到达过程 {arrival['process']}")
+
+    quantity_spec = spec["quantity"]
+    if quantity_spec["dist"] == "uniform_int":
+        low, high = quantity_spec["low"], quantity_spec["high"]
+        quantity = (rng.random(n) * (high - low + 1) + low).astype(np.int64)
+    elif quantity_spec["dist"] == "poisson":
+        quantity = np.maximum(rng.poisson(quantity_spec["mean"], n), 1).astype(np.int64)
+    else:
+        raise ValueError(f"未知数量分布 {quantity_spec['dist']}")
+
+    lead_spec = spec["lead_time"]
+    if lead_spec["dist"] == "uniform":
+        lead_time = (rng.random(n) * (lead_spec["high"] - lead_spec["low"]) + lead_spec["low"]).astype(np.int64)
+    elif lead_spec["dist"] == "exponential":
+        lead_time = rng.exponential(lead_spec["mean"], n).astype(np.int64)
+    else:
+        raise ValueError(f"未知提前期分布 {lead_spec['dist']}")
+
+    product_mix = spec["product_mix"]
+    if isinstance(product_mix, dict):
+        product_names = list(product_mix)
+        p = np.array(list(product_mix.values()), dtype=np.float64)
+        product_idx = rng.choice(len(product_names), size=n, p=p / p.sum()).astype(np.int32)
+    else:
+        product_names = list(product_mix)
+        product_idx = rng.integers(len(product_names), size=n).astype(np.int32)
+
+    return OrderStream(
+        product_names=product_names,
+        arrival_time=arrival_time,
+        product_idx=product_idx,
+        quantity=quantity,
+        due_time=arrival_time + lead_time,
+    )
+
+
+class OrderArrivalEngine:
+    """
+    预排序订单流上的游标，release_until(t) 返回到达时刻 <= t、尚未放出的订单 [(product_idx, quantity, due_time), ...]。
+    订单流按 CHUNK_SIZE 分段转成 python 列表，每步只做一次列表比较，不逐步切 numpy 数组。
+    """
+
+    CHUNK_SIZE = 4096
+
+    def __init__(self, stream: OrderStream):
+        self.stream = stream
+        self.seek(0)
+
+    def __len__(self):
+        """尚未到达的订单数"""
+        return len(self.stream) - self.cursor
+
+    def seek(self, cursor):
+        self.cursor = cursor
+        self.chunk_start = cursor
+        slc = slice(cursor, min(cursor + self.CHUNK_SIZE, len(self.stream)))
+        stream = self.stream
+        self.chunk_arrival_time = stream.arrival_time[slc].tolist()
+        self.chunk_rows = list(zip(
+            stream.product_idx[slc].tolist(),
+            stream.quantity[slc].tolist(),
+            stream.due_time[slc].tolist(),
+        ))
+
+    def release_until(self, t) -> list:
+        rst = []
+        while True:
+            i = self.cursor - self.chunk_start
+            if i == len(self.chunk_arrival_time):
+                if self.cursor == len(self.stream):
+                    return rst
+                self.seek(self.cursor)
+                continue
+            if self.chunk_arrival_time[i] > t:
+                return rst
+            end = bisect.bisect_right(self.chunk_arrival_time, t, lo=i)
+            rst.extend(self.chunk_rows[i:end])
+            self.cursor = self.chunk_start + end
+
+    def get_next_arrival_time(self):
+        if self.cursor == len(self.stream):
+            return None
+        i = self.cursor - self.chunk_start
+        if i < len(self.chunk_arrival_time):
+            return self.chunk_arrival_time[i]
+        return int(self.stream.arrival_time[self.cursor])
@@ -0,0 +1,84 @@
+"""
+离线批量画图：读取 FactoryEnv(artifact_mode="log") 存下的 run log，多进程 headless 渲染
+dashboard、甘特图、设备拓扑。输出文件名由 run id 决定：<run_id>-status_dashboard.png 等，
+图片比 run log 新则跳过。
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from pycode.data_class import Device, Recipe
+from pycode.history_recorder import load_run_log, run_log_folder
+from pycode.make_my_plots import draw_dashboard, draw_gantt, draw_device_topology
+
+PLOT_KIND_LIST = ["status_dashboard", "gantt", "device_topology"]
+
+
+def get_plot_path_dict(run_id, out_dir: Path):
+    return {kind: out_dir / f"{run_id}-{kind}.png" for kind in PLOT_KIND_LIST}
+
+
+def check_if_up_to_date(plot_path: Path, log_mtime):
+    return plot_path.exists() and plot_path.stat().st_mtime >= log_mtime
+
+
+def plot_one_run(run_dir: Path, out_dir: Path, force=False) -> str:
+    run_id = run_dir.name
+    log_mtime = (run_dir / "history.npz").stat().st_mtime
+    todo_dict = {
+        kind: path
+        for kind, path in get_plot_path_dict(run_id, out_dir).items()
+        if force or not check_if_up_to_date(path, log_mtime)
+    }
+    if not todo_dict:
+        return f"{run_id}: up to date"
+
+    hr, meta = load_run_log(run_dir)
+    if "status_dashboard" in todo_dict:
+        draw_dashboard(hr, save_path=todo_dict["status_dashboard"])
+    if "gantt" in todo_dict:
+        draw_gantt(
+            hr,
+            recipe_obj_list=[Recipe(**spec) for spec in meta["recipe_spec_dict"].values()],
+            save_path=todo_dict["gantt"],
+        )
+    if "device_topology" in todo_dict:
+        draw_device_topology(
+            {dev_id: Device(**spec) for dev_id, spec in meta["device_spec_dict"].items()},
+            save_path=todo_dict["device_topology"],
+        )
+    return f"{run_id}: plotted {', '.join(todo_dict)}"
+
+
+def plot_runs(log_dir: Path, out_dir: Path, max_workers=None, force=False):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    run_dir_list = sorted(p for p in log_dir.iterdir() if (p / "history.npz").exists())
+    print(f"{len(run_dir_list)} runs in {log_dir}")
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        future_list = [pool.submit(plot_one_run, run_dir, out_dir, force) for run_dir in run_dir_list]
+        for future in as_completed(future_list):
+            print(future.result())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 run log 离线批量画图")
+    parser.add_argument("--log-dir", type=Path, default=Path(run_log_folder))
+    parser.add_argument("--out-dir", type=Path, default=Path("../pics/runs"))
+    parser.add_argument("--workers", type=int, default=None, help="默认用满本机所有核")
+    parser.add_argument("--force", action="store_true", help="忽略已有图片，全部重画")
+    args = parser.parse_args()
+    plot_runs(
+        log_dir=args.log_dir,
+        out_dir=args.out_dir,
+        max_workers=args.workers,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
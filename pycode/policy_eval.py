@@ -0,0 +1,177 @@
+"""
+策略评估：训练好的 MaskablePPO 在一组固定场景 × 固定种子上跑，与 greedy / 规则调度并排比较。无界面，不存产物。
+· 场景文件与 sweep_runner 同格式（grid / jobs 覆盖项），不给则只有默认场景；每个 场景 × 种子(order_seed) 为一个 episode
+· PPO 批量推理：同时开 batch_size 个环境，每步把所有未结束环境的观测拼成一批，只调一次 predict；
+  某个环境结束后从待跑队列里取下一个 episode 补上，直到全部跑完
+· 启发式调度用 run_greedy 跑同样的 episode；场景里的 fast_forward 只对 greedy 生效
+报告每种调度 final_balance 的均值与 p10/p50/p90，fill_rate、total_energy、utilization 的均值，以及 episodes/sec
+
+用法: python -m pycode.policy_eval [model.zip] [--scenarios sweep.yaml] [--seeds 0 1 2 3] [--batch-size 16]
+    [--heuristics greedy edd ...] [--env-kwargs '{"decision_interval": 5}']
+"""
+import argparse
+import json
+import time
+from collections import deque
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+from gymnasium import spaces
+
+from pycode.dispatch_rules import DISPATCH_RULE_LIST
+from pycode.factory_env import FactoryEnv
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs, build_job_list
+from pycode.utils import load_yaml
+
+DEFAULT_SEED_LIST = list(range(8))
+METRIC_LIST = ["final_balance", "fill_rate", "total_energy", "utilization"]
+
+
+def build_episode_list(scenario_spec, seed_list) -> list[dict]:
+    """场景 × 种子展开成每个 episode 的覆盖项"""
+    scenario_list = build_job_list(scenario_spec) if scenario_spec else [dict(DEFAULT_PARAMS)]
+    return [{**params, "order_seed": seed} for params in scenario_list for seed in seed_list]
+
+
+def get_episode_params(params, scheduler) -> dict:
+    """场景里的 fast_forward 只对 greedy 生效，规则调度和 PPO 不支持快进，一律关掉"""
+    return {**params, "scheduler": scheduler, "fast_forward": params["fast_forward"] and scheduler == "greedy"}
+
+
+def get_ppo_env_kwargs(model, params, extra_env_kwargs):
+    obs_mode = "dict" if isinstance(model.observation_space, spaces.Dict) else "flat"
+    return {
+        **build_env_kwargs(get_episode_params(params, "manual")),
+        "obs_mode": obs_mode,
+        **extra_env_kwargs,
+        "artifact_mode": "none",
+    }
+
+
+def stack_obs(obs_list):
+    if isinstance(obs_list[0], dict):
+        return {k: np.stack([obs[k] for obs in obs_list]) for k in obs_list[0]}
+    return np.stack(obs_list)
+
+
+def eval_ppo(model, episode_list, batch_size=16, extra_env_kwargs=None) -> list[dict]:
+    """批量推理跑完 episode_list，返回与 episode_list 同序的结果"""
+    extra_env_kwargs = extra_env_kwargs or {}
+    rst_list = [None] * len(episode_list)
+    todo = deque(enumerate(episode_list))
+    # 槽位 -> (episode 序号, env, 当前观测)
+    slot_list = []
+
+    def start_next():
+        idx, params = todo.popleft()
+        env = FactoryEnv(**get_ppo_env_kwargs(model, params, extra_env_kwargs))
+        assert env.observation_space == model.observation_space, f"场景 {params} 的观测空间与模型不一致"
+        assert env.action_space == model.action_space, f"场景 {params} 的动作空间与模型不一致"
+        obs, _ = env.reset()
+        return idx, env, obs
+
+    while todo and len(slot_list) < batch_size:
+        slot_list.append(start_next())
+
+    while slot_list:
+        action_batch, _ = model.predict(
+            stack_obs([obs for _, _, obs in slot_list]),
+            action_masks=np.stack([env.action_masks() for _, env, _ in slot_list]),
+            deterministic=True,
+        )
+        next_slot_list = []
+        for (idx, env, _), action in zip(slot_list, action_batch):
+            obs, _, done, _, _ = env.step(action)
+            if not done:
+                next_slot_list.append((idx, env, obs))
+                continue
+            rst_list[idx] = env.sim.get_result()
+            if todo:
+                next_slot_list.append(start_next())
+        slot_list = next_slot_list
+    return rst_list
+
+
+def eval_heuristic(scheduler, episode_list) -> list[dict]:
+    rst_list = []
+    for params in episode_list:
+        params = get_episode_params(params, scheduler)
+        env = FactoryEnv(**build_env_kwargs(params), artifact_mode="none")
+        env.run_greedy(params["simulation_steps"])
+        rst_list.append(env.sim.get_result())
+    return rst_list
+
+
+def summarize(name, rst_list, wall) -> dict:
+    balance = np.array([r["final_balance"] for r in rst_list])
+    p10, p50, p90 = np.percentile(balance, [10, 50, 90])
+    return {
+        "schedule": name,
+        "episodes": len(rst_list),
+        "balance_mean": balance.mean(),
+        "balance_p10": p10,
+        "balance_p50": p50,
+        "balance_p90": p90,
+        **{f"{k}_mean": float(np.mean([r[k] for r in rst_list])) for k in METRIC_LIST[1:]},
+        "episodes_per_sec": len(rst_list) / wall,
+    }
+
+
+def run_eval(model_path=None, scenario_spec=None, seed_list=None, batch_size=16,
+             heuristic_list=("greedy", *DISPATCH_RULE_LIST), extra_env_kwargs=None) -> list[dict]:
+    episode_list = build_episode_list(scenario_spec, seed_list or DEFAULT_SEED_LIST)
+    print(f"eval: {len(episode_list)} episodes")
+
+    row_list = []
+    for scheduler in heuristic_list:
+        t0 = time.perf_counter()
+        rst_list = eval_heuristic(scheduler, episode_list)
+        row_list.append(summarize(scheduler, rst_list, time.perf_counter() - t0))
+
+    if model_path is not None:
+        from sb3_contrib import MaskablePPO
+
+        model = MaskablePPO.load(model_path, device="cpu")
+        t0 = time.perf_counter()
+        rst_list = eval_ppo(model, episode_list, batch_size, extra_env_kwargs)
+        row_list.append(summarize(f"ppo:{Path(model_path).stem}", rst_list, time.perf_counter() - t0))
+
+    print(
+        f"{'schedule':24s} {'balance':>12s} {'p10':>12s} {'p50':>12s} {'p90':>12s} "
+        f"{'fill_rate':>10s} {'energy':>10s} {'util':>6s} {'ep/s':>8s}"
+    )
+    for row in row_list:
+        print(
+            f"{row['schedule']:24s} {row['balance_mean']:12,.1f} {row['balance_p10']:12,.1f} "
+            f"{row['balance_p50']:12,.1f} {row['balance_p90']:12,.1f} {row['fill_rate_mean']:10.3f} "
+            f"{row['total_energy_mean']:10,.1f} {row['utilization_mean']:6.3f} {row['episodes_per_sec']:8.2f}"
+        )
+    return row_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MaskablePPO 批量评估，与启发式调度对比")
+    parser.add_argument("model", nargs="?", default=None, help="MaskablePPO zip；不给则只评估启发式调度")
+    parser.add_argument("--scenarios", type=Path, default=None, help="场景 yaml，格式同 sweep_runner")
+    parser.add_argument("--seeds", type=int, nargs="+", default=DEFAULT_SEED_LIST)
+    parser.add_argument("--batch-size", type=int, default=16, help="同时推理的环境数")
+    parser.add_argument("--heuristics", nargs="*", default=["greedy", *DISPATCH_RULE_LIST])
+    parser.add_argument("--env-kwargs", type=json.loads, default={},
+                        help="PPO 环境的额外构造参数（json），需与训练时一致，如 obs 相关的 visible_order_num")
+    args = parser.parse_args()
+    run_eval(
+        model_path=args.model,
+        scenario_spec=load_yaml(args.scenarios) if args.scenarios else None,
+        seed_list=args.seeds,
+        batch_size=args.batch_size,
+        heuristic_list=args.heuristics,
+        extra_env_kwargs=args.env_kwargs,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""
+多机 rollout：只用标准库 multiprocessing.connection（TCP + pickle），没有外部服务。
+· 协调端 RolloutCoordinator 监听一个端口，worker 进程（可在别的机器上）主动连进来，
+  每个 worker 在本地用 DummyVecEnv 托管一批 FactoryEnv。
+· RemoteVecEnv 把所有 worker 的环境拼成一个 SB3 VecEnv，MaskablePPO 直接用：
+  每步把动作按 worker 切开发出去，worker 回传整批 obs / reward / done 数组和下一步的动作掩码，
+  action_masks 不再单独往返。info 只回传 SB3 和 EpisodeMetricsCallback 用到的键。
+· 也可以把 sweep_runner 的 greedy 任务分发给 worker，收集评估结果。
+
+· 连接收到什么都 unpickle，知道密钥就能在对端执行任意代码，所以没有默认密钥：
+  密钥取 --authkey / authkey 参数，否则取环境变量 FACTORY_ROLLOUT_AUTHKEY；
+  都没给时协调端只允许监听回环地址，用随机密钥（只有本机 start_local_workers 起的 worker 知道），
+  worker 则直接报错。
+
+本机起 worker 并测吞吐:  python -m pycode.rollout_cluster bench --workers 1 2 4 --n-envs 4
+远端机器起 worker:       FACTORY_ROLLOUT_AUTHKEY=<密钥> python -m pycode.rollout_cluster worker --host <协调端ip> --port 6000 --n-envs 8
+"""
+import argparse
+import ipaddress
+import multiprocessing as mp
+import os
+import secrets
+import socket
+import time
+import traceback
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import VecEnv, DummyVecEnv
+
+AUTHKEY_ENV_NAME = "FACTORY_ROLLOUT_AUTHKEY"
+INFO_KEY_LIST = ["episode", "episode_metrics", "terminal_observation", "TimeLimit.truncated"]
+
+
+class WorkerError(RuntimeError):
+    """worker 处理命令时出错，带回 worker 端的 traceback"""
+
+
+def is_loopback_host(host) -> bool:
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (socket.gaierror, ValueError):
+        return False
+
+
+def get_authkey(authkey, address, allow_random=False) -> bytes:
+    """
+    连接密钥：authkey 参数 > 环境变量 FACTORY_ROLLOUT_AUTHKEY。
+    都没给时，allow_random 且 address 是回环地址则返回随机密钥，否则报错
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV_NAME) or None
+    if authkey is None:
+        if allow_random and is_loopback_host(address[0]):
+            return secrets.token_bytes(32)
+        raise ValueError(f"连接 {address} 需要密钥：用 --authkey 或环境变量 {AUTHKEY_ENV_NAME} 给出")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+# ---------- worker ----------
+def run_worker(address, n_envs, authkey=None):
+    """连上协调端，收到环境配置后建 n_envs 个环境，然后循环处理命令直到 close"""
+    from pycode.factory_env import get_fac_env
+
+    conn = Client(address, authkey=get_authkey(authkey, address))
+    env_kwargs = conn.recv()
+    venv = DummyVecEnv([lambda: Monitor(get_fac_env(**env_kwargs)) for _ in range(n_envs)])
+    conn.send({
+        "n_envs": n_envs,
+        "observation_space": venv.observation_space,
+        "action_space": venv.action_space,
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+    })
+
+    while True:
+        try:
+            cmd, *args = conn.recv()
+        except EOFError:
+            # 协调端已退出
+            cmd = "close"
+        if cmd == "close":
+            venv.close()
+            conn.close()
+            return
+        t0 = time.perf_counter()
+        try:
+            rst = handle_command(venv, cmd, args)
+        except Exception:
+            rst = WorkerError(f"{socket.gethostname()}:{os.getpid()}\n{traceback.format_exc()}")
+        conn.send((rst, time.perf_counter() - t0))
+
+
+def handle_command(venv, cmd, args):
+    from pycode.sweep_runner import run_job_with_timeout
+
+    if cmd == "step":
+        obs, rewards, dones, infos = venv.step(args[0])
+        return obs, rewards, dones, [compact_info(info) for info in infos], get_masks(venv)
+    if cmd == "reset":
+        return venv.reset(), get_masks(venv)
+    if cmd == "env_method":
+        name, method_args, method_kwargs, indices = args
+        return venv.env_method(name, *method_args, indices=indices, **method_kwargs)
+    if cmd == "get_attr":
+        return venv.get_attr(args[0], indices=args[1])
+    if cmd == "set_attr":
+        return venv.set_attr(args[0], args[1], indices=args[2])
+    if cmd == "env_is_wrapped":
+        return venv.env_is_wrapped(args[0], indices=args[1])
+    if cmd == "run_job":
+        return run_job_with_timeout(*args)
+    raise ValueError(f"未知命令 {cmd}")
+
+
+def recv_reply(conn):
+    """收 worker 的 (结果, 本地计算时间)，worker 出错则在协调端抛出"""
+    rst, compute_time = conn.recv()
+    if isinstance(rst, WorkerError):
+        raise rst
+    return rst, compute_time
+
+
+def compact_info(info):
+    return {k: info[k] for k in INFO_KEY_LIST if k in info}
+
+
+def get_masks(venv):
+    return np.stack(venv.env_method("action_masks"))
+
+
+# ---------- 协调端 ----------
+class RolloutCoordinator:
+    """
+    监听 address，等 n_workers 个 worker 连上，把 env_kwargs（传给 get_fac_env）发给它们。
+    :param address: (host, port)，port 为 0 时由系统分配，实际地址见 self.address
+    :param authkey: 连接密钥，见 get_authkey；不给时只能监听回环地址，实际密钥见 self.authkey
+    """
+
+    def __init__(self, n_workers, env_kwargs=None, address=("localhost", 0), authkey=None):
+        self.authkey = get_authkey(authkey, address, allow_random=True)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.n_workers = n_workers
+        self.env_kwargs = env_kwargs or {}
+        self.conn_list = []
+        self.worker_info_list = []
+
+    def accept_workers(self):
+        while len(self.conn_list) < self.n_workers:
+            conn = self.listener.accept()
+            conn.send(self.env_kwargs)
+            self.conn_list.append(conn)
+            self.worker_info_list.append(conn.recv())
+
+    def call(self, i, *msg):
+        self.conn_list[i].send(msg)
+        rst, _ = recv_reply(self.conn_list[i])
+        return rst
+
+    def run_jobs(self, params_list, timeout=None) -> list[dict]:
+        """把 sweep_runner 的任务轮流分给空闲 worker，按完成顺序返回结果"""
+        from multiprocessing.connection import wait
+
+        todo_list = list(params_list)
+        rst = []
+        conn_and_busy_dict = {conn: False for conn in self.conn_list}
+        while todo_list or any(conn_and_busy_dict.values()):
+            for conn, busy in conn_and_busy_dict.items():
+                if not busy and todo_list:
+                    conn.send(("run_job", todo_list.pop(0), timeout))
+                    conn_and_busy_dict[conn] = True
+            for conn in wait([c for c, busy in conn_and_busy_dict.items() if busy]):
+                row, _ = recv_reply(conn)
+                rst.append(row)
+                conn_and_busy_dict[conn] = False
+        return rst
+
+    def close(self):
+        for conn in self.conn_list:
+            conn.send(("close",))
+            conn.close()
+        self.listener.close()
+
+
+class RemoteVecEnv(VecEnv):
+    """
+    所有 worker 的环境按连接顺序拼成一个 VecEnv。
+    网络开销统计：每步墙钟时间减去各 worker 本地计算时间的最大值，见 get_network_stats()。
+    """
+
+    def __init__(self, coordinator: RolloutCoordinator):
+        coordinator.accept_workers()
+        self.coordinator = coordinator
+        self.conn_list = coordinator.conn_list
+        info_list = coordinator.worker_info_list
+        # 第 i 个 worker 负责的全局环境编号区间
+        self.env_slice_list = []
+        start = 0
+        for info in info_list:
+            self.env_slice_list.append(slice(start, start + info["n_envs"]))
+            start += info["n_envs"]
+        self.masks = None
+        self.step_cnt = 0
+        self.step_wall_time = 0.0
+        self.step_compute_time = 0.0
+        self.step_t0 = None
+        super().__init__(start, info_list[0]["observation_space"], info_list[0]["action_space"])
+
+    def broadcast(self, msg_list):
+        for conn, msg in zip(self.conn_list, msg_list):
+            conn.send(msg)
+        rst_list, compute_time_list = zip(*(recv_reply(conn) for conn in self.conn_list))
+        return rst_list, max(compute_time_list)
+
+    def reset(self):
+        rst_list, _ = self.broadcast([("reset",)] * len(self.conn_list))
+        obs_list, masks_list = zip(*rst_list)
+        self.masks = np.concatenate(masks_list)
+        return concat_obs(obs_list)
+
+    def step_async(self, actions):
+        self.step_t0 = time.perf_counter()
+        for conn, slc in zip(self.conn_list, self.env_slice_list):
+            conn.send(("step", actions[slc]))
+
+    def step_wait(self):
+        rst_list, compute_time_list = zip(*(recv_reply(conn) for conn in self.conn_list))
+        self.step_cnt += 1
+        self.step_wall_time += time.perf_counter() - self.step_t0
+        self.step_compute_time += max(compute_time_list)
+
+        obs_list, rewards_list, dones_list, infos_list, masks_list = zip(*rst_list)
+        self.masks = np.concatenate(masks_list)
+        infos = [info for infos in infos_list for info in infos]
+        return concat_obs(obs_list), np.concatenate(rewards_list), np.concatenate(dones_list), infos
+
+    def get_network_stats(self):
+        """每次 step 的平均墙钟、worker 计算、网络与序列化开销（秒）"""
+        n = max(self.step_cnt, 1)
+        return {
+            "step_cnt": self.step_cnt,
+            "wall_per_step": self.step_wall_time / n,
+            "compute_per_step": self.step_compute_time / n,
+            "overhead_per_step": (self.step_wall_time - self.step_compute_time) / n,
+        }
+
+    def get_worker_indices(self, indices):
+        """全局编号 -> [(worker序号, [本地编号, ...]), ...]"""
+        indices = self._get_indices(indices)
+        rst = []
+        for i, slc in enumerate(self.env_slice_list):
+            local = [idx - slc.start for idx in indices if slc.start <= idx < slc.stop]
+            if local:
+                rst.append((i, local))
+        return rst
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        if method_name == "action_masks":
+            # 掩码随 reset / step 一起回传
+            return list(self.masks[self._get_indices(indices)])
+        rst = []
+        for i, local in self.get_worker_indices(indices):
+            rst.extend(self.coordinator.call(i, "env_method", method_name, method_args, method_kwargs, local))
+        return rst
+
+    def get_attr(self, attr_name, indices=None):
+        if attr_name == "action_masks":
+            # 绑定方法不能跨进程传，用本地掩码缓存代替
+            return [lambda i=i: self.masks[i] for i in self._get_indices(indices)]
+        rst = []
+        for i, local in self.get_worker_indices(indices):
+            rst.extend(self.coordinator.call(i, "get_attr", attr_name, local))
+        return rst
+
+    def set_attr(self, attr_name, value, indices=None):
+        for i, local in self.get_worker_indices(indices):
+            self.coordinator.call(i, "set_attr", attr_name, value, local)
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        rst = []
+        for i, local in self.get_worker_indices(indices):
+            rst.extend(self.coordinator.call(i, "env_is_wrapped", wrapper_class, local))
+        return rst
+
+    def close(self):
+        self.coordinator.close()
+
+
+def concat_obs(obs_list):
+    if isinstance(obs_list[0], dict):
+        return {k: np.concatenate([obs[k] for obs in obs_list]) for k in obs_list[0]}
+    return np.concatenate(obs_list)
+
+
+# ---------- 本机测试 ----------
+def start_local_workers(coordinator: RolloutCoordinator, n_envs) -> list:
+    """
+    本机起 n_workers 个 worker 进程。不设 daemon：worker 要为每个 sweep job 起可 kill 的子进程，
+    协调端关闭或退出后 worker 收不到命令自己就退出了
+    """
+    process_list = [
+        mp.Process(target=run_worker, args=(coordinator.address, n_envs, coordinator.authkey))
+        for _ in range(coordinator.n_workers)
+    ]
+    for p in process_list:
+        p.start()
+    return process_list
+
+
+def get_random_masked_actions(venv: RemoteVecEnv, rng):
+    """按掩码给每台设备随机选一个合法调度"""
+    action_nvec = venv.action_space.nvec
+    masks = np.stack(venv.env_method("action_masks")).reshape(venv.num_envs, len(action_nvec), -1)
+    rst = np.zeros((venv.num_envs, len(action_nvec)), dtype=np.int64)
+    for i in range(venv.num_envs):
+        for j in range(len(action_nvec)):
+            rst[i, j] = rng.choice(np.flatnonzero(masks[i, j]))
+    return rst
+
+
+def bench(n_workers_list, n_envs, n_steps, env_kwargs):
+    """本机起 1、2、4… 个 worker，随机合法动作跑 n_steps 个 VecEnv step，报告吞吐与每步网络开销"""
+    rng = np.random.default_rng(0)
+    base = None
+    for n_workers in n_workers_list:
+        coordinator = RolloutCoordinator(n_workers=n_workers, env_kwargs=env_kwargs)
+        process_list = start_local_workers(coordinator, n_envs)
+        try:
+            venv = RemoteVecEnv(coordinator)
+            venv.reset()
+            t0 = time.perf_counter()
+            for _ in range(n_steps):
+                venv.step(get_random_masked_actions(venv, rng))
+            env_steps_per_sec = n_steps * venv.num_envs / (time.perf_counter() - t0)
+            base = base or env_steps_per_sec
+            stats = venv.get_network_stats()
+            print(
+                f"workers={n_workers} envs={venv.num_envs}: {env_steps_per_sec:,.0f} env-steps/s "
+                f"(x{env_steps_per_sec / base:.2f}), per step: wall {stats['wall_per_step'] * 1e3:.2f} ms, "
+                f"compute {stats['compute_per_step'] * 1e3:.2f} ms, overhead {stats['overhead_per_step'] * 1e3:.2f} ms"
+            )
+        finally:
+            coordinator.close()
+            for p in process_list:
+                p.join()
+
+
+def tst_ppo_on_remote_env(n_workers=2, n_envs=2, total_timesteps=2048):
+    """本机 worker 上跑一小段 MaskablePPO，确认 RemoteVecEnv 能直接喂给 MaskablePPO"""
+    from sb3_contrib import MaskablePPO
+    from pycode.episode_metrics import EpisodeMetricsCallback
+    from pycode.factory_env import get_policy_cls_by_obs_mode
+
+    coordinator = RolloutCoordinator(n_workers=n_workers, env_kwargs={"artifact_mode": "none"})
+    process_list = start_local_workers(coordinator, n_envs)
+    try:
+        venv = RemoteVecEnv(coordinator)
+        model = MaskablePPO(get_policy_cls_by_obs_mode("dict"), venv, n_steps=256, verbose=1)
+        model.learn(total_timesteps=total_timesteps, callback=EpisodeMetricsCallback())
+        print(venv.get_network_stats())
+    finally:
+        coordinator.close()
+        for p in process_list:
+            p.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多机 rollout worker / 本机吞吐测试")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_worker = sub.add_parser("worker", help="连到协调端，托管一批环境")
+    p_worker.add_argument("--host", default="localhost")
+    p_worker.add_argument("--port", type=int, default=6000)
+    p_worker.add_argument("--n-envs", type=int, default=os.cpu_count())
+    p_worker.add_argument(
+        "--authkey", default=None, help=f"连接密钥，会出现在进程列表里，最好用环境变量 {AUTHKEY_ENV_NAME}",
+    )
+
+    p_bench = sub.add_parser("bench", help="本机起 worker，测吞吐扩展性与网络开销")
+    p_bench.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p_bench.add_argument("--n-envs", type=int, default=4)
+    p_bench.add_argument("--steps", type=int, default=200)
+    p_bench.add_argument("--obs-mode", default="dict")
+
+    args = parser.parse_args()
+    if args.cmd == "worker":
+        run_worker((args.host, args.port), n_envs=args.n_envs, authkey=args.authkey)
+    else:
+        bench(
+            n_workers_list=args.workers,
+            n_envs=args.n_envs,
+            n_steps=args.steps,
+            env_kwargs={"obs_mode": args.obs_mode, "artifact_mode": "none"},
+        )
+
+
+if __name__ == "__main__":
+    main()
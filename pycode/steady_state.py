@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import math
+from collections import deque
+from dataclasses import dataclass
+from operator import attrgetter
+
+from pycode.dev_runtime import DevState
+
+get_quantity = attrgetter("quantity")
+
+
+@dataclass
+class TickRecord:
+    """一个tick结束时的动态状态快照，用于周期检测。"""
+    dev_sig: tuple  # 每台设备 (state, t_left, bind_recipe名)
+    stock: tuple  # tick结束时的库存
+    post_start_stock: tuple  # 本tick所有设备启动扣料之后、产出之前的库存，即tick内最低点
+    step_balance: float
+    step_energy: float
+    total_balance: float
+    total_energy: float
+    total_running_dev_steps: int
+    order_num: int
+
+
+class SteadyStateDetector:
+    """
+    稳态周期检测 + 快进。
+    只适用于 greedy 模式（绑定固定，调度计划只由设备状态决定）。
+    做法：
+    · 每个tick记录动态状态（设备状态、t_left、库存、单步金额/能耗）。
+    · 候选周期 P 取绑定配方 cycle_time 的 LCM 及其倍数（只在换绑定后重算）；若最近连续两个周期内，
+      设备状态逐tick相同、库存逐tick增量相同、单步金额/能耗相同、且没有订单到期，则认为进入稳态。
+    · 订单事件（到期、到达）前后的记录用不上：离下个事件不到一个周期时跳不了，事件之后又要重新攒够两个周期，
+      所以这段时间不记录、清空已有记录。订单密时基本不记录，开销接近不开快进。
+    · 快进整数个周期：库存按每周期增量线性外推，能耗、余额按每周期总量累加，订单到期时间整体前移。
+      周期数受两方面限制：不能跨过下一个订单到期或到达事件；库存线性外推后，任何一次开工检查的结果不能改变。
+    · 历史记录不展开，只在 HistoryRecorder 里登记一次"重复"，读取时才按周期补齐。
+    """
+
+    def __init__(self, max_period_multiple: int = 4):
+        self.max_period_multiple = max_period_multiple
+
+        self.base_period = None  # 以tick为单位的LCM
+        self.period_dirty = True  # 换过绑定，下次记录时重算 LCM
+        self.records: deque[TickRecord] | None = None
+        self.ticks_since_last_check = 0
+        self.post_start_stock: tuple | None = None
+        # 下个订单事件的绝对时间，订单簿没变（book_version 相同）时不重算
+        self.event_order_mng = None
+        self.event_book_version = None
+        self.next_event_elapsed = None
+
+        # 统计
+        self.jump_cnt = 0
+        self.jumped_steps = 0
+
+    # ---------- 记录接口，由 FactorySim 调用 ----------
+    def on_after_start(self, sim):
+        # 本tick内没有订单事件时，tick末的记录会不会被跳过现在就能定，跳过的话不用存库存
+        remaining = None if self.period_dirty else self.get_remaining_order_event_time(sim)
+        if remaining is not None and remaining >= 2 and self.is_blocked(remaining - 1):
+            self.post_start_stock = None
+            return
+        self.post_start_stock = tuple(map(get_quantity, sim.stock_mng.get_objs()))
+
+    def on_rebind(self):
+        self.period_dirty = True
+
+    def record(self, sim):
+        if self.period_dirty:
+            self.period_dirty = False
+            period = get_lcm_of_bind_cycle_ticks(sim)
+            if period != self.base_period:
+                # 绑定发生变化（非greedy用法），历史作废重新积累
+                self.base_period = period
+                self.records = deque(maxlen=2 * period * self.max_period_multiple + 1)
+                self.ticks_since_last_check = 0
+
+        self.ticks_since_last_check += 1
+        remaining = self.get_remaining_order_event_time(sim)
+        if remaining is not None and self.is_blocked(remaining):
+            self.records.clear()
+            return
+        self.records.append(
+            TickRecord(
+                dev_sig=get_dev_signature(sim),
+                stock=tuple(map(get_quantity, sim.stock_mng.get_objs())),
+                post_start_stock=self.post_start_stock,
+                step_balance=sim.step_balance,
+                step_energy=sim.step_energy_kwh_used,
+                total_balance=sim.total_balance,
+                total_energy=sim.total_energy_kwh_used,
+                total_running_dev_steps=sim.total_running_dev_steps,
+                order_num=len(sim.order_mng),
+            )
+        )
+
+    def is_blocked(self, remaining) -> bool:
+        """
+        离下个订单事件还有 remaining 步时，本tick的记录在事件之前都用不上：离事件不到一个周期，跳一个周期就会跨过它；
+        或者记录还是空的，事件前攒不够两个周期再留一个周期的余量
+        """
+        if remaining <= self.base_period:
+            return True
+        return not self.records and remaining <= 3 * self.base_period
+
+    def get_remaining_order_event_time(self, sim) -> int | None:
+        """距下一个订单到期或到达事件的步数，都没有时为 None"""
+        order_mng = sim.order_mng
+        if self.event_order_mng is not order_mng or self.event_book_version != order_mng.book_version:
+            self.event_order_mng = order_mng
+            self.event_book_version = order_mng.book_version
+            rst = order_mng.arrival_engine.get_next_arrival_time()
+            if len(order_mng):
+                rst = order_mng[0].due_time if rst is None else min(rst, order_mng[0].due_time)
+            self.next_event_elapsed = rst
+        if self.next_event_elapsed is None:
+            return None
+        return self.next_event_elapsed - order_mng.elapsed
+
+    # ---------- 快进 ----------
+    def try_fast_forward(self, sim, max_steps: int) -> int:
+        """
+        检测到稳态时直接跳过整数个周期。
+        :param max_steps: 最多允许跳过的tick数
+        :return: 实际跳过的tick数，0表示没有跳
+        """
+        if self.records is None or self.ticks_since_last_check < self.base_period:
+            return 0
+        self.ticks_since_last_check = 0
+
+        for m in range(1, self.max_period_multiple + 1):
+            period = self.base_period * m
+            if 2 * period + 1 > len(self.records):
+                break
+            per_period_stock_delta = self.get_per_period_stock_delta_if_periodic(period)
+            if per_period_stock_delta is None:
+                continue
+            n_period = self.get_safe_period_num(
+                sim=sim,
+                period=period,
+                per_period_stock_delta=per_period_stock_delta,
+                max_steps=max_steps,
+            )
+            if n_period <= 0:
+                return 0
+            self.apply_jump(sim, period, n_period, per_period_stock_delta)
+            return period * n_period
+        return 0
+
+    def get_per_period_stock_delta_if_periodic(self, period) -> tuple | None:
+        """最近两个周期逐tick比较，周期成立则返回每周期库存增量，否则返回None"""
+        recs = self.records
+        last = recs[-1]
+        # 窗口内不能有订单到期
+        if recs[-2 * period - 1].order_num != last.order_num:
+            return None
+
+        delta = tuple(a - b for a, b in zip(last.stock, recs[-1 - period].stock))
+        for i in range(1, period + 1):
+            cur, prev = recs[-i], recs[-i - period]
+            if (cur.dev_sig != prev.dev_sig
+                    or cur.step_balance != prev.step_balance
+                    or cur.step_energy != prev.step_energy):
+                return None
+        for i in range(1, period + 2):
+            cur, prev = recs[-i], recs[-i - period]
+            if tuple(a - b for a, b in zip(cur.stock, prev.stock)) != delta:
+                return None
+        return delta
+
+    def get_safe_period_num(self, sim, period, per_period_stock_delta, max_steps) -> int:
+        n_period = max_steps // period
+
+        # 不能跨过下一个订单到期或到达事件
+        remaining = self.get_remaining_order_event_time(sim)
+        if remaining is not None:
+            n_period = min(n_period, (remaining - 1) // period)
+
+        # 库存线性外推后，开工检查结果不能改变
+        need_max_dict = get_dict_of_material_and_max_need(sim)
+        stock_names = sim.stock_mng.get_names()
+        recs = self.records
+        for j, name in enumerate(stock_names):
+            d = per_period_stock_delta[j]
+            if d == 0 or name not in need_max_dict:
+                continue
+            need_max = need_max_dict[name]
+            min_post = min(recs[-i].post_start_stock[j] for i in range(1, period + 1))
+            if min_post < need_max:
+                # 周期内该材料曾低于需求量，增减都会改变开工结果
+                return 0
+            if d < 0:
+                n_period = min(n_period, int((min_post - need_max) // -d))
+        return n_period
+
+    def apply_jump(self, sim, period, n_period, per_period_stock_delta):
+        recs = self.records
+        last, prev = recs[-1], recs[-1 - period]
+
+        for name, d in zip(sim.stock_mng.get_names(), per_period_stock_delta):
+            sim.stock_mng.add_stock(name, d * n_period)
+        sim.total_energy_kwh_used += (last.total_energy - prev.total_energy) * n_period
+        sim.total_balance += (last.total_balance - prev.total_balance) * n_period
+        sim.total_running_dev_steps += (last.total_running_dev_steps - prev.total_running_dev_steps) * n_period
+        sim.order_mng.tick_due_time(period * n_period)
+        sim.clock += period * n_period * sim.dt
+        if sim.record_history:
+            sim.history_recorder.repeat_last_period(period, n_period)
+
+        self.records.clear()
+        self.ticks_since_last_check = 0
+        self.jump_cnt += 1
+        self.jumped_steps += period * n_period
+
+
+def get_dev_signature(sim) -> tuple:
+    return tuple(
+        (dev_rt.state is DevState.RUNNING, dev_rt.t_left, dev_rt.bind_recipe.name)
+        for dev_rt in sim.dev_id_and_dev_runtime_dict.values()
+    )
+
+
+def get_lcm_of_bind_cycle_ticks(sim) -> int:
+    rst = 1
+    for dev_rt in sim.dev_id_and_dev_runtime_dict.values():
+        rst = math.lcm(rst, math.ceil(dev_rt.bind_recipe.cycle_time / sim.dt))
+    return rst
+
+
+def get_dict_of_material_and_max_need(sim) -> dict:
+    """当前绑定下，每种材料在所有设备配方里单批需求量的最大值"""
+    rst = {}
+    for dev_rt in sim.dev_id_and_dev_runtime_dict.values():
+        for material, need_quantity in dev_rt.bind_recipe.inputs.items():
+            rst[material] = max(rst.get(material, 0), need_quantity)
+    return rst
@@ -0,0 +1,271 @@
+"""
+参数扫描：对一组覆盖项（设备数量、绑定、价格、订单量、时长、调度器）批量跑 headless 模拟，
+多进程并行，结果追加写进一张 csv，可断点续跑：已成功(ok)的 job 跳过，超时/出错的 job 重跑，新结果追加在后面。
+
+sweep yaml 示例（grid 做笛卡尔积，jobs 直接列出；两者可同时存在）::
+
+    grid:
+      simulation_steps: [5000, 20000]
+      random_order_num: [50, 200]
+      device_copies:
+        - {}
+        - {"ASSEMBLER-05": 2}
+    jobs:
+      - {price: {Motor: {price_sell: 1200}}, bind_yaml: ../spec_yaml/init_bind_of_device_and_recipe.yaml}
+
+支持的覆盖项：
+· device_copies: {设备id: 份数}，复制设备（沿用原绑定），0 表示删除该设备
+· bind: {设备id: 配方名}，部分覆盖绑定；bind_yaml: 换一份绑定文件
+· price: {名称: {price_buy/price_sell/storage_cost_per_time_unit: 值}}
+· order_stream: 订单流配置，见 order_stream.py，不给则为 random_order_num 个订单全部在 0 时刻到达
+· random_order_num, order_seed, simulation_steps, fast_forward
+· scheduler: "greedy" 或 dispatch_rules.py 里的规则调度 "edd"/"bottleneck"/"stock_balance"/"myopic_profit"
+"""
+import argparse
+import copy
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from multiprocessing.connection import wait
+from pathlib import Path
+
+from pycode.CFG import (
+    DEVICE_ID_AND_SPEC_DICT,
+    RECIPE_NAME_AND_SPEC_DICT,
+    INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT,
+    INIT_STOCK_NAME_AND_SPEC_DICT,
+    INIT_PRICE_NAME_AND_SPEC_DICT,
+    INIT_ORDER_LIST,
+    INIT_MONEY,
+)
+from pycode.utils import load_yaml
+
+RESULT_FIELDS = [
+    "job_id",
+    "status",
+    "params",
+    "final_balance",
+    "total_energy",
+    "fill_rate",
+    "utilization",
+    "wall_time",
+]
+
+DEFAULT_PARAMS = {
+    "scheduler": "greedy",
+    "simulation_steps": 5000,
+    "random_order_num": 50,
+    "order_seed": 0,
+    "fast_forward": False,
+}
+
+
+def build_job_list(sweep_spec: dict) -> list[dict]:
+    rst = []
+    grid = sweep_spec.get("grid") or {}
+    if grid:
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            rst.append(dict(zip(keys, values)))
+    rst.extend(sweep_spec.get("jobs") or [])
+    return [{**DEFAULT_PARAMS, **params} for params in rst]
+
+
+def get_job_id(params: dict) -> str:
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def apply_device_copies(device_id_and_spec_dict, bind_dict, device_copies):
+    dev_rst = dict(device_id_and_spec_dict)
+    bind_rst = dict(bind_dict)
+    for dev_id, n in device_copies.items():
+        spec = dev_rst.pop(dev_id)
+        rcp_name = bind_rst.pop(dev_id)
+        for i in range(n):
+            new_id = dev_id if i == 0 else f"{dev_id}#{i}"
+            dev_rst[new_id] = {**spec, "id": new_id}
+            bind_rst[new_id] = rcp_name
+    return dev_rst, bind_rst
+
+
+def build_env_kwargs(params: dict) -> dict:
+    """把一组覆盖项转换成 FactoryEnv 的构造参数"""
+    if "bind_yaml" in params:
+        bind_dict = load_yaml(Path(params["bind_yaml"]))
+    else:
+        bind_dict = INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT
+    bind_dict = {**bind_dict, **params.get("bind", {})}
+
+    device_id_and_spec_dict, bind_dict = apply_device_copies(
+        device_id_and_spec_dict=DEVICE_ID_AND_SPEC_DICT,
+        bind_dict=bind_dict,
+        device_copies=params.get("device_copies", {}),
+    )
+
+    price_dict = copy.deepcopy(INIT_PRICE_NAME_AND_SPEC_DICT)
+    for name, field_dict in params.get("price", {}).items():
+        price_dict[name].update(field_dict)
+
+    return dict(
+        device_id_and_spec_dict=device_id_and_spec_dict,
+        recipe_name_and_spec_dict=RECIPE_NAME_AND_SPEC_DICT,
+        init_stock_name_and_spec_dict=INIT_STOCK_NAME_AND_SPEC_DICT,
+        init_bind_of_device_id_and_rcp_name_dict=bind_dict,
+        init_price_name_and_spec_dict=price_dict,
+        init_order_list=copy.deepcopy(INIT_ORDER_LIST),
+        init_money=INIT_MONEY,
+        schedule_mode=params["scheduler"],
+        dt=1,
+        manual_simulation_steps=params["simulation_steps"],
+        fast_forward=params["fast_forward"],
+        random_order_num=params["random_order_num"],
+        order_seed=params["order_seed"],
+        order_stream_spec=params.get("order_stream"),
+    )
+
+
+def get_job_row(params: dict, status) -> dict:
+    return {"job_id": get_job_id(params), "params": json.dumps(params, sort_keys=True), "status": status}
+
+
+def run_job(params: dict) -> dict:
+    """在当前进程里跑完一个组合，不管超时；超时见 JobProcess"""
+    from pycode.factory_env import FactoryEnv
+
+    t0 = time.perf_counter()
+    rst = get_job_row(params, "ok")
+    try:
+        env = FactoryEnv(**build_env_kwargs(params))
+        env.run_greedy(params["simulation_steps"])
+        rst.update(env.sim.get_result())
+    except Exception as e:
+        rst["status"] = f"error: {type(e).__name__}: {e}"
+    rst["wall_time"] = time.perf_counter() - t0
+    return rst
+
+
+def send_job_result(params: dict, conn):
+    conn.send(run_job(params))
+    conn.close()
+
+
+class JobProcess:
+    """
+    一个 job 一个子进程，结果经管道传回。超时由父进程判断并 kill 子进程，卡死在哪都能停下，
+    子进程意外退出（段错误、OOM）也记一行错误
+    """
+
+    def __init__(self, params: dict, timeout=None):
+        self.params = params
+        self.t0 = time.perf_counter()
+        self.deadline = None if timeout is None else self.t0 + timeout
+        self.conn, send_conn = mp.Pipe(duplex=False)
+        self.process = mp.Process(target=send_job_result, args=(params, send_conn))
+        self.process.start()
+        send_conn.close()
+
+    def get_remaining_time(self):
+        return None if self.deadline is None else max(self.deadline - time.perf_counter(), 0.0)
+
+    def is_expired(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def collect(self) -> dict:
+        """管道可读（有结果或子进程已退出）后调用"""
+        try:
+            rst = self.conn.recv()
+        except EOFError:
+            self.process.join()
+            rst = get_job_row(self.params, f"error: job 进程退出，exitcode={self.process.exitcode}")
+            rst["wall_time"] = time.perf_counter() - self.t0
+        self.process.join()
+        self.conn.close()
+        return rst
+
+    def kill(self) -> dict:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+        rst = get_job_row(self.params, "timeout")
+        rst["wall_time"] = time.perf_counter() - self.t0
+        return rst
+
+
+def run_job_with_timeout(params: dict, timeout=None) -> dict:
+    """子进程里跑一个组合，超过 timeout 秒就 kill 掉并标记 timeout"""
+    job = JobProcess(params, timeout)
+    if wait([job.conn], timeout=job.get_remaining_time()):
+        return job.collect()
+    return job.kill()
+
+
+def iter_job_results(params_list, max_workers, timeout=None):
+    """最多 max_workers 个 job 子进程同时跑，按完成顺序逐个产出结果行"""
+    # 先在父进程 import，fork 出的 job 进程不用各自再 import 一遍
+    import pycode.factory_env  # noqa: F401
+
+    todo_list = list(params_list)
+    running_list = []
+    while todo_list or running_list:
+        while todo_list and len(running_list) < max_workers:
+            running_list.append(JobProcess(todo_list.pop(0), timeout))
+        remaining_list = [t for t in (job.get_remaining_time() for job in running_list) if t is not None]
+        ready_set = set(wait([job.conn for job in running_list], timeout=min(remaining_list, default=None)))
+        for job in list(running_list):
+            if job.conn in ready_set:
+                row = job.collect()
+            elif job.is_expired():
+                row = job.kill()
+            else:
+                continue
+            running_list.remove(job)
+            yield row
+
+
+def load_done_job_id_set(result_path: Path) -> set:
+    if not result_path.exists():
+        return set()
+    with result_path.open("r", encoding="utf-8", newline="") as f:
+        return {row["job_id"] for row in csv.DictReader(f) if row["status"] == "ok"}
+
+
+def run_sweep(sweep_spec: dict, result_path: Path, max_workers=None, timeout=None):
+    """跑全部组合，已成功的 job 跳过；每完成一个立即追加一行到 result_path"""
+    job_list = build_job_list(sweep_spec)
+    done_job_id_set = load_done_job_id_set(result_path)
+    todo_list = [p for p in job_list if get_job_id(p) not in done_job_id_set]
+    print(f"sweep: {len(job_list)} jobs, {len(job_list) - len(todo_list)} already done, {len(todo_list)} to run")
+
+    write_header = not result_path.exists()
+    with result_path.open("a", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if write_header:
+            writer.writeheader()
+        row_iter = iter_job_results(todo_list, max_workers or os.cpu_count(), timeout)
+        for i, row in enumerate(row_iter, start=1):
+            writer.writerow(row)
+            f.flush()
+            print(f"[{i}/{len(todo_list)}] {row['job_id']} {row['status']} ({row['wall_time']:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行参数扫描")
+    parser.add_argument("sweep_yaml", type=Path)
+    parser.add_argument("--out", type=Path, default=Path("../logs/sweep_result.csv"))
+    parser.add_argument("--workers", type=int, default=None, help="默认用满本机所有核")
+    parser.add_argument("--timeout", type=float, default=None, help="单个 job 的超时秒数")
+    args = parser.parse_args()
+    run_sweep(
+        sweep_spec=load_yaml(args.sweep_yaml),
+        result_path=args.out,
+        max_workers=args.workers,
+        timeout=args.timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
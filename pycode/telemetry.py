@@ -0,0 +1,196 @@
+"""
+运行中模拟器的实时指标：每个 writer 一块共享内存环形缓冲区，单写者无锁，读者随时 attach。
+
+共享内存布局:
+· header int64[4]: [已写入条数 seq, capacity, n_fields, pid]
+· data float64[capacity, n_fields]: 第 seq % capacity 行为下一条
+写者先写整行，再把 seq + 1，读者以 seq 为准只读已写完的行；拷完后再核对一次 seq，丢掉拷贝期间可能被写者覆盖的行。
+字段名等元信息写在 registry_folder/<shm名>.json，读者靠它发现所有正在运行的 writer。
+
+读者 CLI:  python -m pycode.telemetry [--follow] [--interval 1.0]
+"""
+import argparse
+import json
+import os
+import time
+import weakref
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from pycode.utils import attach_shared_memory
+
+registry_folder = Path(os.environ.get("FACTORY_TELEMETRY_DIR", "/tmp/factory_telemetry"))
+
+HEADER_LEN = 4
+BASE_FIELD_LIST = ["clock", "total_balance", "step_balance", "total_energy", "utilization", "steps_per_sec"]
+
+
+class TelemetryWriter:
+    """
+    :param product_names: 要上报库存的可售产品
+    :param sample_every: 每多少个模拟步写一条
+    """
+
+    def __init__(self, product_names, sample_every=10, capacity=1024, tag=""):
+        self.product_names = list(product_names)
+        self.field_names = BASE_FIELD_LIST + [f"stock/{n}" for n in self.product_names]
+        self.sample_every = sample_every
+        self.capacity = capacity
+
+        n_fields = len(self.field_names)
+        self.shm = shared_memory.SharedMemory(
+            create=True,
+            size=8 * (HEADER_LEN + capacity * n_fields),
+        )
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((capacity, n_fields), dtype=np.float64, buffer=self.shm.buf, offset=8 * HEADER_LEN)
+        self.header[:] = [0, capacity, n_fields, os.getpid()]
+
+        registry_folder.mkdir(parents=True, exist_ok=True)
+        self.registry_path = registry_folder / f"{self.shm.name.lstrip('/')}.json"
+        self.registry_path.write_text(
+            json.dumps({
+                "shm_name": self.shm.name,
+                "pid": os.getpid(),
+                "tag": tag,
+                "field_names": self.field_names,
+            }),
+            encoding="utf-8",
+        )
+        self.finalizer = weakref.finalize(self, release_writer, self.shm, self.registry_path)
+
+        self.last_clock = None
+        self.last_time = None
+
+    def maybe_publish(self, sim):
+        if sim.clock % self.sample_every:
+            return
+        now = time.perf_counter()
+        if self.last_clock is None or sim.clock < self.last_clock:
+            steps_per_sec = 0.0
+        else:
+            steps_per_sec = (sim.clock - self.last_clock) / sim.dt / max(now - self.last_time, 1e-9)
+        self.last_clock, self.last_time = sim.clock, now
+
+        seq = int(self.header[0])
+        row = self.data[seq % self.capacity]
+        row[0] = sim.clock
+        row[1] = sim.total_balance
+        row[2] = sim.step_balance
+        row[3] = sim.total_energy_kwh_used
+        row[4] = sim.get_utilization()
+        row[5] = steps_per_sec
+        for i, name in enumerate(self.product_names):
+            row[len(BASE_FIELD_LIST) + i] = sim.stock_mng.get_obj_by_name(name).quantity
+        self.header[0] = seq + 1
+
+    def close(self):
+        self.finalizer()
+
+
+def release_writer(shm, registry_path):
+    registry_path.unlink(missing_ok=True)
+    shm.close()
+    shm.unlink()
+
+
+class TelemetryReader:
+    def __init__(self, registry_path: Path):
+        self.meta = json.loads(registry_path.read_text(encoding="utf-8"))
+        self.field_names = self.meta["field_names"]
+        self.shm = attach_shared_memory(self.meta["shm_name"])
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=self.shm.buf)
+        capacity, n_fields = int(self.header[1]), int(self.header[2])
+        self.data = np.ndarray((capacity, n_fields), dtype=np.float64, buffer=self.shm.buf, offset=8 * HEADER_LEN)
+
+    def read_since(self, seq_from):
+        """
+        返回 (当前 seq, seq_from 之后的记录)，被覆盖掉的旧记录跳过。
+        读者没有锁：拷完之后再读一次 seq，拷贝期间写者可能已经写到的行（第 new_seq - capacity 条及更早的）丢掉
+        """
+        seq = int(self.header[0])
+        capacity = len(self.data)
+        # 第 seq - capacity 条所在的行就是写者下一条要写的行
+        seq_from = max(seq_from, seq - capacity + 1, 0)
+        rows = [self.data[i % capacity].copy() for i in range(seq_from, seq)]
+        new_seq = int(self.header[0])
+        n_stale = new_seq - capacity + 1 - seq_from
+        if n_stale > 0:
+            rows = rows[n_stale:]
+        return seq, rows
+
+    def close(self):
+        del self.header, self.data
+        self.shm.close()
+
+
+def get_registry_paths() -> list:
+    if not registry_folder.exists():
+        return []
+    return sorted(registry_folder.glob("*.json"))
+
+
+def open_reader(registry_path: Path) -> TelemetryReader | None:
+    try:
+        return TelemetryReader(registry_path)
+    except (FileNotFoundError, json.JSONDecodeError):
+        # writer 已退出，或登记文件还没写完（下次再试）
+        return None
+
+
+def attach_all_readers() -> dict:
+    return update_readers({})
+
+
+def update_readers(readers: dict) -> dict:
+    """
+    按登记文件同步 readers（登记文件路径 -> TelemetryReader）：已退出的 writer 关掉对应 reader，
+    只给新出现的 writer 建 reader，已打开的不重复映射。原地修改并返回 readers
+    """
+    path_list = get_registry_paths()
+    path_set = set(path_list)
+    for p in readers.keys() - path_set:
+        readers.pop(p).close()
+    for p in path_list:
+        if p not in readers:
+            reader = open_reader(p)
+            if reader is not None:
+                readers[p] = reader
+    return readers
+
+
+def format_row(reader: TelemetryReader, row):
+    label = reader.meta["tag"] or reader.meta["pid"]
+    fields = " ".join(f"{name}={v:,.2f}" for name, v in zip(reader.field_names, row))
+    return f"[{label}] {fields}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看所有正在运行的 FactorySim 的实时指标")
+    parser.add_argument("--follow", action="store_true", help="持续输出新记录，类似 tail -f")
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    readers = {}
+    seq_dict = {}
+    while True:
+        update_readers(readers)
+        for p in seq_dict.keys() - readers.keys():
+            del seq_dict[p]
+        for p, reader in readers.items():
+            if args.follow:
+                seq, rows = reader.read_since(seq_dict.get(p, 0))
+            else:
+                seq, rows = reader.read_since(int(reader.header[0]) - 1)
+            seq_dict[p] = seq
+            for row in rows:
+                print(format_row(reader, row))
+        if not args.follow:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+轨迹存储：把 FactoryEnv 的转移追加写进分块的内存映射数组，供离线 RL、模仿学习、回放用。
+· 目录布局: <store_dir>/meta.json + chunk_<序号>/<字段>.npy。每块用 np.lib.format.open_memmap 预分配 chunk_size 行，
+  是普通 .npy，np.load(mmap_mode="r") 就能读；写满一块再开下一块
+· 字段: obs 为 flat 布局（见 FactoryEnv.get_flat_obs_layout），dict 观测写入前展开；action 为每台机器的调度选择下标；
+  mask 为动作掩码，按位打包（np.packbits）；reward；done（episode 结束）；truncated（录制中途停止，下一行不是它的后继）
+· 第 t 行为 (s_t, a_t, mask(s_t), r_t, done_t)。同一 episode 的转移连续存放，所以不是 done / truncated 的行，
+  下一行的 obs 就是 s_{t+1}
+· meta.json 里的 size 只在 flush() 时更新，写到一半中断时读端看不到未 flush 的行
+· 读端 TrajectoryReader 只 mmap 打开用到的块，按下标取小批量，内存占用与数据集大小无关
+
+录制:
+· PPO 训练: model.learn(..., callback=TrajectoryRecorderCallback("../logs/traj/ppo"))
+· greedy / 规则调度: record_heuristic(env, writer, steps)
+用法（录 greedy 数据并测读写速度）: python -m pycode.trajectory_store [--out ../logs/traj/greedy] [--episodes 4] [--steps 5000]
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+TRAJECTORY_FORMAT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 1 << 18
+MAX_OPEN_CHUNK_NUM = 16
+
+
+def get_field_spec_dict(meta) -> dict:
+    """字段名 -> (每行的 shape, dtype)"""
+    return {
+        "obs": ((meta["obs_dim"],), np.dtype(meta["obs_dtype"])),
+        "action": ((meta["action_dim"],), np.dtype(np.int16)),
+        "mask": (((meta["mask_dim"] + 7) // 8,), np.dtype(np.uint8)),
+        "reward": ((), np.dtype(np.float32)),
+        "done": ((), np.dtype(bool)),
+        "truncated": ((), np.dtype(bool)),
+    }
+
+
+def get_chunk_dir(store_dir: Path, chunk_idx) -> Path:
+    return store_dir / f"chunk_{chunk_idx:05d}"
+
+
+def load_meta(store_dir: Path) -> dict:
+    with (store_dir / "meta.json").open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["format_version"] != TRAJECTORY_FORMAT_VERSION:
+        raise ValueError(f"轨迹格式版本 {meta['format_version']} 与当前 {TRAJECTORY_FORMAT_VERSION} 不一致")
+    return meta
+
+
+def flatten_obs_batch(obs_batch, flat_obs_layout, flat_obs_dim):
+    """一批 dict 观测 {name: (n, ...)} 按 flat_obs_layout 展开成 (n, flat_obs_dim)，与 FactoryEnv.get_flat_observation 一致"""
+    if not isinstance(obs_batch, dict):
+        return np.asarray(obs_batch, dtype=np.float32)
+    n = len(next(iter(obs_batch.values())))
+    rst = np.zeros((n, flat_obs_dim), dtype=np.float32)
+    row = np.arange(n)[:, None]
+    for name, (slc, n_cls) in flat_obs_layout.items():
+        v = obs_batch[name]
+        if n_cls is None:
+            rst[:, slc] = v
+        else:
+            rst[row, slc.start + np.arange(v.shape[1]) * n_cls + v] = 1.0
+    return rst
+
+
+class TrajectoryWriter:
+    """
+    追加写。store_dir 已有数据时接着写，维度须一致。
+    """
+
+    def __init__(self, store_dir, obs_dim, action_dim, mask_dim, chunk_size=DEFAULT_CHUNK_SIZE, obs_dtype="float32"):
+        self.store_dir = Path(store_dir)
+        if (self.store_dir / "meta.json").exists():
+            self.meta = load_meta(self.store_dir)
+            new_dims = (obs_dim, action_dim, mask_dim, np.dtype(obs_dtype).name)
+            old_dims = (self.meta["obs_dim"], self.meta["action_dim"], self.meta["mask_dim"], self.meta["obs_dtype"])
+            assert new_dims == old_dims, f"{self.store_dir} 已有数据的维度 {old_dims} 与 {new_dims} 不一致"
+        else:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            self.meta = {
+                "format_version": TRAJECTORY_FORMAT_VERSION,
+                "obs_dim": obs_dim,
+                "action_dim": action_dim,
+                "mask_dim": mask_dim,
+                "obs_dtype": np.dtype(obs_dtype).name,
+                "chunk_size": chunk_size,
+                "size": 0,
+            }
+        self.field_spec_dict = get_field_spec_dict(self.meta)
+        self.size = self.meta["size"]
+        # 当前块的 {字段: memmap}
+        self.chunk_idx = None
+        self.chunk_array_dict = None
+
+    def __len__(self):
+        return self.size
+
+    def open_chunk(self, chunk_idx):
+        self.flush_chunk()
+        chunk_dir = get_chunk_dir(self.store_dir, chunk_idx)
+        chunk_dir.mkdir(exist_ok=True)
+        rst = {}
+        for name, (shape, dtype) in self.field_spec_dict.items():
+            path = chunk_dir / f"{name}.npy"
+            if path.exists():
+                rst[name] = np.load(path, mmap_mode="r+")
+            else:
+                rst[name] = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=dtype, shape=(self.meta["chunk_size"], *shape),
+                )
+        self.chunk_idx = chunk_idx
+        self.chunk_array_dict = rst
+
+    def append_batch(self, obs, action, mask, reward, done, truncated=None):
+        """
+        追加 n 行，各参数第 0 维为 n。obs 已是 flat 布局，mask 为未打包的 bool (n, mask_dim)
+        """
+        n = len(reward)
+        field_dict = {
+            "obs": obs,
+            "action": action,
+            "mask": np.packbits(np.asarray(mask, dtype=bool).reshape(n, -1), axis=1),
+            "reward": reward,
+            "done": done,
+            "truncated": truncated if truncated is not None else np.zeros(n, dtype=bool),
+        }
+        chunk_size = self.meta["chunk_size"]
+        start = 0
+        while start < n:
+            chunk_idx, offset = divmod(self.size, chunk_size)
+            if chunk_idx != self.chunk_idx:
+                self.open_chunk(chunk_idx)
+            m = min(n - start, chunk_size - offset)
+            for name, arr in self.chunk_array_dict.items():
+                arr[offset:offset + m] = field_dict[name][start:start + m]
+            start += m
+            self.size += m
+
+    def flush_chunk(self):
+        if self.chunk_array_dict is not None:
+            for arr in self.chunk_array_dict.values():
+                arr.flush()
+
+    def flush(self):
+        """数据落盘后再更新 meta.json 的 size"""
+        self.flush_chunk()
+        self.meta["size"] = self.size
+        tmp_path = self.store_dir / "meta.json.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_path, self.store_dir / "meta.json")
+
+    def close(self):
+        self.flush()
+        self.chunk_idx = None
+        self.chunk_array_dict = None
+
+
+def get_writer_for_env(store_dir, env, chunk_size=DEFAULT_CHUNK_SIZE) -> TrajectoryWriter:
+    return TrajectoryWriter(
+        store_dir,
+        obs_dim=env.flat_obs_dim,
+        action_dim=env.dev_num,
+        mask_dim=env.dev_num * env.max_schedule_num,
+        chunk_size=chunk_size,
+    )
+
+
+class TrajectoryReader:
+    """
+    mmap 只读。最多同时打开 MAX_OPEN_CHUNK_NUM 个块，超出时关掉最久没用的。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.meta = load_meta(self.store_dir)
+        self.field_spec_dict = get_field_spec_dict(self.meta)
+        self.size = self.meta["size"]
+        self.chunk_size = self.meta["chunk_size"]
+        self.chunk_idx_and_array_dict = OrderedDict()
+
+    def __len__(self):
+        return self.size
+
+    def get_chunk(self, chunk_idx) -> dict:
+        rst = self.chunk_idx_and_array_dict.get(chunk_idx)
+        if rst is not None:
+            self.chunk_idx_and_array_dict.move_to_end(chunk_idx)
+            return rst
+        chunk_dir = get_chunk_dir(self.store_dir, chunk_idx)
+        rst = {name: np.load(chunk_dir / f"{name}.npy", mmap_mode="r") for name in self.field_spec_dict}
+        self.chunk_idx_and_array_dict[chunk_idx] = rst
+        if len(self.chunk_idx_and_array_dict) > MAX_OPEN_CHUNK_NUM:
+            self.chunk_idx_and_array_dict.popitem(last=False)
+        return rst
+
+    def gather(self, idx) -> dict:
+        """按全局下标取行，返回 {字段: 数组}，顺序与 idx 一致"""
+        idx = np.asarray(idx, dtype=np.int64)
+        assert idx.size == 0 or (idx.min() >= 0 and idx.max() < self.size), "下标越界"
+        rst = {
+            name: np.empty((len(idx), *shape), dtype=dtype) for name, (shape, dtype) in self.field_spec_dict.items()
+        }
+        chunk_idx_arr, offset_arr = np.divmod(idx, self.chunk_size)
+        for chunk_idx in np.unique(chunk_idx_arr):
+            sel = np.flatnonzero(chunk_idx_arr == chunk_idx)
+            # 块内按偏移排序后读，mmap 的页访问是顺序的
+            order = sel[np.argsort(offset_arr[sel])]
+            chunk = self.get_chunk(int(chunk_idx))
+            for name, arr in rst.items():
+                arr[order] = chunk[name][offset_arr[order]]
+        return rst
+
+    def get_batch(self, idx) -> dict:
+        """
+        小批量：obs, action, mask（解包成 bool）, reward, done, truncated, next_obs, has_next。
+        has_next 为 False 的行（done、truncated、最后一行）next_obs 全 0
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        rst = self.gather(idx)
+        rst["mask"] = np.unpackbits(rst["mask"], axis=1, count=self.meta["mask_dim"]).astype(bool)
+        has_next = ~(rst["done"] | rst["truncated"]) & (idx + 1 < self.size)
+        next_obs = np.zeros_like(rst["obs"])
+        if has_next.any():
+            next_obs[has_next] = self.gather(idx[has_next] + 1)["obs"]
+        rst["next_obs"] = next_obs
+        rst["has_next"] = has_next
+        return rst
+
+    def sample(self, batch_size, rng: np.random.Generator) -> dict:
+        return self.get_batch(rng.integers(0, self.size, size=batch_size))
+
+    def iter_minibatches(self, batch_size, rng: np.random.Generator = None):
+        """
+        遍历一遍全部数据。rng 给定时按块打乱：块的顺序随机、块内随机排列，索引占用的内存只与 chunk_size 有关
+        """
+        chunk_num = (self.size + self.chunk_size - 1) // self.chunk_size
+        chunk_order = rng.permutation(chunk_num) if rng is not None else range(chunk_num)
+        for chunk_idx in chunk_order:
+            start = chunk_idx * self.chunk_size
+            idx = np.arange(start, min(start + self.chunk_size, self.size))
+            if rng is not None:
+                rng.shuffle(idx)
+            for i in range(0, len(idx), batch_size):
+                yield self.get_batch(idx[i:i + batch_size])
+
+
+class TrajectoryRecorderCallback(BaseCallback):
+    """
+    PPO 采样时记录每个转移。各环境的转移先按环境缓存，episode 结束时整段写入，保证同一 episode 连续存放；
+    训练结束时未结束的 episode 也写入，最后一行标 truncated
+    """
+
+    def __init__(self, store_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self.store_dir = store_dir
+        self.chunk_size = chunk_size
+        self.writer = None
+        self.flat_obs_layout = None
+        self.flat_obs_dim = None
+        self.env_buffer_list = None
+
+    def _on_training_start(self):
+        env = self.training_env
+        self.flat_obs_layout = env.get_attr("flat_obs_layout", indices=[0])[0]
+        self.flat_obs_dim = env.get_attr("flat_obs_dim", indices=[0])[0]
+        dev_num = env.get_attr("dev_num", indices=[0])[0]
+        max_schedule_num = env.get_attr("max_schedule_num", indices=[0])[0]
+        if self.writer is None:
+            self.writer = TrajectoryWriter(
+                self.store_dir, self.flat_obs_dim, dev_num, dev_num * max_schedule_num, self.chunk_size,
+            )
+            self.env_buffer_list = [[] for _ in range(env.num_envs)]
+
+    def _on_step(self) -> bool:
+        # 此时 model._last_obs 还是执行动作前的观测
+        obs = flatten_obs_batch(self.model._last_obs, self.flat_obs_layout, self.flat_obs_dim)
+        action_masks = self.locals["action_masks"]
+        actions = self.locals["actions"]
+        rewards = self.locals["rewards"]
+        dones = self.locals["dones"]
+        for i, buffer in enumerate(self.env_buffer_list):
+            buffer.append((obs[i], actions[i], action_masks[i], rewards[i], dones[i]))
+            if dones[i]:
+                self.write_buffer(buffer, truncated=False)
+        return True
+
+    def write_buffer(self, buffer, truncated):
+        if not buffer:
+            return
+        obs, action, mask, reward, done = (np.stack(col) for col in zip(*buffer))
+        truncated_arr = np.zeros(len(buffer), dtype=bool)
+        truncated_arr[-1] = truncated
+        self.writer.append_batch(obs, action, mask, reward, done, truncated_arr)
+        buffer.clear()
+
+    def _on_rollout_end(self):
+        self.writer.flush()
+
+    def _on_training_end(self):
+        for buffer in self.env_buffer_list:
+            self.write_buffer(buffer, truncated=True)
+        self.writer.flush()
+
+
+def record_heuristic(env, writer: TrajectoryWriter, steps, write_every=4096):
+    """
+    用 greedy / 规则调度跑 steps 步并记录，计划换算成动作下标（get_action_ndarray_from_dict），
+    每步的 reward 为 step_balance，与 decision_interval=1 的 step() 一致
+    """
+    row_list = []
+
+    def write(truncated):
+        obs, action, mask, reward, done = (np.stack(col) for col in zip(*row_list))
+        truncated_arr = np.zeros(len(row_list), dtype=bool)
+        truncated_arr[-1] = truncated
+        writer.append_batch(obs, action, mask, reward, done, truncated_arr)
+        row_list.clear()
+
+    sim = env.sim
+    for _ in range(steps):
+        obs = env.get_flat_observation(env.get_observation_1())
+        mask = env.action_masks()
+        if env.rule_dispatcher is not None:
+            env.rule_schedule()
+        else:
+            env.greedy_schedule()
+        action = env.get_action_ndarray_from_dict(env.scheduler.schedule_plan)
+        sim.high_level_step(env.scheduler)
+        done = sim.clock >= env.simulation_steps
+        row_list.append((obs, action, mask, np.float32(sim.step_balance), done))
+        if done:
+            break
+        # 单个环境顺序写，分批写入不打断连续性
+        if len(row_list) >= write_every:
+            write(truncated=False)
+    if row_list:
+        write(truncated=not row_list[-1][-1])
+    writer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制 greedy / 规则调度轨迹并测读写速度")
+    parser.add_argument("--out", type=Path, default=Path("../logs/traj/greedy"))
+    parser.add_argument("--scheduler", default="greedy")
+    parser.add_argument("--episodes", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--overwrite", action="store_true", help="先清空 --out")
+    args = parser.parse_args()
+
+    from pycode.factory_env import FactoryEnv
+    from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+    if args.overwrite and args.out.exists():
+        shutil.rmtree(args.out)
+    writer = None
+    t0 = time.perf_counter()
+    for seed in range(args.episodes):
+        params = {**DEFAULT_PARAMS, "scheduler": args.scheduler, "simulation_steps": args.steps, "order_seed": seed}
+        env = FactoryEnv(**build_env_kwargs(params), artifact_mode="none")
+        writer = writer or get_writer_for_env(args.out, env)
+        record_heuristic(env, writer, args.steps)
+    writer.close()
+    record_time = time.perf_counter() - t0
+
+    reader = TrajectoryReader(args.out)
+    rng = np.random.default_rng(0)
+    n_batch = 200
+    t0 = time.perf_counter()
+    for _ in range(n_batch):
+        reader.sample(args.batch_size, rng)
+    sample_time = time.perf_counter() - t0
+    print(
+        f"{len(reader):,} transitions, obs_dim={reader.meta['obs_dim']}; "
+        f"record {args.episodes * args.steps / record_time:,.0f} steps/s (incl. simulation); "
+        f"sample {n_batch * args.batch_size / sample_time:,.0f} transitions/s (batch {args.batch_size})"
+    )
+
+
+if __name__ == '__main__':
+    main()
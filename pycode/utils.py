@@ -1,11 +1,16 @@
+import dataclasses
 import datetime
+import functools
+import json
+import sys
 from collections import defaultdict
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
 from typing import Dict
 
 from ruamel.yaml import YAML
 
-from pycode.data_class import Recipe
+from pycode.data_class import Device, Recipe
 from pycode.dev_runtime import DevRuntime
 
 yaml = YAML(typ="safe")
@@ -71,13 +76,49 @@ def build_dict_of_recipe_name_and_obj(
         rcp_obj = Recipe(**rcp_dict)
         if whether_convert_to_one_second_of_cycle_time:
             c_time = rcp_obj.cycle_time
-            divide_dict_values_by(c_time, rcp_obj.inputs)
-            divide_dict_values_by(c_time, rcp_obj.outputs)
-            rcp_obj.cycle_time = 1
+            inputs = dict(rcp_obj.inputs)
+            outputs = dict(rcp_obj.outputs)
+            divide_dict_values_by(c_time, inputs)
+            divide_dict_values_by(c_time, outputs)
+            rcp_obj = dataclasses.replace(rcp_obj, cycle_time=1, inputs=inputs, outputs=outputs)
         rst[rcp_name] = rcp_obj
     return rst
 
 
+def get_shared_device_and_recipe_obj_dicts(device_id_and_spec_dict, recipe_name_and_spec_dict):
+    """
+    同一进程内配置相同的环境共用一份 Device / Recipe 对象及这两个字典，调用方只读不改。
+    按配置内容缓存，sweep 等每次新建配置字典的调用方也能命中；只留最近几份配置，长时间 sweep 不会越攒越多。
+    """
+    key = json.dumps([device_id_and_spec_dict, recipe_name_and_spec_dict], sort_keys=True)
+    return build_shared_device_and_recipe_obj_dicts(key)
+
+
+# 配置内容(json) -> (设备id -> Device, 配方名 -> Recipe)
+@functools.lru_cache(maxsize=8)
+def build_shared_device_and_recipe_obj_dicts(key):
+    device_id_and_spec_dict, recipe_name_and_spec_dict = json.loads(key)
+    return (
+        {dev_id: Device(**dev_dict) for dev_id, dev_dict in device_id_and_spec_dict.items()},
+        build_dict_of_recipe_name_and_obj(
+            recipe_name_and_spec_dict=recipe_name_and_spec_dict,
+            whether_convert_to_one_second_of_cycle_time=False,
+        ),
+    )
+
+
 def divide_dict_values_by(x, dic: dict):
     for k, v in dic.items():
         dic[k] = v / x
+
+
+def attach_shared_memory(name) -> shared_memory.SharedMemory:
+    """
+    按名字打开别的进程建的共享内存，不登记到本进程的 resource_tracker，免得本进程退出时把它删掉。
+    3.13 起用 track=False；3.12 打开时会自动登记，打开后再注销
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
@@ -0,0 +1,9 @@
+import os
+from pathlib import Path
+
+PYCODE_DIR = Path(__file__).resolve().parent.parent / "pycode"
+
+
+def pytest_configure(config):
+    # 配置里的 yaml 路径都相对 pycode 目录（../spec_yaml），测试也在 pycode 目录下跑
+    os.chdir(PYCODE_DIR)
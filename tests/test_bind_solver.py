@@ -0,0 +1,43 @@
+import pytest
+
+from pycode.CFG import (
+    DEVICE_ID_AND_SPEC_DICT,
+    INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT,
+    INIT_PRICE_NAME_AND_SPEC_DICT,
+    INIT_STOCK_NAME_AND_SPEC_DICT,
+    RECIPE_NAME_AND_SPEC_DICT,
+)
+from pycode.bind_solver import solve_bind
+from pycode.sweep_runner import apply_device_copies
+
+
+def solve_scaled_bind(scale):
+    device_id_and_spec_dict, prev_bind_dict = apply_device_copies(
+        device_id_and_spec_dict=DEVICE_ID_AND_SPEC_DICT,
+        bind_dict=INIT_BIND_OF_DEVICE_ID_AND_RECIPE_NAME_DICT,
+        device_copies={dev_id: scale for dev_id in DEVICE_ID_AND_SPEC_DICT} if scale != 1 else {},
+    )
+    _, report = solve_bind(
+        device_id_and_spec_dict,
+        RECIPE_NAME_AND_SPEC_DICT,
+        INIT_STOCK_NAME_AND_SPEC_DICT,
+        INIT_PRICE_NAME_AND_SPEC_DICT,
+        horizon=5000,
+        prev_bind_dict=prev_bind_dict,
+    )
+    return report
+
+
+def test_optimal_prev_bind_is_kept():
+    """--scale 400 时原绑定已达到 LP 上界，利润打平不应改动任何设备"""
+    report = solve_scaled_bind(400)
+    assert report["prev"]["profit_per_step"] == pytest.approx(report["relaxed_profit_per_step"])
+    assert report["solved"]["profit_per_step"] == pytest.approx(report["prev"]["profit_per_step"])
+    assert report["changed_dev_num"] == 0
+
+
+@pytest.mark.parametrize("scale", [1, 3])
+def test_solved_bind_improves_on_suboptimal_prev(scale):
+    report = solve_scaled_bind(scale)
+    assert report["solved"]["profit_per_step"] > report["prev"]["profit_per_step"]
+    assert report["changed_dev_num"] > 0
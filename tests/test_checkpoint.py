@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from pycode.factory_env import FactoryEnv
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+
+def get_env_kwargs(steps=3000, **params) -> dict:
+    return {**build_env_kwargs({**DEFAULT_PARAMS, "simulation_steps": steps, **params}), "artifact_mode": "none",
+            "record_history": True}
+
+
+def test_fractional_order_quantity_survives_checkpoint(tmp_path):
+    kwargs = get_env_kwargs()
+    kwargs["init_order_list"] = [
+        {"name": "Motor", "quantity": 2.5, "due_time": 2000},
+        {"name": "Frame", "quantity": 3, "due_time": 2500},
+    ]
+    env = FactoryEnv(**kwargs)
+    env.run_greedy(100)
+    env.save_checkpoint(tmp_path / "ck.npz")
+
+    resumed = FactoryEnv(**kwargs)
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    expected = [(o.name, o.quantity, type(o.quantity), o.due_time) for o in env.sim.order_mng.get_raw_list()]
+    actual = [(o.name, o.quantity, type(o.quantity), o.due_time) for o in resumed.sim.order_mng.get_raw_list()]
+    assert ("Motor", 2.5, float, 2000) in actual
+    assert actual == expected
+
+
+def get_run_snapshot(env) -> tuple:
+    sim = env.sim
+    h = sim.history_recorder
+    result_mng = sim.price_mng.order_sell_result_mng
+    return (
+        sim.total_balance,
+        sim.total_energy_kwh_used,
+        sim.clock,
+        {group: dict(h.get_vector_group(group)) for group in ("gantt", "dev_state", "stock")},
+        dict(h.scalar_logs),
+        result_mng.result_table.get_column("sold_money").tolist(),
+        result_mng.episode_metrics.to_info_dict(),
+    )
+
+
+@pytest.mark.parametrize("fast_forward, steps, cut", [(False, 3000, 1234), (True, 30_000, 7001)])
+def test_greedy_resume_matches_uninterrupted_run(tmp_path, fast_forward, steps, cut):
+    kwargs = get_env_kwargs(steps, fast_forward=fast_forward)
+    uninterrupted = FactoryEnv(**kwargs)
+    uninterrupted.run_greedy(steps)
+
+    env = FactoryEnv(**kwargs)
+    env.run_greedy(cut)
+    env.save_checkpoint(tmp_path / "ck.npz", include_history=True)
+    resumed = FactoryEnv(**kwargs)
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    resumed.run_greedy(steps - resumed.sim.clock)
+
+    assert get_run_snapshot(resumed) == get_run_snapshot(uninterrupted)
+
+
+def run_masked_random_actions(env, n) -> list:
+    rst = []
+    for _ in range(n):
+        mask = env.action_masks().reshape(env.dev_num, env.max_schedule_num).astype(np.int8)
+        obs, reward, _, _, _ = env.step(env.action_space.sample(mask=tuple(mask)))
+        rst.append((reward, {name: arr.tolist() for name, arr in obs.items()}))
+    return rst
+
+
+def test_manual_resume_matches_uninterrupted_run(tmp_path):
+    kwargs = get_env_kwargs(scheduler="manual")
+    kwargs.update(visible_order_sort="highest_value", decision_interval=3)
+
+    uninterrupted = FactoryEnv(**kwargs)
+    uninterrupted.reset()
+    uninterrupted.action_space.seed(5)
+    expected = run_masked_random_actions(uninterrupted, 600)
+
+    env = FactoryEnv(**kwargs)
+    env.reset()
+    env.action_space.seed(5)
+    actual = run_masked_random_actions(env, 250)
+    env.save_checkpoint(tmp_path / "ck.npz")
+    resumed = FactoryEnv(**kwargs)
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    actual += run_masked_random_actions(resumed, 350)
+
+    assert actual == expected
@@ -0,0 +1,120 @@
+import numpy as np
+
+from pycode.demand_buckets import DemandBuckets
+from pycode.factory_env import FactoryEnv, get_fac_env
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+HORIZONS = [10, 60, 300, 1800]
+POISSON_ORDER_STREAM_SPEC = {
+    "arrival": {"process": "poisson", "rate": 0.05},
+    "product_mix": ["Motor", "Frame"],
+    "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+    "lead_time": {"dist": "uniform", "low": 0, "high": 3000},
+}
+
+
+def get_brute_force_buckets(order_mng) -> np.ndarray:
+    """对整个订单簿逐单重算"""
+    buckets = order_mng.demand_buckets
+    rst = np.zeros((len(buckets.product_names), len(buckets.horizons)))
+    for o in order_mng.get_raw_list():
+        p = buckets.product_name_and_idx_dict.get(o.name)
+        if p is None:
+            continue
+        for b, horizon in enumerate(buckets.horizons):
+            if o.due_time - order_mng.elapsed <= horizon:
+                rst[p, b] += o.quantity
+    return rst
+
+
+def assert_buckets_match(order_mng):
+    assert order_mng.demand_buckets.elapsed == order_mng.elapsed
+    np.testing.assert_array_equal(order_mng.demand_buckets.cum_quantity, get_brute_force_buckets(order_mng))
+
+
+def run_masked_random_actions(env, n, rng):
+    obs_list = []
+    for _ in range(n):
+        mask = env.get_my_action_mask()["action_mask"]
+        obs, _, _, _, _ = env.step(np.array([rng.choice(np.flatnonzero(row)) for row in mask]))
+        assert_buckets_match(env.sim.order_mng)
+        np.testing.assert_array_equal(obs["demand_buckets"], get_brute_force_buckets(env.sim.order_mng).ravel())
+        obs_list.append(obs["demand_buckets"])
+    return obs_list
+
+
+def get_manual_env():
+    return get_fac_env(artifact_mode="none", order_seed=1, demand_bucket_horizons=HORIZONS,
+                       order_stream_spec=POISSON_ORDER_STREAM_SPEC)
+
+
+def test_manual_run_matches_brute_force():
+    env = get_manual_env()
+    env.reset()
+    assert_buckets_match(env.sim.order_mng)
+    run_masked_random_actions(env, 499, np.random.default_rng(0))
+
+
+def test_checkpoint_rebuild_matches_brute_force(tmp_path):
+    uninterrupted = get_manual_env()
+    uninterrupted.reset()
+    expected = run_masked_random_actions(uninterrupted, 400, np.random.default_rng(2))
+
+    env = get_manual_env()
+    env.reset()
+    rng = np.random.default_rng(2)
+    actual = run_masked_random_actions(env, 150, rng)
+    env.save_checkpoint(tmp_path / "ck.npz")
+    resumed = get_manual_env()
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    assert_buckets_match(resumed.sim.order_mng)
+    actual += run_masked_random_actions(resumed, 250, rng)
+    np.testing.assert_array_equal(np.stack(actual), np.stack(expected))
+
+
+def test_fast_forward_jumps_match_brute_force():
+    """快进一次推进几百步，advance_to 走按登记表扫描的分支"""
+    steps = 30_000
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps, "fast_forward": True}
+    env = FactoryEnv(**build_env_kwargs(params), artifact_mode="none", demand_bucket_horizons=HORIZONS)
+    order_mng = env.sim.order_mng
+    buckets = order_mng.demand_buckets
+
+    scan_branch_cnt = 0
+    advance_to = buckets.advance_to
+
+    def checked_advance_to(elapsed):
+        nonlocal scan_branch_cnt
+        gap = elapsed - buckets.elapsed
+        if any(crossing and gap > len(crossing) for crossing in buckets.crossing_list):
+            scan_branch_cnt += 1
+        advance_to(elapsed)
+
+    buckets.advance_to = checked_advance_to
+    detector = env.sim.steady_state_detector
+    try_fast_forward = detector.try_fast_forward
+
+    def checked_try_fast_forward(sim, max_steps):
+        jumped = try_fast_forward(sim, max_steps)
+        if jumped:
+            assert_buckets_match(order_mng)
+        return jumped
+
+    detector.try_fast_forward = checked_try_fast_forward
+    env.run_greedy(steps)
+    assert detector.jump_cnt > 0
+    assert scan_branch_cnt > 0
+    assert_buckets_match(order_mng)
+
+
+def test_unknown_product_is_ignored():
+    buckets = DemandBuckets(["Motor"], horizons=[5, 20])
+    buckets.add("Frame", 3, 4)
+    buckets.add("Motor", 2, 30)
+    buckets.add("Motor", 1, 5)
+    np.testing.assert_array_equal(buckets.cum_quantity, [[1, 1]])
+    buckets.advance_to(10)
+    np.testing.assert_array_equal(buckets.cum_quantity, [[1, 3]])
+    buckets.remove_due("Frame", 3)
+    buckets.advance_to(25)
+    np.testing.assert_array_equal(buckets.cum_quantity, [[3, 3]])
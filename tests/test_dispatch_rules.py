@@ -0,0 +1,30 @@
+from pycode.factory_env import FactoryEnv
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+
+def get_assembler_plan(schedule_mode, order_list, stock_dict):
+    kwargs = build_env_kwargs({**DEFAULT_PARAMS, "scheduler": schedule_mode, "random_order_num": 0})
+    kwargs["init_order_list"] = order_list
+    env = FactoryEnv(**kwargs, artifact_mode="none")
+    for name, qty in stock_dict.items():
+        env.sim.stock_mng.add_stock(name, qty)
+    plan = env.rule_dispatcher.get_schedule_plan(env.sim)
+    return [plan[dev_id] for dev_id, dev_rt in zip(env.sim.dev_id_list, env.sim.dev_rt_list)
+            if dev_rt.device.category == "Assembler"]
+
+
+def test_myopic_profit_differs_from_stock_balance():
+    """
+    Frame 欠得多、Motor 只欠 1 台，但 Rotor 积压：stock_balance 先补缺口大的 Frame，
+    myopic_profit 算上积压原料不值钱，先做每秒增值高得多的 MotorFinal
+    """
+    order_list = [
+        {"name": "Motor", "quantity": 1, "due_time": 500},
+        {"name": "Frame", "quantity": 100, "due_time": 500},
+    ]
+    stock_dict = {"Rotor": 1000, "Stator": 2, "ReinforcedPlate": 3, "IronBar": 1000}
+    balance_plan = get_assembler_plan("stock_balance", order_list, stock_dict)
+    myopic_plan = get_assembler_plan("myopic_profit", order_list, stock_dict)
+    assert balance_plan[0] == "FrameFinal"
+    assert myopic_plan[0] == "MotorFinal"
+    assert balance_plan != myopic_plan
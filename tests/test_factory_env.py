@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from pycode import factory_env, utils
+from pycode.factory_env import DecisionEventWatcher, get_fac_env
+
+POISSON_ORDER_STREAM_SPEC = {
+    "arrival": {"process": "poisson", "rate": 0.5},
+    "product_mix": ["Motor", "Frame"],
+    "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+    "lead_time": {"dist": "uniform", "low": 0, "high": 40},
+}
+
+
+class FullScanDecisionEventWatcher(DecisionEventWatcher):
+    """每步重算全部设备的参照实现"""
+
+    def check_after_step(self, sim) -> bool:
+        if sim.order_mng.book_version != self.book_version:
+            return True
+        rst = False
+        for idx in range(len(sim.dev_rt_list)):
+            need_decision = self.check_if_need_decision(sim, idx)
+            if need_decision and not self.need_decision_list[idx]:
+                rst = True
+            self.need_decision_list[idx] = need_decision
+        return rst
+
+
+def run_event_mode(seed, n_step=300):
+    env = get_fac_env(decision_mode="event", artifact_mode="none", order_seed=seed)
+    env.reset(seed=seed)
+    env.action_space.seed(seed)
+    rst = []
+    for _ in range(n_step):
+        mask = env.get_my_action_mask()["action_mask"].astype(np.int8)
+        obs, reward, done, _, _ = env.step(env.action_space.sample(mask=tuple(mask)))
+        rst.append((obs["elapsed_time"].item(), obs["clock"].item(), reward))
+        if done:
+            break
+    return rst
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_event_watcher_matches_full_scan(monkeypatch, seed):
+    with monkeypatch.context() as m:
+        m.setattr(factory_env, "DecisionEventWatcher", FullScanDecisionEventWatcher)
+        expected_list = run_event_mode(seed)
+    actual_list = run_event_mode(seed)
+    assert len({elapsed for elapsed, _, _ in actual_list}) > 1
+    assert actual_list == expected_list
+
+
+def test_event_watcher_catches_arrival_and_settlement_in_same_tick():
+    """同一步有订单到达、也有订单到期结算时订单数可能不变，仍是决策点"""
+    env = get_fac_env(decision_mode="event", artifact_mode="none", order_seed=0,
+                      order_stream_spec=POISSON_ORDER_STREAM_SPEC)
+    env.reset(seed=0)
+    env.step(np.zeros(env.dev_num, dtype=np.int64))
+    order_mng = env.sim.order_mng
+    result_table = env.sim.price_mng.order_sell_result_mng.result_table
+    same_count_tick_num = 0
+    while env.sim.clock < env.simulation_steps:
+        watcher = DecisionEventWatcher(env.sim, env.scheduler.schedule_plan)
+        order_num, cursor, settled_num = len(order_mng), order_mng.arrival_engine.cursor, len(result_table)
+        env.sim.high_level_step(env.scheduler)
+        arrived = order_mng.arrival_engine.cursor != cursor
+        settled = len(result_table) != settled_num
+        if arrived or settled:
+            assert watcher.check_after_step(env.sim)
+        if arrived and settled and len(order_mng) == order_num:
+            same_count_tick_num += 1
+    assert same_count_tick_num > 0
+
+
+def test_static_objs_are_shared_and_cache_is_bounded():
+    env_a = get_fac_env(artifact_mode="none")
+    env_b = get_fac_env(artifact_mode="none")
+    assert env_a.device_id_and_obj_dict is env_b.device_id_and_obj_dict
+    assert env_a.recipe_name_and_obj_dict is env_b.recipe_name_and_obj_dict
+
+    build = utils.build_shared_device_and_recipe_obj_dicts
+    device_dict = {"D-1": {"id": "D-1", "category": "Assembler", "in_ch": 1, "out_ch": 1,
+                           "upstream": [], "downstream": []}}
+    for i in range(3 * build.cache_info().maxsize):
+        device_dict["D-1"]["out_ch"] = i + 1
+        dev_dict, rcp_dict = utils.get_shared_device_and_recipe_obj_dicts(device_dict, {})
+        assert dev_dict["D-1"].out_ch == i + 1 and rcp_dict == {}
+    assert build.cache_info().currsize <= build.cache_info().maxsize
+
+
+def test_step_without_history_matches_recorded_run():
+    rst_list = []
+    for record_history in [None, True]:
+        env = get_fac_env(decision_interval=5, artifact_mode="none", order_seed=3, record_history=record_history)
+        env.reset(seed=3)
+        env.action_space.seed(3)
+        rst = []
+        for _ in range(60):
+            mask = env.get_my_action_mask()["action_mask"].astype(np.int8)
+            obs, reward, done, _, _ = env.step(env.action_space.sample(mask=tuple(mask)))
+            rst.append((obs.tolist() if isinstance(obs, np.ndarray) else {k: v.tolist() for k, v in obs.items()},
+                        reward))
+        rst_list.append((rst, env.sim.history_recorder.step_counter))
+    (no_history, no_history_steps), (with_history, with_history_steps) = rst_list
+    assert no_history == with_history
+    assert no_history_steps == 0 and with_history_steps == 300
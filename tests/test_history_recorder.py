@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+from pycode.factory_env import FactoryEnv
+from pycode.history_recorder import (
+    AGG_LAST, AGG_MAX, AGG_MEAN, AGG_MIN, HELD_IDLE_VALUE_SET, MultiResHistoryRecorder, load_run_log,
+)
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+SMALL_CONFIG = {"levels": [10, 60, 600], "recent_window": 1000, "level_capacity": 20, "level_factor": 10}
+
+
+def drive_synthetic(hr, n_steps, seed=0) -> dict:
+    """按模拟器的写法逐步写入一个数值标量、一个数值向量和一个保持型向量，返回逐步全量的参照序列"""
+    rng = np.random.default_rng(seed)
+    full = {"scalar/time": [], "scalar/x": [], "vector/stock/A": [], "vector/dev_state/D1": []}
+    state = "IDLE"
+    for t in range(n_steps):
+        x = float(rng.normal())
+        stock = int(rng.integers(0, 100))
+        if rng.random() < 0.05:
+            state = "RUNNING" if state == "IDLE" else "IDLE"
+        hr.log_scalar("time", t)
+        hr.log_scalar("x", x)
+        hr.log_vector("stock", "A", stock)
+        hr.log_vector_change("dev_state", "D1", state)
+        hr.next_step()
+        full["scalar/time"].append(t)
+        full["scalar/x"].append(x)
+        full["vector/stock/A"].append(stock)
+        full["vector/dev_state/D1"].append(state)
+    return full
+
+
+def get_full_series_dict(hr) -> dict:
+    """逐步全量的 HistoryRecorder 转成和多分辨率聚合同名的序列"""
+    hr.materialize_repeats()
+    rst = {f"scalar/{name}": lst for name, lst in hr.scalar_logs.items()}
+    for group, key_and_list_dict in hr.vector_logs.items():
+        for key, lst in key_and_list_dict.items():
+            rst[f"vector/{group}/{key}"] = lst
+    return rst
+
+
+def get_expected_buckets(values, bucket_steps, start_bucket) -> np.ndarray:
+    """numpy 直接对逐步序列分桶，最后一个桶可以不满"""
+    if values and isinstance(values[0], str | None):
+        values = [v not in HELD_IDLE_VALUE_SET for v in values]
+    arr = np.asarray(values, dtype=np.float64)
+    n_bucket = -(-len(arr) // bucket_steps)
+    rst = np.empty((n_bucket - start_bucket, 4))
+    for k in range(start_bucket, n_bucket):
+        seg = arr[k * bucket_steps:(k + 1) * bucket_steps]
+        rst[k - start_bucket] = seg.min(), seg.max(), seg.mean(), seg[-1]
+    return rst
+
+
+def assert_level_views_match(hr: MultiResHistoryRecorder, full_series_dict):
+    for i, bucket_steps in enumerate(hr.level_steps):
+        view = hr.get_level_view(i)
+        if hr.series_name_list is None:
+            # 还没凑满过一个最细的桶，序列名未定，聚合视图为空，画图直接用原始值
+            assert view == {} and hr.pick_level(max_points=100) is None
+            continue
+        assert list(view) == hr.series_name_list
+        for name, arr in view.items():
+            expected = get_expected_buckets(full_series_dict[name], bucket_steps, hr.level_start[i])
+            assert arr.shape == expected.shape, (i, name)
+            for agg in (AGG_MIN, AGG_MAX, AGG_LAST):
+                np.testing.assert_array_equal(arr[:, agg], expected[:, agg], err_msg=f"{i} {name}")
+            np.testing.assert_allclose(arr[:, AGG_MEAN], expected[:, AGG_MEAN], rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("n_steps", [
+    9, 10, 199, 200, 201,  # 凑满第一批 roll_every 前后
+    1250, 1251, 1450,  # 原始值超过 recent_window * 5 / 4 前后
+    12_000, 12_001, 12_599, 12_600, 40_000,  # 最粗一级超过 level_capacity、加出更粗一级前后
+])
+def test_level_views_match_numpy(n_steps):
+    hr = MultiResHistoryRecorder(**SMALL_CONFIG)
+    full = drive_synthetic(hr, n_steps)
+    assert_level_views_match(hr, full)
+    raw_len = hr.get_raw_len()
+    assert hr.get_scalar("x") == full["scalar/x"][n_steps - raw_len:]
+    assert hr.get_vector("dev_state", "D1") == full["vector/dev_state/D1"][n_steps - raw_len:]
+
+
+def test_roll_up_trim_and_coarser_level_boundaries():
+    hr = MultiResHistoryRecorder(**SMALL_CONFIG)
+    rw, cap = SMALL_CONFIG["recent_window"], SMALL_CONFIG["level_capacity"]
+    level_num_list = []
+    full = drive_synthetic(hr, 0)
+    for t in range(1, 40_001):
+        full_step = drive_synthetic(hr, 1, seed=t)
+        for name in full:
+            full[name].extend(full_step[name])
+        # 攒够 roll_every 步就聚合，聚合过的都是整桶
+        assert 0 <= t - hr.rolled_steps < hr.roll_every
+        assert hr.rolled_steps % hr.level_steps[0] == 0
+        # 原始值最多超出 recent_window 1/4 再加一批未聚合的步
+        assert hr.get_raw_len() <= rw * 5 // 4 + hr.roll_every
+        assert hr.trimmed_steps <= hr.rolled_steps
+        # 最粗一级从 0 步起完整，且不超过容量
+        assert hr.level_start[-1] == 0
+        assert len(hr.level_rows[-1]) <= cap
+        for i, rows in enumerate(hr.level_rows[:-1]):
+            assert len(rows) <= cap + cap // 4
+            assert hr.level_start[i] + len(rows) == hr.level_total[i]
+        level_num_list.append(len(hr.level_steps))
+        if t == 11_999:
+            # 第 2 级还是最粗一级、从 0 步起完整，第 0、1 级的前面已经丢了
+            assert hr.level_start[:2] != [0, 0] and hr.level_start[2] == 0
+            assert hr.pick_level(max_points=100) == 2
+    # 第 3 级 600 步一桶，20 桶后（12000 步）加一级，再 200 桶后（120000 步）才会再加
+    assert level_num_list[11_999] == 3 and level_num_list[-1] == 4
+    assert hr.level_steps == [10, 60, 600, 6000]
+    assert hr.trimmed_steps > 0
+    # 加了第 3 级后第 2 级也开始丢桶，只剩第 3 级完整
+    assert hr.level_start[2] > 0
+    assert hr.pick_level(max_points=100) == 3
+    assert_level_views_match(hr, full)
+
+
+def test_run_log_round_trip(tmp_path):
+    hr = MultiResHistoryRecorder(**SMALL_CONFIG)
+    drive_synthetic(hr, 15_123)
+    hr.save_run_log(tmp_path, {"run_id": "x"})
+    loaded, meta = load_run_log(tmp_path)
+    assert isinstance(loaded, MultiResHistoryRecorder)
+    assert meta["run_id"] == "x"
+    assert loaded.step_counter == hr.step_counter
+    assert loaded.get_scalar("x") == hr.get_scalar("x")
+    assert loaded.get_vector("dev_state", "D1") == hr.get_vector("dev_state", "D1")
+    assert loaded.level_steps == hr.level_steps
+    assert loaded.pick_level(max_points=50) == hr.pick_level(max_points=50)
+    for i in range(len(hr.level_steps)):
+        expected, actual = hr.get_level_view(i), loaded.get_level_view(i)
+        assert list(actual) == list(expected)
+        for name in expected:
+            np.testing.assert_array_equal(actual[name], expected[name])
+
+
+def get_env(steps, fast_forward, history_config):
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps, "fast_forward": fast_forward}
+    return FactoryEnv(**build_env_kwargs(params), artifact_mode="none", record_history=True,
+                      history_config=history_config)
+
+
+@pytest.mark.parametrize("fast_forward", [False, True])
+def test_env_level_views_match_full_run(fast_forward):
+    steps = 15_000
+    full_env = get_env(steps, fast_forward, None)
+    full_env.run_greedy(steps)
+    env = get_env(steps, fast_forward, SMALL_CONFIG)
+    env.run_greedy(steps)
+    if fast_forward:
+        assert env.sim.steady_state_detector.jump_cnt > 0
+    hr = env.sim.history_recorder
+    assert hr.trimmed_steps > 0
+    assert_level_views_match(hr, get_full_series_dict(full_env.sim.history_recorder))
+
+
+def test_env_level_views_survive_checkpoint(tmp_path):
+    steps = 15_000
+    uninterrupted = get_env(steps, True, SMALL_CONFIG)
+    uninterrupted.run_greedy(steps)
+    env = get_env(steps, True, SMALL_CONFIG)
+    env.run_greedy(7001)
+    env.save_checkpoint(tmp_path / "ck.npz", include_history=True)
+    resumed = get_env(steps, True, SMALL_CONFIG)
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    resumed.run_greedy(steps - resumed.sim.clock)
+    expected_hr, actual_hr = uninterrupted.sim.history_recorder, resumed.sim.history_recorder
+    assert actual_hr.level_steps == expected_hr.level_steps
+    for i in range(len(expected_hr.level_steps)):
+        expected, actual = expected_hr.get_level_view(i), actual_hr.get_level_view(i)
+        for name in expected:
+            np.testing.assert_allclose(actual[name], expected[name], rtol=1e-12, atol=1e-9)
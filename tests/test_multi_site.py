@@ -0,0 +1,8 @@
+from pycode.multi_site import build_ring_spec, run_multi_site
+
+
+def test_proc_matches_inproc():
+    inproc_rst_list, _ = run_multi_site(build_ring_spec(2), simulation_steps=600, window=30, mode="inproc")
+    proc_rst_list, _ = run_multi_site(build_ring_spec(2), simulation_steps=600, window=30, mode="proc")
+    assert [(r["final_balance"], r["shipped"], r["received"]) for r in proc_rst_list] == \
+        [(r["final_balance"], r["shipped"], r["received"]) for r in inproc_rst_list]
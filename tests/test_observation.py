@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from pycode.dev_runtime import DevState
+from pycode.factory_env import ORDER_NAME_AND_IDX_DICT, FactoryEnv, get_fac_env
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+
+def get_full_rebuild_obs(env) -> dict:
+    """按 get_obs_0() 的全量状态重新拼出 get_observation_1() 的数组，不经过任何缓存"""
+    k = env.visible_order_num
+    status = env.get_obs_0()
+    n = len(status["order_name"])
+    order_name = np.full(k, ORDER_NAME_AND_IDX_DICT[None], dtype=np.int64)
+    order_name[:n] = [ORDER_NAME_AND_IDX_DICT[name] for name in status["order_name"]]
+    order_quantity = np.zeros(k, dtype=np.float32)
+    order_quantity[:n] = status["order_quantity"]
+    order_due_time = np.full(k, -1, dtype=np.float32)
+    order_due_time[:n] = status["order_due_time"]
+    recipe_name_and_idx_dict = env.sim.recipe_name_and_idx_dict
+    return {
+        "order_name": order_name,
+        "order_quantity": order_quantity,
+        "order_due_time": order_due_time,
+        "price_sell": np.array(status["price_sell"], dtype=np.float32),
+        "price_storage_cost_per_time_unit": np.array(status["price_storage_cost_per_time_unit"], dtype=np.float32),
+        "stock_quantity": np.array(status["stock_quantity"], dtype=np.float32),
+        "total_energy": np.array([status["total_energy"]], dtype=np.float32),
+        "step_energy": np.array([status["step_energy"]], dtype=np.float32),
+        "total_balance": np.array([status["total_balance"]], dtype=np.float32),
+        "step_balance": np.array([status["step_balance"]], dtype=np.float32),
+        "clock": np.array([status["clock"]], dtype=np.int32),
+        "dev_state": np.array([state is not DevState.IDLE for state in status["dev_state"]], dtype=np.int32),
+        "dev_bind_recipe": np.array([recipe_name_and_idx_dict[name] for name in status["dev_bind_recipe"]],
+                                    dtype=np.int32),
+    }
+
+
+def assert_obs_equal(obs, env):
+    expected = get_full_rebuild_obs(env)
+    for name, arr in expected.items():
+        assert obs[name].dtype == arr.dtype, name
+        np.testing.assert_array_equal(obs[name], arr, err_msg=name)
+
+
+def run_random_actions(env, steps, seed):
+    rng = np.random.default_rng(seed)
+    obs, _ = env.reset(seed=seed)
+    assert_obs_equal(obs, env)
+    for _ in range(steps):
+        mask = env.get_my_action_mask()["action_mask"]
+        action = np.array([rng.choice(np.flatnonzero(row)) for row in mask])
+        obs, _, done, _, _ = env.step(action)
+        assert_obs_equal(obs, env)
+        if done:
+            obs, _ = env.reset()
+            assert_obs_equal(obs, env)
+    return env
+
+
+@pytest.mark.parametrize("env_kwargs", [
+    {},
+    {"decision_interval": 3},
+    {"decision_mode": "event", "visible_order_sort": "highest_value", "demand_bucket_horizons": [10, 60, 300]},
+    {"order_stream_spec": {
+        "arrival": {"process": "poisson", "rate": 0.2},
+        "product_mix": ["Motor", "Frame"],
+        "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+        "lead_time": {"dist": "uniform", "low": 50, "high": 400},
+    }, "visible_order_num": 5},
+])
+def test_incremental_obs_matches_full_rebuild(env_kwargs):
+    run_random_actions(get_fac_env(artifact_mode="none", order_seed=5, **env_kwargs), steps=400, seed=0)
+
+
+def test_incremental_obs_after_checkpoint_restore(tmp_path):
+    env = run_random_actions(get_fac_env(artifact_mode="none", order_seed=5), steps=150, seed=1)
+    env.save_checkpoint(tmp_path / "ck.npz")
+    resumed = get_fac_env(artifact_mode="none", order_seed=5)
+    resumed.load_checkpoint(tmp_path / "ck.npz")
+    assert_obs_equal(resumed.get_observation_1(), resumed)
+
+
+def test_incremental_obs_after_fast_forward():
+    params = {**DEFAULT_PARAMS, "fast_forward": True, "simulation_steps": 20_000, "random_order_num": 5}
+    env = FactoryEnv(**build_env_kwargs(params), artifact_mode="none")
+    for _ in range(10):
+        env.run_greedy(2000)
+        assert_obs_equal(env.get_observation_1(), env)
+    assert env.sim.steady_state_detector.jump_cnt > 0
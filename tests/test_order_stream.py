@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from pycode.factory_env import FactoryEnv
+from pycode.order_stream import OrderArrivalEngine, generate_order_stream
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+POISSON_SPEC = {
+    "arrival": {"process": "poisson", "rate": 5},
+    "product_mix": ["Motor", "Frame"],
+    "quantity": {"dist": "poisson", "mean": 4},
+    "lead_time": {"dist": "exponential", "mean": 200},
+}
+WEIGHTED_SPEC = {
+    "arrival": {"process": "poisson", "rate": 2},
+    "product_mix": {"Motor": 0.8, "Frame": 0.2},
+    "quantity": {"dist": "uniform_int", "low": 1, "high": 10},
+    "lead_time": {"dist": "uniform", "low": 50, "high": 400},
+}
+
+
+class SmallChunkArrivalEngine(OrderArrivalEngine):
+    CHUNK_SIZE = 7
+
+
+def get_brute_force_rows(stream, t_from, t_to) -> list:
+    """到达时刻在 (t_from, t_to] 内的订单，按流里的顺序"""
+    mask = (stream.arrival_time > t_from) & (stream.arrival_time <= t_to)
+    return list(zip(stream.product_idx[mask].tolist(), stream.quantity[mask].tolist(),
+                    stream.due_time[mask].tolist()))
+
+
+def get_brute_force_next_arrival_time(stream, t):
+    later = stream.arrival_time[stream.arrival_time > t]
+    return int(later[0]) if len(later) else None
+
+
+@pytest.mark.parametrize("engine_cls", [OrderArrivalEngine, SmallChunkArrivalEngine])
+@pytest.mark.parametrize("spec", [POISSON_SPEC, WEIGHTED_SPEC])
+def test_release_until_matches_brute_force(engine_cls, spec):
+    horizon = 2000
+    stream = generate_order_stream(spec, horizon=horizon, seed=3)
+    engine = engine_cls(stream)
+    if engine_cls is OrderArrivalEngine and spec is POISSON_SPEC:
+        assert len(stream) > 2 * OrderArrivalEngine.CHUNK_SIZE
+    rng = np.random.default_rng(0)
+    t_prev, t = -1, 0
+    while t_prev < horizon:
+        assert engine.release_until(t) == get_brute_force_rows(stream, t_prev, t)
+        assert engine.get_next_arrival_time() == get_brute_force_next_arrival_time(stream, t)
+        assert len(engine) == int((stream.arrival_time > t).sum())
+        # 多数逐步推进，偶尔一次跳过整段（快进），跨过分段边界
+        t_prev, t = t, t + (1 if rng.random() < 0.9 else int(rng.integers(2, 1000)))
+    assert engine.release_until(horizon + 1) == []
+    assert engine.get_next_arrival_time() is None
+
+
+def test_seek_resumes_mid_chunk():
+    stream = generate_order_stream(POISSON_SPEC, horizon=2000, seed=4)
+    engine = OrderArrivalEngine(stream)
+    engine.release_until(900)
+    resumed = OrderArrivalEngine(stream)
+    resumed.seek(engine.cursor)
+    assert resumed.get_next_arrival_time() == engine.get_next_arrival_time()
+    assert resumed.release_until(1500) == engine.release_until(1500)
+
+
+@pytest.mark.parametrize("spec", [POISSON_SPEC, WEIGHTED_SPEC])
+def test_generated_stream_is_sorted_and_in_range(spec):
+    horizon = 5000
+    stream = generate_order_stream(spec, horizon=horizon, seed=5)
+    assert np.all(np.diff(stream.arrival_time) >= 0)
+    assert stream.arrival_time.min() >= 0 and stream.arrival_time.max() < horizon
+    assert np.all(stream.due_time >= stream.arrival_time)
+    assert stream.quantity.min() >= 1
+    rate = spec["arrival"]["rate"]
+    assert len(stream) == pytest.approx(rate * horizon, rel=0.05)
+    same = generate_order_stream(spec, horizon=horizon, seed=5)
+    for name in ("arrival_time", "product_idx", "quantity", "due_time"):
+        np.testing.assert_array_equal(getattr(stream, name), getattr(same, name))
+
+
+def test_exponential_lead_time_and_poisson_quantity_means():
+    stream = generate_order_stream(POISSON_SPEC, horizon=5000, seed=6)
+    lead_time = stream.due_time - stream.arrival_time
+    # 提前期取整丢掉小数部分，均值约少 0.5
+    assert lead_time.mean() == pytest.approx(200 - 0.5, rel=0.03)
+    # 数量至少为 1，0 被抬到 1
+    assert stream.quantity.mean() == pytest.approx(4 + np.exp(-4), rel=0.03)
+
+
+def test_weighted_product_mix():
+    stream = generate_order_stream(WEIGHTED_SPEC, horizon=5000, seed=7)
+    assert stream.product_names == ["Motor", "Frame"]
+    assert np.mean(stream.product_idx == 0) == pytest.approx(0.8, abs=0.02)
+
+
+def test_fast_forward_stops_before_next_arrival():
+    steps = 30_000
+    order_stream = {
+        "arrival": {"process": "poisson", "rate": 0.001},
+        "product_mix": ["Motor", "Frame"],
+        "quantity": {"dist": "uniform_int", "low": 1, "high": 3},
+        "lead_time": {"dist": "uniform", "low": 2000, "high": 4000},
+    }
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps, "random_order_num": 0, "order_stream": order_stream}
+
+    def run(fast_forward):
+        env = FactoryEnv(**build_env_kwargs({**params, "fast_forward": fast_forward}), artifact_mode="none")
+        jump_list = []
+        if fast_forward:
+            detector = env.sim.steady_state_detector
+            try_fast_forward = detector.try_fast_forward
+
+            def record_jump(sim, max_steps):
+                elapsed = sim.order_mng.elapsed
+                next_arrival_time = sim.order_mng.arrival_engine.get_next_arrival_time()
+                jumped = try_fast_forward(sim, max_steps)
+                if jumped:
+                    jump_list.append((elapsed, jumped, next_arrival_time))
+                return jumped
+
+            detector.try_fast_forward = record_jump
+        env.run_greedy(steps)
+        return env.sim, jump_list
+
+    full, _ = run(False)
+    ff, jump_list = run(True)
+    arrival_time = ff.order_mng.arrival_engine.stream.arrival_time
+    assert len(arrival_time) > 5
+    assert jump_list
+    for elapsed, jumped, next_arrival_time in jump_list:
+        if next_arrival_time is not None:
+            assert elapsed + jumped < next_arrival_time
+    # 有的跳跃被下一个到达截断，停在到达前不到一个基本周期处
+    base_period = ff.steady_state_detector.base_period
+    assert any(
+        next_arrival_time is not None and next_arrival_time - (elapsed + jumped) < base_period
+        for elapsed, jumped, next_arrival_time in jump_list
+    )
+    full_table = full.price_mng.order_sell_result_mng.result_table
+    ff_table = ff.price_mng.order_sell_result_mng.result_table
+    for name in ("product_idx", "due_time", "sold_quantity", "sold_money"):
+        np.testing.assert_array_equal(ff_table.get_column(name), full_table.get_column(name))
+    assert ff.total_balance == full.total_balance
@@ -0,0 +1,65 @@
+import numpy as np
+
+from pycode.factory_env import FactoryEnv
+from pycode.policy_eval import build_episode_list, eval_heuristic, eval_ppo, get_ppo_env_kwargs
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+
+class StubModel:
+    """总选动作 0（保持原配方，永远合法），记下每次推理的批大小"""
+
+    def __init__(self, env):
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.batch_size_list = []
+
+    def predict(self, obs, action_masks, deterministic):
+        n = len(action_masks)
+        assert len(next(iter(obs.values()))) == n
+        self.batch_size_list.append(n)
+        return np.zeros((n, len(self.action_space.nvec)), dtype=np.int64), None
+
+
+def get_stub_model(params) -> StubModel:
+    params = {**params, "scheduler": "manual", "fast_forward": False}
+    return StubModel(FactoryEnv(**build_env_kwargs(params), artifact_mode="none"))
+
+
+def test_build_episode_list():
+    spec = {"grid": {"simulation_steps": [100, 200], "scheduler": ["greedy", "edd"]},
+            "jobs": [{"random_order_num": 3}]}
+    episode_list = build_episode_list(spec, [0, 5])
+    assert len(episode_list) == 10
+    assert [(p["simulation_steps"], p["scheduler"], p["order_seed"]) for p in episode_list[:4]] == [
+        (100, "greedy", 0), (100, "greedy", 5), (100, "edd", 0), (100, "edd", 5),
+    ]
+    assert episode_list[-1] == {**DEFAULT_PARAMS, "random_order_num": 3, "order_seed": 5}
+    assert build_episode_list(None, [1, 2]) == [{**DEFAULT_PARAMS, "order_seed": 1}, {**DEFAULT_PARAMS, "order_seed": 2}]
+
+
+def test_eval_ppo_refills_slots():
+    episode_list = build_episode_list({"jobs": [
+        {"simulation_steps": n, "random_order_num": 5} for n in (20, 50, 30, 10, 40)
+    ]}, [0])
+    model = get_stub_model(episode_list[0])
+    rst_list = eval_ppo(model, episode_list, batch_size=2)
+
+    # 两个槽位一直满着，直到待跑队列空了才开始变少
+    assert max(model.batch_size_list) == 2
+    assert model.batch_size_list[:50] == [2] * 50
+    assert sum(model.batch_size_list) == sum(p["simulation_steps"] for p in episode_list)
+    # 结果与单独跑每个 episode 一致，顺序同 episode_list
+    for params, rst in zip(episode_list, rst_list):
+        env = FactoryEnv(**get_ppo_env_kwargs(model, params, {}))
+        env.reset()
+        done = False
+        while not done:
+            _, _, done, _, _ = env.step(np.zeros(env.dev_num, dtype=np.int64))
+        assert rst == env.sim.get_result()
+
+
+def test_fast_forward_scenario_only_applies_to_greedy():
+    episode_list = build_episode_list({"jobs": [{"simulation_steps": 300, "fast_forward": True}]}, [0])
+    greedy_rst, edd_rst = eval_heuristic("greedy", episode_list), eval_heuristic("edd", episode_list)
+    assert len(greedy_rst) == len(edd_rst) == 1
+    assert len(eval_ppo(get_stub_model(episode_list[0]), episode_list)) == 1
@@ -0,0 +1,25 @@
+import pytest
+
+from pycode.rollout_cluster import AUTHKEY_ENV_NAME, RolloutCoordinator, get_authkey, run_worker
+
+
+def test_no_authkey_refuses_non_loopback(monkeypatch):
+    monkeypatch.delenv(AUTHKEY_ENV_NAME, raising=False)
+    with pytest.raises(ValueError):
+        RolloutCoordinator(n_workers=1, address=("0.0.0.0", 0))
+    with pytest.raises(ValueError):
+        run_worker(("localhost", 6000), n_envs=1)
+
+
+def test_loopback_coordinator_uses_random_authkey(monkeypatch):
+    monkeypatch.delenv(AUTHKEY_ENV_NAME, raising=False)
+    coordinator_list = [RolloutCoordinator(n_workers=1) for _ in range(2)]
+    assert coordinator_list[0].authkey != coordinator_list[1].authkey
+    for coordinator in coordinator_list:
+        coordinator.listener.close()
+
+
+def test_authkey_from_env(monkeypatch):
+    monkeypatch.setenv(AUTHKEY_ENV_NAME, "secret")
+    assert get_authkey(None, ("0.0.0.0", 6000)) == b"secret"
+    assert get_authkey("other", ("0.0.0.0", 6000)) == b"other"
@@ -0,0 +1,27 @@
+import pytest
+
+from pycode.factory_env import FactoryEnv
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+
+
+def run_greedy(steps, random_order_num, fast_forward):
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps, "random_order_num": random_order_num,
+              "fast_forward": fast_forward}
+    env = FactoryEnv(**build_env_kwargs(params), artifact_mode="none", record_history=True)
+    env.run_greedy(steps)
+    return env.sim
+
+
+@pytest.mark.parametrize("random_order_num", [5, 50])
+def test_fast_forward_matches_full_run(random_order_num):
+    full = run_greedy(20_000, random_order_num, fast_forward=False)
+    ff = run_greedy(20_000, random_order_num, fast_forward=True)
+    assert ff.steady_state_detector.jump_cnt > 0
+    assert ff.clock == full.clock
+    assert ff.total_balance == full.total_balance
+    # 能耗按周期总量乘周期数累加，只差浮点舍入
+    assert ff.total_energy_kwh_used == pytest.approx(full.total_energy_kwh_used)
+    assert ({name: o.quantity for name, o in ff.stock_mng.get_items()}
+            == {name: o.quantity for name, o in full.stock_mng.get_items()})
+    for name in full.history_recorder.scalar_logs:
+        assert ff.history_recorder.get_scalar(name) == pytest.approx(full.history_recorder.get_scalar(name))
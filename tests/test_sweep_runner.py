@@ -0,0 +1,15 @@
+from pycode.sweep_runner import DEFAULT_PARAMS, iter_job_results
+
+
+def test_hung_job_is_killed_at_timeout():
+    """10^8 步的 job 跑不完，到时间由父进程 kill 并记 timeout，不影响同批的其他 job"""
+    params_list = [
+        {**DEFAULT_PARAMS, "simulation_steps": 2000},
+        {**DEFAULT_PARAMS, "simulation_steps": 10 ** 8},
+    ]
+    timeout = 3
+    row_dict = {row["params"]: row for row in iter_job_results(params_list, max_workers=2, timeout=timeout)}
+    ok_row, timeout_row = sorted(row_dict.values(), key=lambda row: row["status"])
+    assert ok_row["status"] == "ok" and ok_row["final_balance"] is not None
+    assert timeout_row["status"] == "timeout"
+    assert timeout_row["wall_time"] < timeout + 2
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from pycode import telemetry
+from pycode.telemetry import TelemetryReader, TelemetryWriter, update_readers
+
+
+def test_update_readers_opens_only_new_writers(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "registry_folder", tmp_path)
+    writer = TelemetryWriter(product_names=["Motor"])
+    # 还没写完的登记文件跳过，不让读者 CLI 崩掉
+    (tmp_path / "partial.json").write_text("{", encoding="utf-8")
+
+    readers = update_readers({})
+    assert list(readers) == [writer.registry_path]
+    reader = readers[writer.registry_path]
+    assert update_readers(readers)[writer.registry_path] is reader
+
+    writer.close()
+    assert update_readers(readers) == {}
+
+
+def get_fake_sim(clock):
+    stock_obj = SimpleNamespace(quantity=clock)
+    return SimpleNamespace(
+        clock=clock, dt=1, total_balance=float(clock), step_balance=0.0, total_energy_kwh_used=0.0,
+        get_utilization=lambda: 0.0, stock_mng=SimpleNamespace(get_obj_by_name=lambda name: stock_obj),
+    )
+
+
+class WriteDuringCopyData:
+    """第一次取行时让写者再写 n 条，模拟读者拷贝期间写者追上来覆盖旧行"""
+
+    def __init__(self, data, publish_fn, n):
+        self.data, self.publish_fn, self.n = data, publish_fn, n
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        for _ in range(self.n):
+            self.publish_fn()
+        self.n = 0
+        return self.data[i]
+
+
+def test_read_since_drops_rows_overwritten_during_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(telemetry, "registry_folder", tmp_path)
+    writer = TelemetryWriter(product_names=["Motor"], sample_every=1, capacity=4)
+    clock = 0
+
+    def publish():
+        nonlocal clock
+        writer.maybe_publish(get_fake_sim(clock))
+        clock += 1
+
+    for _ in range(10):
+        publish()
+    reader = TelemetryReader(writer.registry_path)
+    try:
+        # 落后一整圈：第 6 条所在的行是写者下一条要写的，只读 7、8、9
+        seq, rows = reader.read_since(0)
+        assert seq == 10 and [row[0] for row in rows] == [7, 8, 9]
+
+        # 读第 10~12 条，拷贝期间写者又写了第 13、14 条，盖掉第 9、10 条的行，第 11 条的行是它下一条要写的，只留第 12 条
+        for _ in range(3):
+            publish()
+        reader.data = WriteDuringCopyData(reader.data, publish, 2)
+        seq, rows = reader.read_since(0)
+        assert seq == 13 and [row[0] for row in rows] == [12]
+        seq, rows = reader.read_since(seq)
+        assert seq == 15 and [row[0] for row in rows] == [13, 14]
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from pycode.factory_env import FactoryEnv
+from pycode.sweep_runner import DEFAULT_PARAMS, build_env_kwargs
+from pycode.trajectory_store import (
+    TrajectoryReader, TrajectoryWriter, get_writer_for_env, record_heuristic,
+)
+
+OBS_DIM, ACTION_DIM, MASK_DIM = 5, 3, 11
+
+
+def get_rows(n, start=0) -> dict:
+    """第 i 行的各字段都由 start + i 决定，读回来能认出是哪一行"""
+    i = np.arange(start, start + n)
+    return {
+        "obs": (np.repeat(i[:, None], OBS_DIM, axis=1) + np.arange(OBS_DIM) / 10).astype(np.float32),
+        "action": np.repeat(i[:, None] % 7, ACTION_DIM, axis=1),
+        "mask": (i[:, None] + np.arange(MASK_DIM)) % 3 == 0,
+        "reward": (i * 0.5).astype(np.float32),
+        "done": i % 10 == 9,
+        "truncated": i % 17 == 16,
+    }
+
+
+def assert_rows_equal(batch, rows, idx):
+    for name in ("obs", "action", "mask", "reward", "done", "truncated"):
+        np.testing.assert_array_equal(batch[name], rows[name][idx], err_msg=name)
+
+
+def test_round_trip_across_chunk_rollover(tmp_path):
+    writer = TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, chunk_size=8)
+    rows = get_rows(30)
+    # 批的边界与块的边界错开：5 + 13 + 12，第二批跨两个块
+    for lo, hi in ((0, 5), (5, 18), (18, 30)):
+        writer.append_batch(*(rows[name][lo:hi] for name in ("obs", "action", "mask", "reward", "done", "truncated")))
+    writer.close()
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == [f"chunk_{i:05d}" for i in range(4)]
+
+    reader = TrajectoryReader(tmp_path)
+    assert len(reader) == 30
+    idx = np.array([29, 0, 7, 8, 15, 16, 3, 24])
+    assert_rows_equal(reader.get_batch(idx), rows, idx)
+    seen = np.concatenate([batch["reward"] for batch in reader.iter_minibatches(4, np.random.default_rng(0))])
+    np.testing.assert_array_equal(np.sort(seen), rows["reward"])
+
+
+def test_unflushed_rows_are_invisible(tmp_path):
+    writer = TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, chunk_size=8)
+    rows = get_rows(12)
+    writer.append_batch(rows["obs"][:6], rows["action"][:6], rows["mask"][:6], rows["reward"][:6], rows["done"][:6])
+    writer.flush()
+    writer.append_batch(rows["obs"][6:], rows["action"][6:], rows["mask"][6:], rows["reward"][6:], rows["done"][6:])
+    assert len(TrajectoryReader(tmp_path)) == 6
+    writer.flush()
+    assert len(TrajectoryReader(tmp_path)) == 12
+
+
+def test_append_to_existing_store(tmp_path):
+    rows = get_rows(20)
+    writer = TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, chunk_size=8)
+    writer.append_batch(*(rows[name][:11] for name in ("obs", "action", "mask", "reward", "done", "truncated")))
+    writer.close()
+
+    # 接着写时沿用已有的 chunk_size，从第二块的中间续上
+    writer = TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, chunk_size=1000)
+    assert len(writer) == 11 and writer.meta["chunk_size"] == 8
+    writer.append_batch(*(rows[name][11:] for name in ("obs", "action", "mask", "reward", "done", "truncated")))
+    writer.close()
+    idx = np.arange(20)
+    assert_rows_equal(TrajectoryReader(tmp_path).get_batch(idx), rows, idx)
+
+    with pytest.raises(AssertionError, match="不一致"):
+        TrajectoryWriter(tmp_path, OBS_DIM + 1, ACTION_DIM, MASK_DIM)
+    with pytest.raises(AssertionError, match="不一致"):
+        TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, obs_dtype="float16")
+
+
+def test_next_obs_at_done_truncated_and_last_row(tmp_path):
+    rows = get_rows(20)
+    writer = TrajectoryWriter(tmp_path, OBS_DIM, ACTION_DIM, MASK_DIM, chunk_size=8)
+    writer.append_batch(*(rows[name] for name in ("obs", "action", "mask", "reward", "done", "truncated")))
+    writer.close()
+    reader = TrajectoryReader(tmp_path)
+    idx = np.array([0, 7, 9, 16, 18, 19])  # 普通行、跨块、done、truncated、普通行、最后一行
+    batch = reader.get_batch(idx)
+    np.testing.assert_array_equal(batch["has_next"], [True, True, False, False, True, False])
+    np.testing.assert_array_equal(batch["next_obs"][[0, 1, 4]], rows["obs"][[1, 8, 19]])
+    assert not batch["next_obs"][[2, 3, 5]].any()
+
+
+@pytest.mark.parametrize("scheduler", ["greedy", "stock_balance"])
+def test_recorded_heuristic_replays_through_manual_env(tmp_path, scheduler):
+    steps = 400
+    params = {**DEFAULT_PARAMS, "simulation_steps": steps, "order_seed": 3}
+    env = FactoryEnv(**build_env_kwargs({**params, "scheduler": scheduler}), artifact_mode="none")
+    writer = get_writer_for_env(tmp_path, env, chunk_size=128)
+    record_heuristic(env, writer, steps, write_every=100)
+    writer.close()
+
+    reader = TrajectoryReader(tmp_path)
+    assert len(reader) == steps
+    batch = reader.get_batch(np.arange(steps))
+    assert batch["done"][-1] and not batch["truncated"].any()
+
+    replay_env = FactoryEnv(**build_env_kwargs({**params, "scheduler": "manual"}), obs_mode="flat",
+                            artifact_mode="none")
+    obs, _ = replay_env.reset()
+    for t in range(steps):
+        np.testing.assert_array_equal(obs, batch["obs"][t])
+        np.testing.assert_array_equal(replay_env.action_masks(), batch["mask"][t])
+        obs, reward, done, _, _ = replay_env.step(batch["action"][t])
+        assert np.float32(reward) == batch["reward"][t]
+        assert done == batch["done"][t]
+        if batch["has_next"][t]:
+            np.testing.assert_array_equal(obs, batch["next_obs"][t])